@@ -0,0 +1,85 @@
+# api_client.py
+# 排盘 HTTP 接口 (api_server.py) 的客户端，Streamlit 界面通过它排盘和出图。
+# 设置了环境变量 HD_API_URL (例如 http://127.0.0.1:8000) 就走远端服务，
+# 否则直接在本进程里调用 chart_cache / render_cache (单机部署、Streamlit Cloud 不用另起服务)。
+
+import os
+import threading
+
+import requests
+
+import chart_cache
+
+# === 配置区域 ===
+API_URL = (os.environ.get("HD_API_URL") or "").rstrip("/") or None
+
+# 客户端超时 (秒)：比服务端的计算超时稍长，让服务端先返回 504
+TIMEOUT = float(os.environ.get("HD_API_CLIENT_TIMEOUT", "15"))
+
+
+class ChartAPIError(Exception):
+    """接口返回错误 (参数不合法、服务繁忙、超时) 或连不上"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class ChartClient:
+    """远端排盘服务的客户端：每个线程一个 requests.Session，复用连接"""
+
+    def __init__(self, base_url, timeout=TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _post(self, path, params=None, **kwargs):
+        try:
+            response = self._session().post(self.base_url + path, params=params,
+                                            timeout=self.timeout, **kwargs)
+        except requests.RequestException as exc:
+            raise ChartAPIError(f"连接排盘服务失败: {exc}") from exc
+        if response.status_code != 200:
+            try:
+                message = response.json().get("error", response.text)
+            except ValueError:
+                message = response.text
+            raise ChartAPIError(message, response.status_code)
+        return response
+
+    def chart(self, date_obj, time_obj, lat=None, lon=None, tz=None):
+        """与 calculation.get_chart_data 参数和返回相同"""
+        payload = {"date": date_obj.isoformat(), "time": time_obj.isoformat(), "lat": lat, "lon": lon, "tz": tz}
+        return chart_cache.restore_chart(self._post("/v1/chart", json=payload).json())
+
+    def render(self, chart_data, fmt="PNG", width=None):
+        """与 render_cache.get_chart_image_bytes 返回相同 (SVG 为 UTF-8 字节)"""
+        params = {"fmt": fmt}
+        if width:
+            params["width"] = width
+        # 闸门号作为 JSON 对象的键会变成字符串，服务端用 chart_cache.restore_chart 还原
+        return self._post("/v1/render", params=params, json=chart_data).content
+
+
+_client = ChartClient(API_URL) if API_URL else None
+
+
+def get_chart_data(date_obj, time_obj, lat=None, lon=None, tz=None):
+    """排盘：有 HD_API_URL 走远端服务，否则本进程 (带缓存)"""
+    if _client is None:
+        return chart_cache.get_chart_data(date_obj, time_obj, lat, lon, tz)
+    return _client.chart(date_obj, time_obj, lat, lon, tz)
+
+
+def get_chart_image_bytes(chart_data, fmt="PNG", width=None):
+    """出图：有 HD_API_URL 走远端服务，否则本进程 (带缓存)"""
+    if _client is None:
+        import render_cache
+        return render_cache.get_chart_image_bytes(chart_data, fmt=fmt, width=width)
+    return _client.render(chart_data, fmt, width)
@@ -0,0 +1,351 @@
+# api_server.py
+# 无界面的排盘 HTTP 接口 (ASGI / Starlette)，和 Streamlit 界面分开部署、单独压测、横向扩容。
+#   POST /v1/chart              出生信息 -> 盘面 JSON (calculation.get_chart_data，经过盘面缓存)
+#   POST /v1/render             盘面 JSON (/v1/chart 的返回) -> 图片 (drawer_pil / drawer_svg，经过图片缓存)
+#   POST /v1/chart/image        出生信息 -> 图片 (一次往返)
+#   GET  /health                健康检查 + 计数
+# 排盘和叠图都是 CPU 活 (PyEphem 计算时持有 GIL)，统一交给进程池，事件循环只做解析和转发：
+#   - 每个请求最多等 REQUEST_TIMEOUT 秒，超时返回 504 (还没开始跑的任务会被取消)
+#   - 在途任务超过 MAX_INFLIGHT 个直接返回 503 + Retry-After，不在内存里无限排队
+#   - 启动时在子进程里检查绘图素材 (images/ 下的 PNG 图层和 geometry.json)，缺了直接启动失败，不返回空白图
+#
+# 出生信息 (JSON):
+#   {"date": "1995-01-01", "time": "12:30", "lat": 39.9, "lon": 116.4, "tz": 8 或 "Asia/Shanghai" (可选)}
+#   没有坐标时可以给 "city"，按 geocoding.resolve 查 (离线优先)
+# 启动:   python api_server.py [端口] [进程数]      (监听地址用环境变量 HD_API_HOST，默认 127.0.0.1)
+
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import date, time
+from zoneinfo import ZoneInfo
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+# === 配置区域 ===
+HOST = os.environ.get("HD_API_HOST", "127.0.0.1")
+PORT = int(os.environ.get("HD_API_PORT", "8000"))
+
+# 进程池大小 (缺省 CPU 核数)
+WORKERS = int(os.environ.get("HD_API_WORKERS", "0")) or os.cpu_count() or 1
+
+# 单个请求最多等多久 (秒)
+REQUEST_TIMEOUT = float(os.environ.get("HD_API_TIMEOUT", "10"))
+
+# 在途任务上限 (排队 + 正在跑)，超过就拒绝；每个进程排几个足够把池子喂满
+MAX_INFLIGHT = int(os.environ.get("HD_API_MAX_INFLIGHT", "0")) or WORKERS * 4
+
+# 拒绝时建议客户端多久后重试 (秒)
+RETRY_AFTER = 1
+
+# 城市名联网解析最多等多久 (秒)
+GEOCODE_TIMEOUT = 5
+
+# 接受的出生日期范围 (超出的 PyEphem / datetime 换算会出错，在这里就返回 400)
+MIN_DATE = date(1800, 1, 1)
+MAX_DATE = date(2200, 12, 31)
+
+IMAGE_FORMATS = {"PNG": "image/png", "WEBP": "image/webp", "SVG": "image/svg+xml"}
+MAX_WIDTH = 4000
+
+# /v1/render 校验盘面用 (和 calculation.CENTERS / build_gate_colors 一致；主进程不导入 calculation)
+CENTER_NAMES = ("Head", "Ajna", "Throat", "G", "Heart", "Sacral", "Spleen", "Solar", "Root")
+GATE_COLOR_NAMES = ("black", "red", "mix")
+
+
+class BadRequest(Exception):
+    """请求参数不合法 (返回 400)"""
+
+
+class Overloaded(Exception):
+    """在途任务已满 (返回 503)"""
+
+
+# ================= 进程池里跑的函数 =================
+# 计算和绘图模块只在子进程里导入，主进程 (事件循环) 保持轻量
+
+def _init_worker():
+    """子进程启动时预热：导入模块、加载星历表、预加载展示尺寸的图层"""
+    import chart_cache  # noqa: F401
+    import drawer_pil
+    drawer_pil.preload_layers(drawer_pil.pick_divisor(drawer_pil.DISPLAY_WIDTH))
+
+
+def _check_assets():
+    """子进程里检查绘图素材，返回缺失的文件列表 (位图图层 + SVG 几何定义)"""
+    import drawer_pil
+    import drawer_svg
+    missing = drawer_pil.missing_assets()
+    if drawer_svg.load_geometry() is None:
+        missing.append(os.path.join(drawer_svg.IMG_DIR, drawer_svg.GEOMETRY_FILE))
+    return missing
+
+
+def _chart(birth):
+    import chart_cache
+    return chart_cache.get_chart_data(birth["date"], birth["time"], birth["lat"], birth["lon"], birth["tz"])
+
+
+def _render(chart, fmt, width):
+    import render_cache
+    return render_cache.get_chart_image_bytes(chart, fmt=fmt, width=width)
+
+
+def compute_chart_json(birth):
+    """出生信息 -> 盘面 JSON 文本 (在子进程里序列化，主进程直接转发字节)"""
+    return json.dumps(_chart(birth), ensure_ascii=False, separators=(",", ":"))
+
+
+def render_chart_json(chart_text, fmt, width):
+    """盘面 JSON 文本 -> 图片字节"""
+    import chart_cache
+    return _render(chart_cache.restore_chart(json.loads(chart_text)), fmt, width)
+
+
+def compute_chart_image(birth, fmt, width):
+    """出生信息 -> 图片字节"""
+    return _render(_chart(birth), fmt, width)
+
+
+# ================= 参数解析 =================
+
+def _number(body, key, low, high):
+    value = body.get(key)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not low <= value <= high:
+        raise BadRequest(f"{key} 必须是 {low} ~ {high} 之间的数字")
+    return float(value)
+
+
+async def parse_birth(request):
+    """请求体 -> 传给子进程的出生信息字典 (可以 pickle 的普通对象)"""
+    try:
+        body = await request.json()
+    except ValueError:
+        raise BadRequest("请求体不是合法的 JSON")
+    if not isinstance(body, dict):
+        raise BadRequest("请求体必须是 JSON 对象")
+    try:
+        birth_date = date.fromisoformat(str(body.get("date")))
+        birth_time = time.fromisoformat(str(body.get("time", "12:00")))
+    except ValueError:
+        raise BadRequest("date 格式为 YYYY-MM-DD，time 格式为 HH:MM[:SS]")
+    if not MIN_DATE <= birth_date <= MAX_DATE:
+        raise BadRequest(f"date 必须在 {MIN_DATE} ~ {MAX_DATE} 之间")
+
+    lat, lon = _number(body, "lat", -90, 90), _number(body, "lon", -180, 180)
+    if (lat is None) != (lon is None):
+        raise BadRequest("lat 和 lon 要一起给")
+    if lat is None and body.get("city"):
+        import geocoding
+        coords = await run_in_threadpool(geocoding.resolve, str(body["city"]), GEOCODE_TIMEOUT)
+        if coords is None:
+            raise BadRequest(f"找不到城市: {body['city']}")
+        lat, lon = coords
+
+    tz = body.get("tz")
+    if tz is not None:
+        if isinstance(tz, bool) or not isinstance(tz, (int, float, str)):
+            raise BadRequest("tz 是相对 UTC 的小时数或 IANA 时区名")
+        if isinstance(tz, str):
+            try:
+                ZoneInfo(tz)
+            except (ValueError, KeyError, OSError):
+                raise BadRequest(f"未知时区: {tz}")
+        else:
+            _number(body, "tz", -14, 14)
+    return {"date": birth_date, "time": birth_time, "lat": lat, "lon": lon, "tz": tz}
+
+
+def _is_gate(value):
+    return isinstance(value, int) and not isinstance(value, bool) and 1 <= value <= 64
+
+
+def parse_chart(chart_text):
+    """
+    校验 /v1/render 的盘面 JSON (restore_chart 和绘图用到的每个字段)，不合法抛 BadRequest
+    放过去的话子进程里才报 KeyError / TypeError，客户端只能看到 500
+    """
+    try:
+        chart = json.loads(chart_text)
+    except ValueError:
+        raise BadRequest("请求体不是合法的 JSON")
+    if not isinstance(chart, dict):
+        raise BadRequest("请求体应为 /v1/chart 返回的盘面")
+    missing = [k for k in ("defined_centers", "gate_list", "gate_colors", "active_channels") if k not in chart]
+    if missing:
+        raise BadRequest(f"盘面缺少字段: {', '.join(missing)}")
+
+    centers = chart["defined_centers"]
+    if not isinstance(centers, list) or not all(c in CENTER_NAMES for c in centers):
+        raise BadRequest(f"defined_centers 应为中心名列表 ({', '.join(CENTER_NAMES)})")
+    if not isinstance(chart["gate_list"], list) or not all(_is_gate(g) for g in chart["gate_list"]):
+        raise BadRequest("gate_list 应为 1 ~ 64 的闸门号列表")
+    colors = chart["gate_colors"]
+    if not isinstance(colors, dict) or not all(
+            str(g).isdigit() and 1 <= int(g) <= 64 and c in GATE_COLOR_NAMES for g, c in colors.items()):
+        raise BadRequest(f"gate_colors 应为 {{闸门号: {' / '.join(GATE_COLOR_NAMES)}}}")
+    channels = chart["active_channels"]
+    if not isinstance(channels, list) or not all(
+            isinstance(ch, list) and len(ch) == 2 and all(_is_gate(g) for g in ch) for ch in channels):
+        raise BadRequest("active_channels 应为 [闸门A, 闸门B] 的列表")
+    return chart
+
+
+def parse_image_options(request):
+    fmt = request.query_params.get("fmt", "PNG").upper()
+    if fmt not in IMAGE_FORMATS:
+        raise BadRequest(f"fmt 只支持 {', '.join(IMAGE_FORMATS)}")
+    width = request.query_params.get("width")
+    if width is not None:
+        if not width.isdigit() or not 0 < int(width) <= MAX_WIDTH:
+            raise BadRequest(f"width 必须是 1 ~ {MAX_WIDTH} 的整数")
+        width = int(width)
+    return fmt, width
+
+
+# ================= 进程池调度 =================
+
+class WorkerPool:
+    """进程池 + 在途上限 + 超时 (只在事件循环线程里用，计数不用加锁)"""
+
+    def __init__(self, workers=WORKERS, max_inflight=MAX_INFLIGHT, timeout=REQUEST_TIMEOUT):
+        self.workers = workers
+        self.max_inflight = max_inflight
+        self.timeout = timeout
+        self.inflight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self._executor = None
+
+    def start(self):
+        # spawn 而不是 fork：父进程里可能已经开着 SQLite 连接和线程，fork 出来的副本不安全
+        self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_init_worker)
+
+    async def check_assets(self):
+        """在子进程里检查绘图素材，缺了抛 RuntimeError (启动失败)；不受 REQUEST_TIMEOUT 限制，子进程预热可能较慢"""
+        missing = await asyncio.wrap_future(self._executor.submit(_check_assets))
+        if missing:
+            shown = ", ".join(missing[:5]) + (f" 等 {len(missing)} 个" if len(missing) > 5 else "")
+            raise RuntimeError(f"绘图素材不全，缺少: {shown}")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, fn, *args):
+        """交给进程池执行；满载返回 503，超时返回 504 (由调用方转成响应)"""
+        if self.inflight >= self.max_inflight:
+            self.rejected += 1
+            raise Overloaded()
+        self.inflight += 1
+        future = self._executor.submit(fn, *args)
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            # 已经在子进程里跑的任务停不下来，只能不等它；还在排队的直接取消
+            future.cancel()
+            self.timeouts += 1
+            raise
+        finally:
+            self.inflight -= 1
+        self.completed += 1
+        return result
+
+    def stats(self):
+        return {"workers": self.workers, "inflight": self.inflight, "max_inflight": self.max_inflight,
+                "completed": self.completed, "rejected": self.rejected, "timeouts": self.timeouts}
+
+
+pool = WorkerPool()
+
+
+async def _bad_request(request, exc):
+    return JSONResponse({"error": str(exc)}, status_code=400)
+
+
+async def _overloaded(request, exc):
+    return JSONResponse({"error": "服务繁忙，请稍后重试"}, status_code=503,
+                        headers={"Retry-After": str(RETRY_AFTER)})
+
+
+async def _timeout(request, exc):
+    return JSONResponse({"error": f"计算超时 ({pool.timeout:g} 秒)"}, status_code=504)
+
+
+# ================= 路由 =================
+
+async def chart_endpoint(request: Request):
+    birth = await parse_birth(request)
+    text = await pool.run(compute_chart_json, birth)
+    return Response(text.encode("utf-8"), media_type="application/json")
+
+
+async def render_endpoint(request: Request):
+    fmt, width = parse_image_options(request)
+    chart_text = (await request.body()).decode("utf-8", errors="replace")
+    parse_chart(chart_text)
+    data = await pool.run(render_chart_json, chart_text, fmt, width)
+    return Response(data, media_type=IMAGE_FORMATS[fmt])
+
+
+async def chart_image_endpoint(request: Request):
+    fmt, width = parse_image_options(request)
+    birth = await parse_birth(request)
+    data = await pool.run(compute_chart_image, birth, fmt, width)
+    return Response(data, media_type=IMAGE_FORMATS[fmt])
+
+
+async def health_endpoint(request: Request):
+    return JSONResponse({"status": "ok", **pool.stats()})
+
+
+@asynccontextmanager
+async def lifespan(app):
+    pool.start()
+    try:
+        await pool.check_assets()
+        yield
+    finally:
+        pool.shutdown()
+
+
+app = Starlette(
+    routes=[
+        Route("/v1/chart", chart_endpoint, methods=["POST"]),
+        Route("/v1/render", render_endpoint, methods=["POST"]),
+        Route("/v1/chart/image", chart_image_endpoint, methods=["POST"]),
+        Route("/health", health_endpoint, methods=["GET"]),
+    ],
+    exception_handlers={
+        BadRequest: _bad_request,
+        Overloaded: _overloaded,
+        asyncio.TimeoutError: _timeout,
+    },
+    lifespan=lifespan,
+)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    if len(sys.argv) > 1 and not sys.argv[1].isdigit():
+        print("用法: python api_server.py [端口] [进程数]")
+        sys.exit(1)
+    if len(sys.argv) > 2:
+        pool.workers = int(sys.argv[2])
+        pool.max_inflight = pool.workers * 4
+    uvicorn.run(app, host=HOST, port=int(sys.argv[1]) if len(sys.argv) > 1 else PORT)
@@ -1,9 +1,12 @@
 import streamlit as st
-import calculation      # 你的计算逻辑 (v4.1)
+import api_client       # 排盘 / 出图：设置 HD_API_URL 时走独立的 HTTP 服务 (api_server.py)，否则本进程带缓存计算
 import drawer_pil       # 👈 【修正】必须引用这个 PIL 叠图引擎！
-import city_data        # 离线城市库
-from openai import OpenAI
-from geopy.geocoders import Nominatim
+import drawer_svg       # 矢量渲染 (网页展示默认用它)
+import render_cache     # 盘面图片缓存 (同样的视觉签名直接返回编码好的字节)
+import geocoding        # 城市 -> 坐标 (离线城市索引 -> 离线地名库 -> 联网，带缓存)
+import interpretation   # 首次解读缓存 (同样的盘面特征直接回放，不再调用模型)
+import llm_client       # 异步流式模型客户端 (连接复用、重试、分阶段超时、合并刷新)
+import chat_history     # 多轮对话上下文：最近几轮原文 + 滚动摘要 + 固定的盘面事实
 from datetime import date
 
 # ==========================================
@@ -34,40 +37,32 @@ except (FileNotFoundError, KeyError):
     st.warning("⚠️ 未检测到密钥配置，请在 .streamlit/secrets.toml 中配置 DEEPSEEK_API_KEY")
     st.stop()
 
-client = OpenAI(
-    api_key=api_key,
-    base_url="https://api.deepseek.com"
-)
+# 进程级共享客户端：Streamlit 每次重跑都复用同一个连接池
+llm = llm_client.get_service(api_key)
 
 # ==========================================
 # 2. 定义功能函数
 # ==========================================
-def chat_with_deepseek(messages):
+def stream_reply(placeholder, pieces):
+    # 逐段文字合并成每 50 ms 最多刷新一次，不再每个 token 重绘整段 markdown
+    # 出错时保留已经收到的部分
+    full_response = ""
     try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=messages,
-            stream=True,
-            temperature=1.3
-        )
-        return response
-    except Exception as e:
+        for text in llm_client.coalesce(pieces):
+            full_response += text
+            placeholder.markdown(full_response + "▌")
+    except llm_client.LLMError as e:
         st.error(f"连接 AI 出错: {e}")
-        return None
+    placeholder.markdown(full_response)
+    return full_response
 
 def get_coordinates(city_name):
-    clean_name = city_name.strip().lower()
-    if clean_name in city_data.CHINA_CITIES:
-        return city_data.CHINA_CITIES[clean_name]
-    try:
-        geolocator = Nominatim(user_agent="my_hd_app_v16_pil", timeout=5)
-        location = geolocator.geocode(city_name)
-        if location:
-            return location.latitude, location.longitude
-        else:
-            return None, None
-    except Exception:
-        return None, None
+    # 离线城市索引 -> 离线世界地名库 -> 联网 (带缓存、限速、请求合并)：
+    # 联网最多等 5 秒，超时请求在后台继续，下次重跑直接命中缓存
+    coords = geocoding.resolve(city_name, timeout=5)
+    if coords:
+        return coords
+    return None, None
 
 # ==========================================
 # 3. 初始化状态
@@ -78,6 +73,8 @@ if "chart_calculated" not in st.session_state:
     st.session_state.chart_calculated = False
 if "system_prompt_content" not in st.session_state:
     st.session_state.system_prompt_content = ""
+if "history" not in st.session_state:
+    st.session_state.history = chat_history.HistoryManager("", "", chat_history.make_summarizer(llm.stream))
 
 # ==========================================
 # 4. 网页界面布局
@@ -113,59 +110,32 @@ with st.expander("📝 输入/修改 出生信息", expanded=True):
                 st.warning(f"⚠️ 找不到城市 '{city}'，已使用默认坐标 (北京)。")
                 lat, lon = 39.9042, 116.4074
             
-            # 2. 计算人类图 (调用 calculation.py)
-            chart_data = calculation.get_chart_data(birth_date, birth_time, lat, lon)
+            # 2. 计算人类图 (调用 calculation.py，经过缓存；或交给排盘服务)
+            try:
+                chart_data = api_client.get_chart_data(birth_date, birth_time, lat, lon)
+            except api_client.ChartAPIError as e:
+                st.error(f"排盘服务出错: {e}")
+                st.stop()
             
-            # 3. 构建 System Prompt
-            st.session_state.system_prompt_content = f"""
-# 角色
-你叫“活活”，资深人类图分析师。
-# 核心指令
-**必须掌握对话主动权**。每次回复最后必须抛出一个引导性反问句。
-# 回复逻辑
-## 第一阶段：深度首秀
-直接输出 600字 综合解读：
-1. 能量致意（连接 {city}）。
-2. 核心画像（{chart_data['type']} + {chart_data['profile']} 的比喻）。
-3. 光之天赋（意识太阳 {chart_data['activations'].get('Sun (个性黑)', {}).get('text', '未知')}）。
-4. 暗之动力（潜意识太阳 {chart_data['activations'].get('Sun (设计红)', {}).get('text', '未知')}）。
-5. 灵魂拷问。
-## 第二阶段：后续互动
-短小精悍，结合生活场景追问。
----
-# 用户数据
-姓名：{name}
-城市：{city}
-类型：{chart_data['type']}
-人生角色：{chart_data['profile']}
-定义中心：{', '.join(chart_data['defined_centers'])}
-"""
+            # 3. 构建 System Prompt (只由盘面特征决定，同样的特征共用解读缓存)
+            features = interpretation.prompt_features(name, city, chart_data)
+            st.session_state.system_prompt_content = interpretation.build_system_prompt(features)
             # 4. 更新状态
             st.session_state.chart_calculated = True
             st.session_state.current_chart = chart_data
             st.session_state.messages = [] # 重置对话
+            st.session_state.history = chat_history.HistoryManager(
+                st.session_state.system_prompt_content,
+                chat_history.chart_facts(name, city, chart_data),
+                chat_history.make_summarizer(llm.stream),
+            )
 
-            # 5. 主动触发第一次 AI 解读
-            first_trigger_msg = [
-                {"role": "system", "content": st.session_state.system_prompt_content},
-                {"role": "user", "content": "请基于我的数据，给我一份完整、深度的整体解读报告。"}
-            ]
-            
+            # 5. 主动触发第一次 AI 解读 (命中缓存时直接回放)
             # --- C. 处理 AI 流式响应 ---
             with st.chat_message("assistant"):
                 response_placeholder = st.empty()
-                full_response = ""
-                
-                stream = chat_with_deepseek(first_trigger_msg)
-                
-                if stream:
-                    for chunk in stream:
-                        if chunk.choices and chunk.choices[0].delta.content:
-                            content = chunk.choices[0].delta.content
-                            full_response += content
-                            response_placeholder.markdown(full_response + "▌")
-                    
-                    response_placeholder.markdown(full_response)
+                full_response = stream_reply(response_placeholder,
+                                             interpretation.stream_first_reading(features, llm.stream))
             
             st.session_state.messages.append({"role": "assistant", "content": full_response})
             st.rerun() # 强制刷新
@@ -183,11 +153,22 @@ if st.session_state.chart_calculated:
     col_img, col_info = st.columns([1.2, 1.8])
     
     with col_img:
-        # === 核心修正：调用 drawer_pil 生成图片 ===
-        pil_image = drawer_pil.create_chart_image(d)
+        # === 核心修正：生成图片 (经过图片缓存) ===
+        # 默认出矢量 SVG (几 KB 文本，不用叠图)；没有几何文件时退回 PNG：
+        # 直接按展示宽度出 PNG，st.image 对尺寸合适的 PNG 原样发送，不会再解码重编码
+        fmt = render_cache.DISPLAY_FORMAT.upper()
+        if fmt == "SVG" and drawer_svg.load_geometry() is None:
+            fmt = "PNG"
+        try:
+            chart_image = api_client.get_chart_image_bytes(d, fmt=fmt, width=drawer_pil.DISPLAY_WIDTH)
+        except api_client.ChartAPIError as e:
+            st.error(f"出图服务出错: {e}")
+            chart_image = None
+        if fmt == "SVG" and chart_image:
+            chart_image = chart_image.decode("utf-8")  # st.image 只认 SVG 文本
         
-        if pil_image:
-            st.image(pil_image, caption=f"{name} 的人类图", use_container_width=True)
+        if chart_image:
+            st.image(chart_image, caption=f"{name} 的人类图", use_container_width=True)
         else:
             st.error("❌ 无法生成图片，请检查 images 文件夹及素材")
             
@@ -197,7 +178,8 @@ if st.session_state.chart_calculated:
         
         # 2. 基础数据
         st.write(f"🌍 **坐标**: {city} ({loc_str})")
-        st.write(f"⚡ **定义中心**: {len(d['defined_centers'])} 个")
+        st.write(f"⚡ **定义中心**: {len(d['defined_centers'])} 个 ({d.get('definition', '?')})")
+        st.write(f"🧭 **内在权威**: {d.get('authority', '?')}")
         
         # 3. 通道列表
         if d['active_channels']:
@@ -214,18 +196,13 @@ if st.session_state.chart_calculated:
         
         with c_black:
             st.markdown("#### ⚫ 个性")
-            for k, v in d['activations'].items():
-                if "黑" in k:
-                    # 简化显示：只取行星名
-                    planet_name = k.split(" ")[0] 
-                    st.write(f"{planet_name}: **{v['text']}**")
+            for planet_name, act in d['personality'].items():
+                st.write(f"{planet_name}: **{act['text'] if act else '未知'}**")
                     
         with c_red:
             st.markdown("#### 🔴 设计")
-            for k, v in d['activations'].items():
-                if "红" in k:
-                    planet_name = k.split(" ")[0]
-                    st.write(f"{planet_name}: **{v['text']}**")
+            for planet_name, act in (d['design'] or {}).items():
+                st.write(f"{planet_name}: **{act['text'] if act else '未知'}**")
 
 # --- D. 聊天输入框 ---
 if prompt := st.chat_input("和活活继续深入探讨..."):
@@ -233,22 +210,11 @@ if prompt := st.chat_input("和活活继续深入探讨..."):
     with st.chat_message("user"):
         st.markdown(prompt)
     
-    api_messages = [{"role": "system", "content": st.session_state.system_prompt_content}]
-    for msg in st.session_state.messages:
-        api_messages.append(msg)
+    # 系统提示词 + 盘面事实 + 早期对话摘要 + 最近几轮原文，长对话的提示词也基本不变大
+    api_messages = st.session_state.history.build(st.session_state.messages)
         
     with st.chat_message("assistant"):
         response_placeholder = st.empty()
-        full_response = ""
-        
-        stream = chat_with_deepseek(api_messages)
-        if stream:
-            for chunk in stream:
-                if chunk.choices and chunk.choices[0].delta.content:
-                    content = chunk.choices[0].delta.content
-                    full_response += content
-                    response_placeholder.markdown(full_response + "▌")
-            
-            response_placeholder.markdown(full_response)
+        full_response = stream_reply(response_placeholder, llm.stream(api_messages))
     
     st.session_state.messages.append({"role": "assistant", "content": full_response})
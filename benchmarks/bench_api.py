@@ -0,0 +1,120 @@
+"""
+排盘 HTTP 接口压测：并发打 /v1/chart (每次不同的生日，缓存不命中)、/v1/chart (同一个生日) 和 /v1/render，
+报告每个场景的吞吐、p50 / p99 延迟和各状态码数量 (503 = 背压拒绝，504 = 超时)
+不给地址时在本机随机端口起一个 api_server 子进程，测完关掉
+用法: python benchmarks/bench_api.py [请求数] [并发数] [服务地址]
+"""
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, time as dtime
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import api_client
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server():
+    port = free_port()
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "api_server.py"), str(port)],
+                            cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if requests.get(url + "/health", timeout=1).ok:
+                return proc, url
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("api_server 没有启动起来")
+
+
+def random_birth(rng):
+    return {"date": f"{rng.randint(1900, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "time": f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}",
+            "lat": 39.9042, "lon": 116.4074}
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def run(label, url, make_request, count, concurrency):
+    local = threading.local()
+
+    def one(i):
+        # 每个压测线程一个 Session，复用连接
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        path, kwargs = make_request(i)
+        start = time.perf_counter()
+        try:
+            status = local.session.post(url + path, timeout=30, **kwargs).status_code
+        except requests.RequestException:
+            status = "error"
+        return status, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(count)))
+    elapsed = time.perf_counter() - start
+
+    ok = [sec * 1000 for status, sec in results if status == 200]
+    statuses = Counter(status for status, _ in results)
+    line = f"{label:28s} {count / elapsed:8.1f} req/s"
+    if ok:
+        line += f"   p50 {percentile(ok, 0.50):7.1f} ms   p99 {percentile(ok, 0.99):7.1f} ms"
+    print(f"{line}   status {dict(statuses)}")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    url = sys.argv[3].rstrip("/") if len(sys.argv) > 3 else None
+    proc = None
+    if url is None:
+        proc, url = start_server()
+    try:
+        print(f"server {url}  requests {count}  concurrency {concurrency}")
+        print(requests.get(url + "/health").json())
+        rng = random.Random(42)
+        births = [random_birth(rng) for _ in range(count)]
+        first = births[0]
+        chart = api_client.ChartClient(url).chart(date.fromisoformat(first["date"]),
+                                                  dtime.fromisoformat(first["time"]), first["lat"], first["lon"])
+
+        run("chart, distinct birthdays", url, lambda i: ("/v1/chart", {"json": births[i]}), count, concurrency)
+        run("chart, same birthday", url, lambda i: ("/v1/chart", {"json": births[0]}), count, concurrency)
+        run("render SVG", url, lambda i: ("/v1/render", {"json": chart, "params": {"fmt": "SVG"}}),
+            count, concurrency)
+        run("render PNG 734px", url,
+            lambda i: ("/v1/render", {"json": chart, "params": {"fmt": "PNG", "width": 734}}),
+            count, concurrency)
+        run("chart+image, distinct", url,
+            lambda i: ("/v1/chart/image", {"json": births[i], "params": {"fmt": "SVG"}}), count, concurrency)
+        print(requests.get(url + "/health").json())
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
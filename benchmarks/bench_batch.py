@@ -0,0 +1,47 @@
+"""
+批量排盘基准：逐张调用 get_chart_data vs get_chart_data_batch
+用法: python benchmarks/bench_batch.py [张数]
+"""
+import os
+import random
+import sys
+import time
+from datetime import date, time as dtime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import calculation
+
+
+def make_records(n, seed=42):
+    rng = random.Random(seed)
+    records = []
+    for _ in range(n):
+        d = date(rng.randint(1900, 2024), rng.randint(1, 12), rng.randint(1, 28))
+        t = dtime(rng.randint(0, 23), rng.randint(0, 59))
+        records.append((d, t, 39.9042, 116.4074, None))
+    return records
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    records = make_records(n)
+
+    start = time.perf_counter()
+    loop_charts = [calculation.get_chart_data(d, t, lat, lon) for d, t, lat, lon, _tz in records]
+    loop_sec = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch_charts = calculation.get_chart_data_batch(records)
+    batch_sec = time.perf_counter() - start
+
+    assert loop_charts == batch_charts, "批量结果与逐张结果不一致"
+
+    print(f"charts:        {n}")
+    print(f"per-call loop: {n / loop_sec:10.1f} charts/sec ({loop_sec:.3f}s)")
+    print(f"batch:         {n / batch_sec:10.1f} charts/sec ({batch_sec:.3f}s)")
+    print(f"speedup:       {loop_sec / batch_sec:10.2f}x")
+
+
+if __name__ == "__main__":
+    main()
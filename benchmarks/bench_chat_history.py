@@ -0,0 +1,77 @@
+"""
+多轮对话上下文基准 (用本地假 LLM 服务 fake_llm_server，不花 token)
+旧写法：每一轮把系统提示词 + 全部历史原文发给模型，提示词随轮数线性增长 (总量是平方级)
+新写法：chat_history.HistoryManager (盘面事实 + 滚动摘要 + 最近几轮原文)
+报告每轮提示词的估算 token 数、累计 token、摘要调用次数
+用法: python benchmarks/bench_chat_history.py [轮数] [回复字数]
+"""
+import os
+import sys
+import time
+from datetime import date, time as dtime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import calculation
+import chat_history
+import interpretation
+import llm_client
+from fake_llm_server import FakeLLMServer
+
+QUESTIONS = [
+    "我最近工作压力很大，总觉得要主动去争取机会，这和我的类型有关吗？",
+    "那我在感情里应该怎么做决定？",
+    "我的开放中心会让我在什么场景下特别容易被影响？",
+    "能具体说说我这个人生角色在职场上的表现吗？",
+    "我小时候总被说太敏感，这和哪条通道有关？",
+]
+
+
+def run(turns, service, features, build, label):
+    """模拟 turns 轮对话，打印并返回每轮提示词的估算 token 数"""
+    messages = [{"role": "assistant", "content": "".join(service.stream(
+        interpretation.first_reading_messages(features)))}]
+    sizes = []
+    start = time.perf_counter()
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"第 {i + 1} 轮：{QUESTIONS[i % len(QUESTIONS)]}"})
+        api_messages = build(messages)
+        sizes.append(chat_history.count_message_tokens(api_messages))
+        messages.append({"role": "assistant", "content": "".join(service.stream(api_messages))})
+    elapsed = time.perf_counter() - start
+    print(f"{label:16s} prompt tokens: turn 1 {sizes[0]:6d}  turn {turns // 2} {sizes[turns // 2 - 1]:6d}  "
+          f"turn {turns} {sizes[-1]:6d}  max {max(sizes):6d}  total {sum(sizes):8d}   {elapsed:.2f} s")
+    return sizes
+
+
+def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    chars = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+
+    chart = calculation.get_chart_data(date(1990, 5, 17), dtime(14, 30), 39.9042, 116.4074, "Asia/Shanghai")
+    features = interpretation.prompt_features("测试", "北京", chart)
+    system_prompt = interpretation.build_system_prompt(features)
+
+    server = FakeLLMServer(first_token_delay=0.0, token_delay=0.0, reply_chars=chars)
+    url = server.start()
+    service = llm_client.LLMService(lambda: llm_client.AsyncLLMClient("fake", url + "/v1"))
+    print(f"turns {turns}  reply {chars} chars  recent turns {chat_history.RECENT_TURNS}  "
+          f"verbatim budget {chat_history.VERBATIM_TOKEN_BUDGET}")
+
+    def full_history(messages):
+        return [{"role": "system", "content": system_prompt}] + messages
+
+    run(turns, service, features, full_history, "full history")
+
+    manager = chat_history.HistoryManager(system_prompt, chat_history.chart_facts("测试", "北京", chart),
+                                          chat_history.make_summarizer(service.stream))
+    run(turns, service, features, manager.build, "HistoryManager")
+    print(f"summary calls {manager.summary_calls}  summary {len(manager.summary)} chars  "
+          f"verbatim from message {manager.summarized}")
+
+    service.close()
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+城市查询基准：旧的 "小写后精确查字典" vs city_index (精确 / 后缀 / 前缀 / 错字)
+报告每类输入的命中率和平均微秒；没命中的在线上都会变成一次阻塞的 Nominatim 请求
+用法: python benchmarks/bench_city_lookup.py [轮数]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import city_data
+import city_index
+
+QUERIES = {
+    "exact": ["北京", "beijing", "上海", "harbin", "杭州", "nanjing"],
+    "suffix": ["北京市", "Beijing City", "浙江省杭州市", "黑龙江省哈尔滨市", "北京市朝阳区", "Hangzhou Shi"],
+    "prefix": ["哈尔", "harb", "nanjin", "石家", "qinhuang", "乌鲁木"],
+    "typo": ["shanghia", "hangzou", "tokio", "qingdoa", "nanjign", "shijiazhaung"],
+    "unknown": ["narnia", "atlantis", "gotham", "亚特兰蒂斯"],
+}
+
+
+def legacy_lookup(name):
+    return city_data.CHINA_CITIES.get(name.strip().lower())
+
+
+def measure(fn, queries, rounds):
+    hits = sum(fn(q) is not None for q in queries)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for q in queries:
+            fn(q)
+    us = (time.perf_counter() - start) / (rounds * len(queries)) * 1e6
+    return hits, us
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(f"{'kind':8s} {'legacy hits':>12s} {'index hits':>11s} {'legacy us':>10s} {'index us':>9s}")
+    for kind, queries in QUERIES.items():
+        old_hits, old_us = measure(legacy_lookup, queries, rounds)
+        new_hits, new_us = measure(city_index.lookup, queries, rounds)
+        print(f"{kind:8s} {old_hits:>7d}/{len(queries):<4d} {new_hits:>6d}/{len(queries):<4d} "
+              f"{old_us:10.2f} {new_us:9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+设计时间求解基准：每次求解的星历计算次数与耗时
+对比旧的 "回退 88 天" 近似、冷缓存和热缓存 (同一批出生日重复求解)
+用法: python benchmarks/bench_design_date.py [次数]
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import calculation
+
+
+def make_births(n, seed=7):
+    rng = random.Random(seed)
+    return [datetime(rng.randint(1900, 2024), rng.randint(1, 12), rng.randint(1, 28),
+                     rng.randint(0, 23), rng.randint(0, 59)) for _ in range(n)]
+
+
+def run(births, suns):
+    """返回 (平均每次的太阳星历计算次数, 平均微秒, 最大误差角秒)"""
+    calls = [0]
+    original = calculation.get_planet_position
+
+    def counting(body_name, date_utc):
+        calls[0] += 1
+        return original(body_name, date_utc)
+
+    calculation.get_planet_position = counting
+    try:
+        start = time.perf_counter()
+        designs = [calculation.find_design_date(sun, dt) for sun, dt in zip(suns, births)]
+        elapsed = time.perf_counter() - start
+    finally:
+        calculation.get_planet_position = original
+
+    worst = 0.0
+    for sun, design in zip(suns, designs):
+        err = abs(calculation._angle_diff(original("Sun", design), sun - calculation.DESIGN_ARC))
+        worst = max(worst, err)
+    return calls[0] / len(births), elapsed / len(births) * 1e6, worst * 3600
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    births = make_births(n)
+    suns = [calculation.get_planet_position("Sun", dt) for dt in births]
+
+    start = time.perf_counter()
+    for dt in births:
+        dt - timedelta(days=88)
+    approx_us = (time.perf_counter() - start) / n * 1e6
+
+    calculation._design_offset_at.cache_clear()
+    cold = run(births, suns)
+    warm = run(births, suns)
+
+    print(f"solves:          {n}")
+    print(f"88-day approx:   {0:5.2f} evals/solve {approx_us:9.2f} us/solve")
+    print(f"solver (cold):   {cold[0]:5.2f} evals/solve {cold[1]:9.2f} us/solve  max err {cold[2]:.4f}\"")
+    print(f"solver (warm):   {warm[0]:5.2f} evals/solve {warm[1]:9.2f} us/solve  max err {warm[2]:.4f}\"")
+    print(f"(one chart also needs {2 * len(calculation.PLANETS)} get_planet_position calls either way)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+批量导出基准：随机生成一份名单 (一部分按城市名、一部分带坐标、少量坏行)，
+分别导出成 CSV 和 Parquet，报告每秒行数和进程峰值内存 (应与行数无关，导入 pyarrow 本身占几十 MB)；
+再演示中断续跑：导出到一半杀掉，重跑后和一次跑完的结果逐字节相同；
+最后是几乎全是坏行的名单 (城市都查不到)：行数放大 10 倍，峰值内存应不变，且照样一块块写出
+用法: python benchmarks/bench_export.py [行数] [进程数]
+"""
+import csv
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import city_data
+import export_charts
+
+
+def make_input(path, n, seed=42):
+    rng = random.Random(seed)
+    cities = list(city_data.CHINA_CITIES)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["member_id", "date", "time", "city", "lat", "lon", "tz"])
+        for i in range(n):
+            d = f"{rng.randint(1900, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+            t = f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}"
+            if i % 100 == 0:
+                writer.writerow([i, "19xx-01-01", t, "北京", "", "", ""])
+            elif i % 4 == 0:
+                writer.writerow([i, d, t, "", "51.5074", "-0.1278", "Europe/London"])
+            else:
+                writer.writerow([i, d, t, rng.choice(cities), "", "", ""])
+
+
+def make_bad_input(path, n):
+    """每行的城市都查不到 (status 全是 city_not_found)，每 1000 行夹一行好的"""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["member_id", "date", "time", "city", "lat", "lon", "tz"])
+        for i in range(n):
+            if i % 1000 == 999:
+                writer.writerow([i, "1990-01-01", "12:00", "北京", "", "", ""])
+            else:
+                writer.writerow([i, "1990-01-01", "12:00", f"查无此城{i}", "", "", ""])
+
+
+def bad_run(input_path, output_path, workers, results):
+    """在全新的子进程里导出 (峰值内存只算这一次)，回报 (行数, 失败行数, 写出块数, 峰值 MB)"""
+    chunks = []
+    total, ok, failed = export_charts.export(input_path, output_path, workers=workers,
+                                             progress=lambda total, new: chunks.append(total))
+    results.put((total, failed, len(chunks), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def interrupted(input_path, output_path, workers, rows):
+    """子进程里导出，写出至少 rows 行后直接杀掉 (模拟 Ctrl-C / 机器重启)"""
+    def stop_after(total, new):
+        if total >= rows:
+            os._exit(1)
+
+    def run():
+        export_charts.export(input_path, output_path, workers=workers, progress=stop_after)
+    process = multiprocessing.Process(target=run)
+    process.start()
+    process.join()
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, "members.csv")
+        make_input(input_path, n)
+        print(f"rows {n}  workers {workers}  chunk {export_charts.CHUNK_ROWS}")
+
+        for label, output in (("csv", "charts.csv"), ("parquet", "charts_parquet")):
+            start = time.perf_counter()
+            total, ok, failed = export_charts.export(input_path, os.path.join(tmp, output), workers=workers)
+            elapsed = time.perf_counter() - start
+            print(f"{label:8s} {total / elapsed:8.0f} rows/sec   ok {ok}  failed {failed}   "
+                  f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+        resumed = os.path.join(tmp, "resumed.csv")
+        interrupted(input_path, resumed, workers, n // 2)
+        with open(resumed + ".progress", encoding="utf-8") as f:
+            done = json.load(f)["rows"]
+        total, ok, failed = export_charts.export(input_path, resumed, workers=workers)
+        with open(resumed, "rb") as a, open(os.path.join(tmp, "charts.csv"), "rb") as b:
+            same = a.read() == b.read()
+        print(f"resume: killed after {done} rows, resumed {ok + failed} rows, identical to one-shot run: {same}")
+
+        spawn = multiprocessing.get_context("spawn")
+        results = spawn.Queue()
+        for rows in (n, n * 10):
+            bad_path = os.path.join(tmp, f"bad_{rows}.csv")
+            make_bad_input(bad_path, rows)
+            process = spawn.Process(target=bad_run, args=(bad_path, os.path.join(tmp, f"bad_{rows}_out.csv"),
+                                                          workers, results))
+            process.start()
+            total, failed, chunks, peak = results.get()
+            process.join()
+            print(f"mostly bad {total:8d} rows   failed {failed}   chunks written {chunks}   peak RSS {peak:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
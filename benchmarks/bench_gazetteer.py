@@ -0,0 +1,55 @@
+"""
+离线地名库基准：加载耗时、加载后和查询后的常驻内存增量、每次查询的微秒数
+库文件用 HD_GAZETTEER 指定 (先用 python gazetteer.py build <GeoNames 文本文件> 生成)
+用法: python benchmarks/bench_gazetteer.py [查询次数]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gazetteer
+
+
+def _rss_mb(field="RssAnon"):
+    """RssAnon 是进程自己的堆内存；RssFile 是映射进来的文件页，内存紧张时系统可以直接丢掉"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    # 模块 (连同 numpy) 在开头已导入，这里只算打开库文件本身
+    rss_start = _rss_mb()
+    start = time.perf_counter()
+    table = gazetteer.get_gazetteer()
+    load_ms = (time.perf_counter() - start) * 1000
+    if table is None:
+        print(f"找不到地名库文件: {gazetteer.GAZETTEER_PATH}")
+        return
+    rss_loaded = _rss_mb()
+
+    # 一半查库里真实存在的名字，一半查不存在的
+    rng = random.Random(3)
+    names = [table.place(rng.randrange(len(table))).name for _ in range(n // 2)]
+    names += [f"nowhere{i}" for i in range(n - len(names))]
+    rng.shuffle(names)
+
+    start = time.perf_counter()
+    hits = sum(table.lookup(name) is not None for name in names)
+    us = (time.perf_counter() - start) / n * 1e6
+
+    print(f"{len(table)} places, file {os.path.getsize(table.path) / 1e6:.1f} MB")
+    print(f"load {load_ms:.1f} ms, anonymous RSS +{rss_loaded - rss_start:.1f} MB after load, "
+          f"+{_rss_mb() - rss_start:.1f} MB after {n} lookups "
+          f"(mapped file pages {_rss_mb('RssFile'):.1f} MB)")
+    print(f"lookup {us:.1f} us ({hits}/{n} hits)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+联网地理编码层基准 (用 StubGeocoder 模拟 300 ms 的网络请求，不真的联网)
+场景: 20 个会话同时查同一个新地名 -> 查一个不存在的地名 -> 模拟 Streamlit 重跑再查一遍 -> 后台模式
+报告每个场景的耗时和真正发出去的请求数
+用法: python benchmarks/bench_geocoding.py
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import geocoding
+
+PLACES = {"Reykjavik": (64.1466, -21.9426), "Ushuaia": (-54.8019, -68.3030)}
+
+
+def timed(label, stub, fn):
+    before = stub.calls
+    start = time.perf_counter()
+    result = fn()
+    ms = (time.perf_counter() - start) * 1000
+    print(f"{label:34s} {ms:8.1f} ms   requests {stub.calls - before}   -> {result}")
+
+
+def main():
+    stub = geocoding.StubGeocoder(PLACES, delay=0.3)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "geocode.db")
+        service = geocoding.GeocodingService(stub, db_path=db_path, min_interval=0.5)
+
+        def concurrent():
+            results = []
+            threads = [threading.Thread(target=lambda: results.append(service.lookup("Reykjavik")))
+                       for _ in range(20)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            return f"{len(set(results))} distinct result(s)"
+
+        timed("20 concurrent sessions, new place", stub, concurrent)
+        timed("unknown place", stub, lambda: service.lookup("Atlantis"))
+        timed("rerun: known place (memory)", stub, lambda: service.lookup("reykjavik"))
+        timed("rerun: unknown place (negative)", stub, lambda: service.lookup("Atlantis"))
+
+        restarted = geocoding.GeocodingService(stub, db_path=db_path)
+        timed("after restart (SQLite)", stub, lambda: restarted.lookup("Reykjavik"))
+        timed("background, wait 50 ms", stub, lambda: restarted.lookup("Ushuaia", timeout=0.05))
+        time.sleep(0.5)
+        timed("next rerun after background", stub, lambda: restarted.lookup("Ushuaia", timeout=0.05))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+首次解读缓存基准 (用本地假 LLM 服务 fake_llm_server，不花 token)
+同一批盘面 (几个热门生日) 反复点 "生成盘面"：对比不带缓存 (每次都调模型) 和 interpretation 缓存，
+报告模型请求数、消耗的 token 数、首段延迟和整段耗时
+用法: python benchmarks/bench_interpretation.py [盘面数] [每张重复次数] [变体数]
+"""
+import os
+import statistics
+import sys
+import time
+from datetime import date, time as dtime
+
+from openai import OpenAI
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chart_cache
+import interpretation
+from fake_llm_server import FakeLLMServer
+
+
+def make_generate(client):
+    def generate(messages):
+        stream = client.chat.completions.create(model=interpretation.MODEL, messages=messages, stream=True,
+                                                temperature=interpretation.TEMPERATURE)
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    return generate
+
+
+def timed_stream(pieces):
+    start = time.perf_counter()
+    first = None
+    text = ""
+    for piece in pieces:
+        if first is None:
+            first = time.perf_counter() - start
+        text += piece
+    return first or 0.0, time.perf_counter() - start, text
+
+
+def report(label, server, before, results):
+    firsts = [r[0] * 1000 for r in results]
+    totals = [r[1] * 1000 for r in results]
+    print(f"{label:22s} requests {server.requests - before[0]:4d}   tokens {server.tokens - before[1]:6d}   "
+          f"first chunk p50 {statistics.median(firsts):7.1f} ms   total p50 {statistics.median(totals):7.1f} ms")
+
+
+def main():
+    charts = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+    variants = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+
+    server = FakeLLMServer(first_token_delay=0.3, token_delay=0.005)
+    url = server.start()
+    client = OpenAI(api_key="fake", base_url=url + "/v1")
+    generate = make_generate(client)
+
+    features = []
+    for i in range(charts):
+        chart = chart_cache.get_chart_data(date(1990 + i, 3, 1), dtime(8, 30), 39.9042, 116.4074)
+        features.append(interpretation.prompt_features("Wanye", "北京", chart))
+    clicks = [f for _ in range(repeats) for f in features]
+    print(f"charts {charts}  repeats {repeats}  variants {variants}  clicks {len(clicks)}")
+
+    before = (server.requests, server.tokens)
+    results = [timed_stream(generate(interpretation.first_reading_messages(f))) for f in clicks]
+    report("no cache", server, before, results)
+
+    cache = interpretation.InterpretationCache(variants=variants)
+    before = (server.requests, server.tokens)
+    results = [timed_stream(cache.stream(f, generate)) for f in clicks]
+    report("interpretation cache", server, before, results)
+    # 前 variants 轮在凑变体，之后全是回放
+    replayed = results[charts * variants:]
+    if replayed:
+        report("  replays only", server, (server.requests, server.tokens), replayed)
+    print(cache.stats())
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
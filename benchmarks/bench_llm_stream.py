@@ -0,0 +1,83 @@
+"""
+流式模型客户端基准 (用本地假 LLM 服务 fake_llm_server，不花 token)
+旧写法：每次重跑新建一个同步 OpenAI 客户端，每来一个 token 就把整段回复重新渲染一次
+新写法：进程共用的 llm_client.LLMService (连接复用) + coalesce() 合并刷新
+报告 TTFT、tokens/sec、界面刷新次数和累计重绘的字数 (旧写法是平方级)；最后演示失败重试
+用法: python benchmarks/bench_llm_stream.py [请求数] [回复字数]
+"""
+import os
+import statistics
+import sys
+import time
+
+from openai import OpenAI
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm_client
+from fake_llm_server import FakeLLMServer
+
+MESSAGES = [{"role": "user", "content": "请基于我的数据，给我一份完整、深度的整体解读报告。"}]
+
+
+def render_cost(pieces):
+    """模拟界面：每次刷新都重绘全文，返回 (刷新次数, 累计重绘字数, 首段时间, 总时间)"""
+    start = time.perf_counter()
+    first = None
+    full, flushes, drawn = "", 0, 0
+    for piece in pieces:
+        if first is None:
+            first = time.perf_counter() - start
+        full += piece
+        flushes += 1
+        drawn += len(full)
+    return flushes, drawn, first or 0.0, time.perf_counter() - start
+
+
+def legacy_pieces(url):
+    client = OpenAI(api_key="fake", base_url=url + "/v1")
+    stream = client.chat.completions.create(model=llm_client.MODEL, messages=MESSAGES, stream=True,
+                                            temperature=llm_client.TEMPERATURE)
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def report(label, results):
+    flushes, drawn, firsts, totals = zip(*results)
+    print(f"{label:34s} TTFT p50 {statistics.median(firsts) * 1000:7.1f} ms   "
+          f"total p50 {statistics.median(totals) * 1000:7.1f} ms   "
+          f"flushes {statistics.median(flushes):6.0f}   chars redrawn {statistics.median(drawn):9.0f}")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    chars = int(sys.argv[2]) if len(sys.argv) > 2 else 1200
+
+    server = FakeLLMServer(first_token_delay=0.2, token_delay=0.005, reply_chars=chars)
+    url = server.start()
+    print(f"requests {count}  reply {chars} chars  flush interval {llm_client.FLUSH_INTERVAL * 1000:.0f} ms")
+
+    report("legacy (new client, every token)", [render_cost(legacy_pieces(url)) for _ in range(count)])
+
+    service = llm_client.LLMService(lambda: llm_client.AsyncLLMClient("fake", url + "/v1"))
+    report("LLMService, every token", [render_cost(service.stream(MESSAGES)) for _ in range(count)])
+    report("LLMService + coalesce", [render_cost(llm_client.coalesce(service.stream(MESSAGES)))
+                                     for _ in range(count)])
+    print("metrics:", {k: round(v, 3) if isinstance(v, float) else v for k, v in service.stats().items()})
+    service.close()
+    server.stop()
+
+    # 每两个请求失败一次 (HTTP 503)：首字前失败会按退避重试，调用方看不到错误
+    flaky = FakeLLMServer(first_token_delay=0.05, token_delay=0.001, reply_chars=200, fail_every=2,
+                          fail_status=503)
+    url = flaky.start()
+    service = llm_client.LLMService(lambda: llm_client.AsyncLLMClient("fake", url + "/v1"))
+    ok = sum(bool("".join(service.stream(MESSAGES))) for _ in range(count))
+    print(f"flaky server (every 2nd request 503): {ok}/{count} replies, {service.stats()['retries']} retries")
+    service.close()
+    flaky.stop()
+
+
+if __name__ == "__main__":
+    main()
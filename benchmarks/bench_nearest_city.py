@@ -0,0 +1,92 @@
+"""
+反向查询基准：10 万个随机坐标找最近的城市
+对比旧写法 (逐条遍历 city_data 字典算距离，抽样后按比例折算)、numpy 线性扫描和 KD 树 (spatial_index)，
+并核对 KD 树的结果和线性扫描完全一致；有地名库文件时再测一遍地名库 (几十万个点)
+用法: python benchmarks/bench_nearest_city.py [坐标数] [地名库文件]
+"""
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import city_data
+import city_index
+import gazetteer
+import spatial_index
+
+LEGACY_SAMPLE = 1000
+
+
+def legacy_nearest(lat, lon):
+    best, best_km = None, float("inf")
+    for name, (clat, clon) in city_data.CHINA_CITIES.items():
+        a = (math.sin(math.radians(clat - lat) / 2) ** 2
+             + math.cos(math.radians(lat)) * math.cos(math.radians(clat))
+             * math.sin(math.radians(clon - lon) / 2) ** 2)
+        km = 2 * spatial_index.EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+        if km < best_km:
+            best, best_km = name, km
+    return best, best_km
+
+
+def random_points(count, seed=0):
+    # 一半落在中国境内 (实际数据的分布)，一半在全球均匀分布
+    rng = np.random.default_rng(seed)
+    half = count // 2
+    lats = np.concatenate([rng.uniform(18, 53, half),
+                           np.degrees(np.arcsin(rng.uniform(-1, 1, count - half)))])
+    lons = np.concatenate([rng.uniform(73, 135, half), rng.uniform(-180, 180, count - half)])
+    return lats, lons
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def compare(label, point_lats, point_lons, lats, lons):
+    index, build_s = timed(lambda: spatial_index.SpatialIndex(point_lats, point_lons))
+    (kd_idx, kd_km), kd_s = timed(lambda: index.nearest(lats, lons))
+    (bf_idx, bf_km), bf_s = timed(lambda: spatial_index.brute_force_nearest(lats, lons, point_lats, point_lons))
+    same = np.mean(kd_idx == bf_idx) * 100
+    mode = "linear scan" if index.depth is None else f"KD tree, depth {index.depth}"
+    print(f"{label}: {len(point_lats)} points ({mode}), build {build_s * 1000:.1f} ms")
+    print(f"  numpy linear scan {bf_s * 1000:10.1f} ms")
+    print(f"  SpatialIndex      {kd_s * 1000:10.1f} ms   same result {same:.2f}%   "
+          f"max diff {np.abs(kd_km - bf_km).max():.2e} km")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    gaz_path = sys.argv[2] if len(sys.argv) > 2 else gazetteer.GAZETTEER_PATH
+    lats, lons = random_points(count)
+    print(f"{count} query points")
+
+    sample = min(LEGACY_SAMPLE, count)
+    _, legacy_s = timed(lambda: [legacy_nearest(lat, lon) for lat, lon in zip(lats[:sample], lons[:sample])])
+    print(f"legacy dict scan ({len(city_data.CHINA_CITIES)} names): "
+          f"{legacy_s / sample * count * 1000:.0f} ms (extrapolated from {sample})")
+
+    places = city_index.default_index._places
+    compare("city_data (aliases merged)", [p[1] for p in places], [p[2] for p in places], lats, lons)
+    (matches, _), api_s = timed(lambda: city_index.nearest(lats, lons))
+    print(f"  city_index.nearest (with CityMatch objects) {api_s * 1000:.1f} ms")
+    legacy_names = [legacy_nearest(lat, lon)[0] for lat, lon in zip(lats[:sample], lons[:sample])]
+    agree = sum(city_data.CHINA_CITIES[old] == (m.lat, m.lon) for old, m in zip(legacy_names, matches))
+    print(f"  agrees with legacy scan on {agree}/{sample}")
+
+    if os.path.exists(gaz_path):
+        gaz = gazetteer.Gazetteer(gaz_path)
+        compare(f"gazetteer {os.path.basename(gaz_path)}",
+                np.asarray(gaz._columns["lat"]), np.asarray(gaz._columns["lon"]), lats, lons)
+    else:
+        print(f"gazetteer file not found ({gaz_path}), skipped")
+
+
+if __name__ == "__main__":
+    main()
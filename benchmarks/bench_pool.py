@@ -0,0 +1,35 @@
+"""
+进程池排盘吞吐：1 / 2 / 4 / 8 个 worker 的 charts/sec，用来估算批处理节点规格
+用法: python benchmarks/bench_pool.py [张数] [块大小]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import calculation
+from bench_batch import make_records
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else calculation.POOL_CHUNK_SIZE
+    records = make_records(n)
+
+    start = time.perf_counter()
+    expected = calculation.get_chart_data_batch(records)
+    base_sec = time.perf_counter() - start
+
+    print(f"charts: {n}  chunk: {chunk_size}  cpus: {os.cpu_count()}")
+    print(f"in-process batch: {n / base_sec:10.1f} charts/sec")
+    for workers in (1, 2, 4, 8):
+        start = time.perf_counter()
+        charts = list(calculation.get_chart_data_pool(records, workers=workers, chunk_size=chunk_size))
+        elapsed = time.perf_counter() - start
+        assert charts == expected, "进程池结果顺序或内容与单进程不一致"
+        print(f"{workers} worker(s):      {n / elapsed:10.1f} charts/sec ({elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+叠图基准：逐层整画布 Image.alpha_composite (旧实现) vs 按包围盒原地混合 (PIL 引擎) vs NumPy 引擎
+vs 矢量 SVG (drawer_svg，只生成文本，不叠图)
+每种实现在独立子进程里跑，分别报告毫秒/张和渲染期间的峰值内存增量
+用法: python benchmarks/bench_render.py [张数]
+"""
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def legacy_create_chart_image(chart_data):
+    """改造前的叠图方式：每层都是整画布，每次合成都新分配一张画布"""
+    from PIL import Image
+    import drawer_pil
+
+    canvas = drawer_pil.load_layer("base").copy()
+    for center_name in chart_data.get("defined_centers", []):
+        layer = drawer_pil.load_layer(drawer_pil.CENTER_FILES[center_name])
+        if layer:
+            canvas = Image.alpha_composite(canvas, layer)
+    for gate in set(chart_data.get("gate_list", [])):
+        color = drawer_pil.get_gate_color(gate, chart_data)
+        layer = drawer_pil.load_layer(f"gate_{gate}_{color}") if color else None
+        if layer:
+            canvas = Image.alpha_composite(canvas, layer)
+    layer = drawer_pil.load_layer("numbers")
+    if layer:
+        canvas = Image.alpha_composite(canvas, layer)
+    return canvas
+
+
+def _peak_rss_mb():
+    """当前进程的峰值 RSS (MB)；Linux 上读 VmHWM，可以被 _reset_peak 清零"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _reset_peak():
+    """把峰值 RSS 重置为当前 RSS (Linux 4.0+)，其他系统静默跳过"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def run(mode, n):
+    os.chdir(ROOT)
+    import drawer_pil
+    from bench_batch import make_records
+    import calculation
+
+    charts = calculation.get_chart_data_batch(make_records(n))
+    if mode == "legacy":
+        render = legacy_create_chart_image
+    elif mode == "svg":
+        import drawer_svg
+        render = drawer_svg.create_chart_svg
+    else:
+        engine = "numpy" if mode == "numpy" else "pil"
+        render = lambda chart: drawer_pil.create_chart_image(chart, engine=engine)
+    if mode != "svg":
+        drawer_pil.preload_layers()
+    if mode == "numpy":
+        import drawer_numpy
+        drawer_numpy.preload_layers()
+    # 素材缓存本身两种实现共用，只统计渲染过程额外抬高的峰值
+    _reset_peak()
+    rss_before = _peak_rss_mb()
+    render(charts[0])  # 预热
+
+    start = time.perf_counter()
+    for chart in charts:
+        render(chart)
+    ms = (time.perf_counter() - start) / n * 1000
+    rss_after = _peak_rss_mb()
+    print(f"{mode:8s} {ms:8.1f} ms/chart   peak RSS while rendering +{rss_after - rss_before:.1f} MB")
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--mode":
+        run(sys.argv[2], int(sys.argv[3]))
+        return
+    n = sys.argv[1] if len(sys.argv) > 1 else "30"
+    for mode in ("legacy", "bbox", "numpy", "svg"):
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--mode", mode, n], check=True)
+
+
+if __name__ == "__main__":
+    main()
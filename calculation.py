@@ -1,6 +1,15 @@
+import itertools
 import math
+import os
 import ephem
+import numpy as np
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+from functools import lru_cache
+
+import ephemeris_table
+import timezone_index
 
 # ================= 数据定义 =================
 MANDALA_ORDER = [
@@ -10,6 +19,17 @@ MANDALA_ORDER = [
     9, 5, 26, 11, 10, 58, 38, 54, 61, 60
 ]
 
+# 细分层级：每个闸门 6 爻，每爻 6 色，每色 6 调，每调 5 基
+LINES_PER_GATE = 6
+COLORS_PER_LINE = 6
+TONES_PER_COLOR = 6
+BASES_PER_TONE = 5
+BASES_PER_LINE = COLORS_PER_LINE * TONES_PER_COLOR * BASES_PER_TONE
+BASES_PER_CIRCLE = len(MANDALA_ORDER) * LINES_PER_GATE * BASES_PER_LINE
+
+# 预计算查找表：一圈 384 个爻位，第 k 个爻位属于哪个闸门
+GATE_BY_LINE_SLOT = np.repeat(np.array(MANDALA_ORDER, dtype=np.int16), LINES_PER_GATE)
+
 # 36条通道定义 (格式: (闸门A, 闸门B): [连接的中心1, 连接的中心2])
 CHANNELS_DB = {
     (64, 47): ["Head", "Ajna"], (61, 24): ["Head", "Ajna"], (63, 4): ["Head", "Ajna"],
@@ -26,149 +46,563 @@ CHANNELS_DB = {
     (19, 49): ["Root", "Solar"], (39, 55): ["Root", "Solar"], (41, 30): ["Root", "Solar"]
 }
 
+# 9 大中心 (位掩码中第 i 位代表 CENTERS[i])
+CENTERS = ["Head", "Ajna", "Throat", "G", "Heart", "Sacral", "Spleen", "Solar", "Root"]
+CENTER_BITS = {name: 1 << i for i, name in enumerate(CENTERS)}
+# 动力中心：意志力 (心)、荐骨、情绪、根部
+MOTOR_MASK = (CENTER_BITS["Heart"] | CENTER_BITS["Sacral"] |
+              CENTER_BITS["Solar"] | CENTER_BITS["Root"])
+
+# 通道预编译：固定编号顺序，以及两端中心的编号
+CHANNEL_LIST = list(CHANNELS_DB.keys())
+CHANNEL_CENTER_INDEX = [(CENTERS.index(c1), CENTERS.index(c2)) for c1, c2 in CHANNELS_DB.values()]
+
+def _channel_end_tables(end):
+    """预计算：第 k 个字节取值为 v 时，哪些通道的第 end 端闸门在其中"""
+    tables = []
+    for k in range(8):
+        table = [0] * 256
+        for i, pair in enumerate(CHANNEL_LIST):
+            bit = pair[end] - 1
+            if bit // 8 == k:
+                for v in range(256):
+                    if v >> (bit % 8) & 1:
+                        table[v] |= 1 << i
+        tables.append(table)
+    return tables
+
+_CHANNEL_A_BY_BYTE = _channel_end_tables(0)
+_CHANNEL_B_BY_BYTE = _channel_end_tables(1)
+
+# 按已定义中心的连通块数量命名
+DEFINITION_NAMES = ["无定义", "一分人", "二分人", "三分人", "四分人"]
+
+# 机制结算结果 (只含掩码和字符串，可放心缓存共享)
+Mechanics = namedtuple("Mechanics", ["defined_mask", "components", "centers", "channels",
+                                     "type", "authority", "definition"])
+
+# 设计时间：出生前太阳回退 88 度的时刻
+DESIGN_ARC = 88.0
+# 太阳平均角速度 (度/天)，用来给求根提供初值和兜底斜率
+MEAN_SOLAR_MOTION = 0.98564736
+# 求解精度 (度)：太阳走 0.00001 度不到 1 秒，远小于一个 base (约 0.0052 度)
+DESIGN_TOLERANCE = 1e-5
+# 最大迭代次数 (割线法通常 2~3 次就收敛)
+DESIGN_MAX_ITER = 12
+
+# 进程池模式：每块交给一个子进程的盘数
+POOL_CHUNK_SIZE = 256
+
 # 简单的类型判断逻辑
 GENERATOR_GATES = [5, 14, 29, 34, 27, 59, 9, 3, 42, 53, 60, 52]
 
+# 完整的行星列表
+PLANETS = ["Sun", "Earth", "Moon", "Mercury", "Venus", "Mars",
+           "Jupiter", "Saturn", "Uranus", "Neptune", "Pluto"]
+
+# 星体对象工厂 (地球没有独立对象，借用太阳再取对面)
+BODY_FACTORIES = {
+    "Sun": ephem.Sun, "Earth": ephem.Sun, "Moon": ephem.Moon,
+    "Mercury": ephem.Mercury, "Venus": ephem.Venus, "Mars": ephem.Mars,
+    "Jupiter": ephem.Jupiter, "Saturn": ephem.Saturn, "Uranus": ephem.Uranus,
+    "Neptune": ephem.Neptune, "Pluto": ephem.Pluto,
+}
+
+def _ecliptic_longitude(planet, body_name, date_utc):
+    """用已有的星体对象计算黄道经度，对象可以反复复用"""
+    planet.compute(date_utc)
+
+    # 【核心修复点】
+    # PyEphem 的 planet 对象没有 .ecl 属性
+    # 必须创建一个 Ecliptic 对象来获取黄道经度
+    ecl = ephem.Ecliptic(planet)
+    ecl_lon = math.degrees(ecl.lon)
+
+    # 特殊处理：地球的位置永远在太阳对面 (+180度)
+    if body_name == "Earth":
+        ecl_lon = (ecl_lon + 180) % 360
+
+    return ecl_lon
+
 def get_planet_position(body_name, date_utc):
     """
     计算行星在黄道上的绝对经度 (0-360度)
     """
     try:
-        planet = None
-        # 核心映射表
-        if body_name == "Sun": planet = ephem.Sun()
-        elif body_name == "Earth": planet = ephem.Sun() # 地球是太阳的对面
-        elif body_name == "Moon": planet = ephem.Moon()
-        elif body_name == "Mercury": planet = ephem.Mercury()
-        elif body_name == "Venus": planet = ephem.Venus()
-        elif body_name == "Mars": planet = ephem.Mars()
-        elif body_name == "Jupiter": planet = ephem.Jupiter()
-        elif body_name == "Saturn": planet = ephem.Saturn()
-        elif body_name == "Uranus": planet = ephem.Uranus()
-        elif body_name == "Neptune": planet = ephem.Neptune()
-        elif body_name == "Pluto": planet = ephem.Pluto()
-        
-        # 如果找到了对应的星体对象
-        if planet:
-            planet.compute(date_utc)
-            
-            # 【核心修复点】
-            # PyEphem 的 planet 对象没有 .ecl 属性
-            # 必须创建一个 Ecliptic 对象来获取黄道经度
-            ecl = ephem.Ecliptic(planet)
-            ecl_lon = math.degrees(ecl.lon) 
-            
-            # 特殊处理：地球的位置永远在太阳对面 (+180度)
-            if body_name == "Earth":
-                ecl_lon = (ecl_lon + 180) % 360
-                
-            return ecl_lon
-        
-        return None
-        
+        # 优先查预计算星历表，表外的日期再交给 PyEphem
+        deg = ephemeris_table.lookup(body_name, date_utc)
+        if deg is not None:
+            return deg
+
+        factory = BODY_FACTORIES.get(body_name)
+        if factory is None:
+            return None
+        return _ecliptic_longitude(factory(), body_name, date_utc)
+
     except Exception as e:
         # 在本地调试时打印报错，方便排查
         # print(f"计算出错 {body_name}: {e}")
         return None
 
+def get_planet_positions_batch(dates_utc):
+    """
+    批量计算：有预计算星历表时整列向量化查表；
+    表外的时间点每个行星只创建一次星体对象，扫过所有时间点时反复复用。
+    返回 {行星名: [经度或 None, ...]}，顺序与 dates_utc 一致。
+
+    注意外层按时间、内层按行星：libastro 会按日期缓存章动/地球位置，
+    同一时刻连续算完所有行星比按行星扫日期快一倍左右。
+    """
+    dates_utc = list(dates_utc)
+    positions = {body_name: [None] * len(dates_utc) for body_name in PLANETS}
+
+    # 1. 先整列查预计算星历表
+    table = ephemeris_table.get_table()
+    pending = [i for i, d in enumerate(dates_utc) if d is not None]
+    if table is not None and pending:
+        days = np.array([float(ephem.Date(dates_utc[i])) for i in pending])
+        for body_name in PLANETS:
+            if body_name == "Earth":
+                continue
+            column = positions[body_name]
+            for i, deg in zip(pending, table.longitudes(body_name, days).tolist()):
+                if not math.isnan(deg):
+                    column[i] = deg
+        pending = [i for i in pending
+                   if any(positions[b][i] is None for b in PLANETS if b != "Earth")]
+
+    # 2. 表外的时间点交给 PyEphem
+    # 地球直接由太阳推出，省掉一次太阳的计算
+    bodies = [(name, BODY_FACTORIES[name]()) for name in PLANETS if name != "Earth"]
+    for i in pending:
+        for body_name, planet in bodies:
+            try:
+                positions[body_name][i] = _ecliptic_longitude(planet, body_name, dates_utc[i])
+            except Exception:
+                positions[body_name][i] = None
+
+    positions["Earth"] = [None if deg is None else (deg + 180) % 360
+                          for deg in positions["Sun"]]
+    return positions
+
+# 向量化映射结果：每个字段都是与输入同形状的数组，valid 为 False 的位置表示算不出的经度
+GateArrays = namedtuple("GateArrays", ["gate", "line", "color", "tone", "base", "valid"])
+
+def degrees_to_gates(degrees):
+    """
+    一次把一整组经度 (任意形状，None / NaN 表示未知) 映射成闸门/爻/色/调/基数组
+    先把经度量化成一圈 69120 个 base 的编号，再查表和整除得到各层级
+    """
+    deg = np.asarray(degrees, dtype=np.float64)
+    valid = ~np.isnan(deg)
+    deg = np.mod(np.where(valid, deg, 0.0), 360.0)
+
+    n = np.floor(deg * (BASES_PER_CIRCLE / 360.0)).astype(np.int64)
+    n = np.minimum(n, BASES_PER_CIRCLE - 1)
+
+    slot = n // BASES_PER_LINE
+    gate = np.where(valid, GATE_BY_LINE_SLOT[slot], 0)
+    line = slot % LINES_PER_GATE + 1
+    color = (n // (TONES_PER_COLOR * BASES_PER_TONE)) % COLORS_PER_LINE + 1
+    tone = (n // BASES_PER_TONE) % TONES_PER_COLOR + 1
+    base = n % BASES_PER_TONE + 1
+    return GateArrays(gate, line, color, tone, base, valid)
+
+def activation_dict(gate, line):
+    """展示用的激活字典，只在组装结果时才构建"""
+    return {"gate": gate, "line": line, "text": f"{gate}.{line}"}
+
 def degree_to_gate(degree):
-    """将度数转换为闸门"""
+    """将度数转换为闸门 (单点版，内部走向量化映射)"""
     # 如果度数是 None (比如计算失败)，返回 None，不要给 0 (Gate 25)
-    if degree is None: 
+    if degree is None:
         return None
-        
-    degree = degree % 360
-    step = 360.0 / 64.0
-    index = int(degree / step)
-    index = index % 64
-    gate = MANDALA_ORDER[index]
-    
-    rem = degree - (index * step)
-    line = int(rem / (step / 6.0)) + 1
-    if line > 6: line = 6
-    
-    return {"gate": gate, "line": line, "text": f"{gate}.{line}"}
 
-def find_design_date(sun_degree_utc, utc_dt):
-    # 简化算法：太阳回退 88 天
-    return utc_dt - timedelta(days=88)
+    mapped = degrees_to_gates([degree])
+    return activation_dict(int(mapped.gate[0]), int(mapped.line[0]))
+
+def _angle_diff(a, b):
+    """a - b 归一到 (-180, 180]"""
+    return (a - b + 180.0) % 360.0 - 180.0
+
+def solve_solar_arc(target_lon, seed_day, tolerance=DESIGN_TOLERANCE, max_iter=DESIGN_MAX_ITER):
+    """
+    割线法求太阳黄经到达 target_lon 的时刻
+    seed_day / 返回值均为 ephem 日数 (float)；返回 (日数, 星历计算次数)，算不出太阳时日数为 None
+    """
+    t0 = seed_day
+    sun = get_planet_position("Sun", ephem.Date(t0))
+    evals = 1
+    if sun is None:
+        return None, evals
+    f0 = _angle_diff(sun, target_lon)
+    if abs(f0) <= tolerance:
+        return t0, evals
+
+    # 第一步用平均角速度当导数 (牛顿法)，之后用割线斜率
+    t1 = t0 - f0 / MEAN_SOLAR_MOTION
+    for _ in range(max_iter):
+        sun = get_planet_position("Sun", ephem.Date(t1))
+        evals += 1
+        if sun is None:
+            return None, evals
+        f1 = _angle_diff(sun, target_lon)
+        if abs(f1) <= tolerance:
+            break
+        slope = (f1 - f0) / (t1 - t0) if t1 != t0 else MEAN_SOLAR_MOTION
+        # 太阳从不逆行，斜率异常时退回平均角速度
+        if slope <= 0:
+            slope = MEAN_SOLAR_MOTION
+        t0, f0 = t1, f1
+        t1 = t1 - f1 / slope
+    return t1, evals
+
+@lru_cache(maxsize=65536)
+def _design_offset_at(day):
+    """
+    在 day (ephem 日数) 出生时，出生时刻减设计时刻的天数
+    按出生日缓存 (0 点 / 12 点 / 次日 0 点三个节点)，同一天出生的盘共享，二次插值作为初值
+    """
+    sun = get_planet_position("Sun", ephem.Date(day))
+    if sun is None:
+        return None
+    seed = day - DESIGN_ARC / MEAN_SOLAR_MOTION
+    # 缓存的节点会被反复用来插值，精度收得更紧
+    design_day, _ = solve_solar_arc(sun - DESIGN_ARC, seed, tolerance=DESIGN_TOLERANCE / 1000)
+    if design_day is None:
+        return None
+    return day - design_day
+
+def find_design_date(sun_degree_utc, utc_dt, tolerance=DESIGN_TOLERANCE, max_iter=DESIGN_MAX_ITER):
+    """
+    求设计时间：太阳黄经比出生时少 88 度的时刻
+    先用按出生日缓存的偏移量插值出初值，缓存命中时一次星历计算就能确认收敛
+    """
+    birth_day = float(ephem.Date(utc_dt))
+    # ephem 日数从正午起算，x.5 才是 UTC 0 点
+    midnight = math.floor(birth_day - 0.5) + 0.5
+    offsets = [_design_offset_at(midnight + node) for node in (0.0, 0.5, 1.0)]
+
+    if None in offsets:
+        seed = birth_day - DESIGN_ARC / MEAN_SOLAR_MOTION
+    else:
+        # 过三个节点的二次插值 (拉格朗日形式)，x 以半天为单位
+        x = (birth_day - midnight) * 2.0
+        o0, o1, o2 = offsets
+        offset = (o0 * (x - 1) * (x - 2) / 2.0
+                  - o1 * x * (x - 2)
+                  + o2 * x * (x - 1) / 2.0)
+        seed = birth_day - offset
+
+    design_day, _ = solve_solar_arc(sun_degree_utc - DESIGN_ARC, seed, tolerance, max_iter)
+    if design_day is None:
+        # 星历算不出来时退回旧的近似：太阳回退 88 天
+        return utc_dt - timedelta(days=88)
+    return ephem.Date(design_day).datetime()
+
+def gates_to_mask(gates):
+    """闸门列表 -> 64 位激活掩码 (第 g-1 位代表闸门 g)，忽略 None"""
+    mask = 0
+    for g in gates:
+        if g is not None:
+            mask |= 1 << (g - 1)
+    return mask
+
+def channels_from_mask(gate_mask):
+    """
+    64 位闸门掩码 -> 36 位通道掩码 (第 i 位代表 CHANNEL_LIST[i])
+    按字节查表：A 端闸门亮着的通道 & B 端闸门亮着的通道，不用逐条遍历
+    """
+    ends_a = ends_b = 0
+    for k in range(8):
+        byte = (gate_mask >> (8 * k)) & 0xFF
+        if byte:
+            ends_a |= _CHANNEL_A_BY_BYTE[k][byte]
+            ends_b |= _CHANNEL_B_BY_BYTE[k][byte]
+    return ends_a & ends_b
+
+def _iter_bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+def _authority(defined, components):
+    """按优先级判断内在权威"""
+    def connected(a, b):
+        return any(comp & a and comp & b for comp in components)
+
+    if not defined:
+        return "月亮周期 (无内在权威)"
+    if defined & CENTER_BITS["Solar"]:
+        return "情绪权威"
+    if defined & CENTER_BITS["Sacral"]:
+        return "荐骨权威"
+    if defined & CENTER_BITS["Spleen"]:
+        return "直觉权威"
+    if defined & CENTER_BITS["Heart"]:
+        if connected(CENTER_BITS["Heart"], CENTER_BITS["Throat"]):
+            return "意志力权威 (显示)"
+        return "意志力权威 (投射)"
+    if defined & CENTER_BITS["G"] and connected(CENTER_BITS["G"], CENTER_BITS["Throat"]):
+        return "自我投射权威"
+    return "环境权威 (无内在权威)"
+
+@lru_cache(maxsize=65536)
+def resolve_channels(channel_mask):
+    """
+    36 位通道掩码 -> Mechanics (中心/连通/类型/权威/分裂)
+    同样的通道组合结果完全相同，批量评分时直接命中缓存
+    """
+    defined = 0
+    adjacency = [0] * len(CENTERS)
+    for i in _iter_bits(channel_mask):
+        a, b = CHANNEL_CENTER_INDEX[i]
+        defined |= (1 << a) | (1 << b)
+        adjacency[a] |= 1 << b
+        adjacency[b] |= 1 << a
+
+    # 位掩码泛洪：逐个拆出已定义中心的连通块
+    components = []
+    remaining = defined
+    while remaining:
+        component = frontier = remaining & -remaining
+        while frontier:
+            reach = 0
+            for c in _iter_bits(frontier):
+                reach |= adjacency[c]
+            frontier = reach & ~component
+            component |= frontier
+        components.append(component)
+        remaining &= ~component
+
+    # 动力中心能否一路连到喉咙
+    throat = CENTER_BITS["Throat"]
+    motor_to_throat = any(comp & throat and comp & MOTOR_MASK for comp in components)
+
+    if not defined:
+        my_type = "反映者"
+    elif defined & CENTER_BITS["Sacral"]:
+        my_type = "显示生产者" if motor_to_throat else "生产者"
+    elif motor_to_throat:
+        my_type = "显示者"
+    else:
+        my_type = "投射者"
+
+    return Mechanics(
+        defined_mask=defined,
+        components=tuple(components),
+        centers=tuple(CENTERS[i] for i in _iter_bits(defined)),
+        channels=tuple(CHANNEL_LIST[i] for i in _iter_bits(channel_mask)),
+        type=my_type,
+        authority=_authority(defined, components),
+        definition=DEFINITION_NAMES[min(len(components), len(DEFINITION_NAMES) - 1)],
+    )
+
+def mechanics_from_gate_mask(gate_mask):
+    """批量评分入口：64 位闸门掩码 -> Mechanics"""
+    return resolve_channels(channels_from_mask(gate_mask))
 
 def get_mechanics(active_gates):
     """计算通道和中心"""
-    # 过滤掉 None (计算失败的数据)
-    valid_gates = [g for g in active_gates if g is not None]
-    
-    active_gates_set = set(valid_gates)
-    active_channels = []
-    defined_centers = set()
-    
-    for (g1, g2), centers in CHANNELS_DB.items():
-        if g1 in active_gates_set and g2 in active_gates_set:
-            active_channels.append((g1, g2))
-            defined_centers.add(centers[0])
-            defined_centers.add(centers[1])
-            
-    return list(defined_centers), active_channels
-
-def get_chart_data(date_obj, time_obj, lat=None, lon=None):
-    """v5.0 主计算函数"""
+    # gates_to_mask 会过滤掉 None (计算失败的数据)
+    mechanics = mechanics_from_gate_mask(gates_to_mask(active_gates))
+    return list(mechanics.centers), list(mechanics.channels)
+
+def to_utc(date_obj, time_obj, tz=None, lat=None, lon=None):
+    """
+    本地出生时间 -> UTC
+    tz: 相对 UTC 的小时数 (固定偏移)，或 IANA 时区名 (例如 "Europe/London")；
+    缺省按出生地坐标离线查时区，再按当时的历史规则换算 (夏令时等)；
+    连坐标也没有时按 timezone_index.DEFAULT_TIMEZONE (北京时间，含 1986-1991 夏令时)
+    """
     local_dt = datetime.combine(date_obj, time_obj)
-    # 假设 UTC+8
-    utc_dt = local_dt - timedelta(hours=8)
+    if isinstance(tz, (int, float)):
+        return local_dt - timedelta(hours=tz)
+    zone = tz or timezone_index.timezone_at(lat, lon)
+    return timezone_index.local_to_utc(local_dt, zone)
 
-    activations = {}
-    gate_list = [] 
-    
-    # 完整的行星列表
-    PLANETS = ["Sun", "Earth", "Moon", "Mercury", "Venus", "Mars", 
-               "Jupiter", "Saturn", "Uranus", "Neptune", "Pluto"]
+# 一张盘 22 个激活位的顺序：先个性 (黑) 后设计 (红)
+ACTIVATION_KEYS = ([f"{body} (个性黑)" for body in PLANETS] +
+                   [f"{body} (设计红)" for body in PLANETS])
 
-    # 1. 计算个性 (黑色)
-    for body in PLANETS:
-        deg = get_planet_position(body, utc_dt)
-        if deg is not None:
-            data = degree_to_gate(deg)
-            activations[f"{body} (个性黑)"] = data
-            gate_list.append(data['gate'])
-        else:
+def _chart_degrees(personality, design):
+    """按 ACTIVATION_KEYS 的顺序排出 22 个经度，算不出的位置为 NaN"""
+    degrees = [personality.get(body) for body in PLANETS]
+    degrees += [design.get(body) if design is not None else None for body in PLANETS]
+    return [math.nan if deg is None else deg for deg in degrees]
+
+def build_gate_colors(personality, design):
+    """
+    整张盘只算一次的闸门颜色表 {闸门: "black" / "red" / "mix"}
+    只在个性里出现为黑，只在设计里出现为红，两边都有为斑马纹
+    """
+    black = {act["gate"] for act in personality.values() if act}
+    red = {act["gate"] for act in (design or {}).values() if act}
+    colors = {}
+    for g in black:
+        colors[g] = "mix" if g in red else "black"
+    for g in red - black:
+        colors[g] = "red"
+    return colors
+
+def chart_gate_colors(chart_data):
+    """
+    一张盘面的闸门颜色表 {闸门: "red"/"black"/"mix"} (位图、矢量渲染和图片缓存共用)
+    直接读算好的 gate_colors；老格式的盘面从 personality / design 现算
+    JSON 往返过 (接口、缓存以外的来源) 的盘面键是字符串，转回整数闸门号
+    """
+    colors = chart_data.get('gate_colors')
+    if colors is None:
+        colors = build_gate_colors(chart_data.get('personality') or {}, chart_data.get('design'))
+    elif any(isinstance(g, str) for g in colors):
+        colors = {int(g): color for g, color in colors.items()}
+    return colors
+
+def _build_chart(gates, lines, valid, has_design, lat=None, lon=None):
+    """
+    把一张盘的映射结果组装成盘面字典
+    gates / lines / valid: 按 ACTIVATION_KEYS 顺序的 22 个值
+    has_design 为 False 表示设计时间没算出来，design 为 None
+
+    结构化字段 personality / design: {行星名: 激活字典 或 None(未知)}，
+    gate_colors: {闸门: 颜色}；计算和叠图都只读这些字段，
+    activations (带中文标签的键) 只是给界面和提示词用的展示形式
+    """
+    n = len(PLANETS)
+    personality = {body: activation_dict(gates[i], lines[i]) if valid[i] else None
+                   for i, body in enumerate(PLANETS)}
+    design = None
+    if has_design:
+        design = {body: activation_dict(gates[n + i], lines[n + i]) if valid[n + i] else None
+                  for i, body in enumerate(PLANETS)}
+
+    # 1. 个性 (黑色) 2. 设计 (红色)
+    gate_list = [act["gate"] for act in personality.values() if act]
+    if design is not None:
+        gate_list += [act["gate"] for act in design.values() if act]
+
+    activations = {}
+    for side, label in ((personality, "个性黑"), (design, "设计红")):
+        if side is None:
+            continue
+        for body, act in side.items():
             # 标记为未知，而不是给 25.1
-            activations[f"{body} (个性黑)"] = {"text": "未知"}
+            activations[f"{body} ({label})"] = dict(act) if act else {"text": "未知"}
+
+    # 3. 结算机制 (位掩码)
+    mechanics = mechanics_from_gate_mask(gates_to_mask(gate_list))
 
-    # 2. 计算设计 (红色)
-    current_sun = get_planet_position("Sun", utc_dt)
-    
-    if current_sun is not None:
-        design_dt = find_design_date(current_sun, utc_dt)
-        
-        for body in PLANETS:
-            deg = get_planet_position(body, design_dt)
-            if deg is not None:
-                data = degree_to_gate(deg)
-                activations[f"{body} (设计红)"] = data
-                gate_list.append(data['gate'])
-            else:
-                activations[f"{body} (设计红)"] = {"text": "未知"}
-
-    # 3. 结算机制
-    defined_centers, active_channels = get_mechanics(gate_list)
-
-    # 简单的类型判断
-    my_type = "生产者" if "Sacral" in defined_centers else "显示者 (或投射/反映)"
-    
-    p_sun = activations.get("Sun (个性黑)", {"text":"?"})
-    d_sun = activations.get("Sun (设计红)", {"text":"?"})
-    
     # 提取爻线用于显示
     profile = "?/?"
-    if "line" in p_sun and "line" in d_sun:
+    p_sun = personality["Sun"]
+    d_sun = design["Sun"] if design is not None else None
+    if p_sun and d_sun:
         profile = f"{p_sun['line']} / {d_sun['line']}"
 
     return {
-        "type": my_type,
+        "type": mechanics.type,
+        "authority": mechanics.authority,
+        "definition": mechanics.definition,
         "profile": profile,
+        "personality": personality,
+        "design": design,
+        "gate_colors": build_gate_colors(personality, design),
         "activations": activations,
-        "defined_centers": defined_centers,
-        "active_channels": active_channels,
-        "gate_list": gate_list,     
+        "defined_centers": list(mechanics.centers),
+        "active_channels": list(mechanics.channels),
+        "gate_list": gate_list,
         "location": {"lat": lat, "lon": lon}
     }
+
+def get_chart_data(date_obj, time_obj, lat=None, lon=None, tz=None):
+    """v5.0 主计算函数 (时区缺省按出生地坐标解析，见 to_utc)"""
+    return get_chart_data_utc(to_utc(date_obj, time_obj, tz, lat, lon), lat, lon)
+
+def get_chart_data_utc(utc_dt, lat=None, lon=None):
+    """按 UTC 时刻排盘 (时区换算已在调用方完成)"""
+    # 1. 计算个性 (黑色)
+    personality = {body: get_planet_position(body, utc_dt) for body in PLANETS}
+
+    # 2. 计算设计 (红色)
+    design = None
+    current_sun = personality["Sun"]
+    if current_sun is not None:
+        design_dt = find_design_date(current_sun, utc_dt)
+        design = {body: get_planet_position(body, design_dt) for body in PLANETS}
+
+    # 3. 22 个经度一次映射成闸门
+    mapped = degrees_to_gates(_chart_degrees(personality, design))
+    return _build_chart(mapped.gate.tolist(), mapped.line.tolist(), mapped.valid.tolist(),
+                        design is not None, lat, lon)
+
+def get_chart_data_batch(records):
+    """
+    批量主计算函数 (导入 / 研究队列用)
+    records: 可迭代的 (date, time, lat, lon, tz) 元组，tz 同 to_utc (None = 按坐标查时区)
+    返回与 get_chart_data 相同结构的字典列表，顺序与输入一致
+    """
+    records = list(records)
+    utc_dates = [to_utc(d, t, tz, lat, lon) for d, t, lat, lon, tz in records]
+
+    # 1. 个性：所有出生时刻一次算完
+    personality_cols = get_planet_positions_batch(utc_dates)
+
+    # 2. 设计：先求出每张盘的设计时间，再统一批量计算
+    design_dates = []
+    for i, utc_dt in enumerate(utc_dates):
+        current_sun = personality_cols["Sun"][i]
+        if current_sun is None:
+            design_dates.append(None)
+        else:
+            design_dates.append(find_design_date(current_sun, utc_dt))
+    design_cols = get_planet_positions_batch(design_dates)
+
+    # 3. 整批经度 (张数 x 22) 一次映射成闸门
+    columns = [personality_cols[body] for body in PLANETS] + [design_cols[body] for body in PLANETS]
+    degrees = np.array([[math.nan if deg is None else deg for deg in column] for column in columns],
+                       dtype=np.float64).T
+    mapped = degrees_to_gates(degrees.reshape(len(records), len(ACTIVATION_KEYS)))
+    gates, lines, valid = mapped.gate.tolist(), mapped.line.tolist(), mapped.valid.tolist()
+
+    # 4. 逐张组装
+    charts = []
+    for i, (_d, _t, lat, lon, _tz) in enumerate(records):
+        charts.append(_build_chart(gates[i], lines[i], valid[i],
+                                   design_dates[i] is not None, lat, lon))
+    return charts
+
+def _chunked(records, size):
+    iterator = iter(records)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def get_chart_data_pool(records, workers=None, chunk_size=POOL_CHUNK_SIZE, progress=None):
+    """
+    多进程批量排盘 (PyEphem 计算时持有 GIL，线程帮不上忙)
+    records 与 get_chart_data_batch 相同，按 chunk_size 分块提交给进程池，
+    结果按输入顺序逐张流式返回；同时在途的块最多 workers * 2 个，内存不随输入增长
+    progress(已完成张数, 总张数或 None) 每完成一块回调一次
+    """
+    workers = workers or os.cpu_count() or 1
+    total = len(records) if hasattr(records, "__len__") else None
+    chunks = _chunked(records, chunk_size)
+    done = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque(pool.submit(get_chart_data_batch, chunk)
+                        for chunk in itertools.islice(chunks, workers * 2))
+        while pending:
+            charts = pending.popleft().result()
+            # 取走一块就补一块，保持池子满载
+            next_chunk = next(chunks, None)
+            if next_chunk is not None:
+                pending.append(pool.submit(get_chart_data_batch, next_chunk))
+
+            done += len(charts)
+            if progress:
+                progress(done, total)
+            yield from charts
@@ -0,0 +1,95 @@
+# chart_cache.py
+# 盘面缓存：Streamlit 每次点击都会从头重跑脚本，热门生日也会被不同用户反复排盘。
+# 以 "UTC 时刻 + 影响结果的设置" 为键缓存 calculation 的结果：
+#   - 内存层：LRU，条数有上限
+#   - 磁盘层 (可选)：SQLite，进程重启后依然有效
+# 缓存里存的是 JSON 文本，每次取出都会重新解析成新的字典，调用方随便改也不会污染缓存。
+
+import json
+import os
+
+import calculation
+from tiered_cache import TieredCache
+
+# === 配置区域 ===
+# 内存层最多保留多少张盘
+DEFAULT_MAXSIZE = 4096
+
+# 磁盘层路径 (不设置就只用内存)
+DB_PATH = os.environ.get("HD_CHART_CACHE_DB")
+
+# 缓存格式版本：盘面结构或算法变了就加一，旧缓存自动作废
+SCHEMA_VERSION = 2
+
+
+def settings_signature():
+    """会影响排盘结果的设置，拼进缓存键里"""
+    return f"v{SCHEMA_VERSION}|arc={calculation.DESIGN_ARC}|tol={calculation.DESIGN_TOLERANCE}"
+
+
+def make_key(utc_dt):
+    """规范化的缓存键：UTC 时刻精确到分钟 (有秒数时保留秒) + 设置签名"""
+    if utc_dt.second or utc_dt.microsecond:
+        instant = utc_dt.isoformat()
+    else:
+        instant = utc_dt.strftime("%Y-%m-%dT%H:%M")
+    return f"{instant}|{settings_signature()}"
+
+
+def _encode(chart):
+    # 位置信息不参与计算，单独在取出时补上
+    body = {k: v for k, v in chart.items() if k != "location"}
+    return json.dumps(body, ensure_ascii=False, separators=(",", ":"))
+
+
+def restore_chart(chart):
+    """JSON 往返之后恢复原来的类型 (原地修改并返回)，缓存和 HTTP 接口的客户端共用"""
+    # JSON 没有元组，通道恢复成 (闸门A, 闸门B)；对象的键只能是字符串，闸门号转回整数
+    chart["active_channels"] = [tuple(ch) for ch in chart["active_channels"]]
+    chart["gate_colors"] = {int(g): color for g, color in chart["gate_colors"].items()}
+    return chart
+
+
+def _decode(text, lat, lon):
+    chart = restore_chart(json.loads(text))
+    chart["location"] = {"lat": lat, "lon": lon}
+    return chart
+
+
+class ChartCache:
+    """两级盘面缓存 (底层是 TieredCache，线程安全)"""
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, db_path=None):
+        self._cache = TieredCache(maxsize, db_path, table="chart_cache")
+
+    def get_chart_utc(self, utc_dt, lat=None, lon=None):
+        """按 UTC 时刻取盘，未命中时调用 calculation 计算并写入缓存"""
+        key = make_key(utc_dt)
+        text = self._cache.get(key)
+        if text is None:
+            text = _encode(calculation.get_chart_data_utc(utc_dt, lat, lon))
+            self._cache.set(key, text)
+        return _decode(text, lat, lon)
+
+    def get_chart(self, date_obj, time_obj, lat=None, lon=None, tz=None):
+        """
+        与 calculation.get_chart_data 参数相同的缓存版本
+        先按出生地时区换算成 UTC 再查缓存：不同时区、同一 UTC 时刻的盘共用一条缓存
+        """
+        return self.get_chart_utc(calculation.to_utc(date_obj, time_obj, tz, lat, lon), lat, lon)
+
+    def stats(self):
+        return self._cache.stats()
+
+    def clear(self):
+        """清空两级缓存和计数"""
+        self._cache.clear()
+
+
+# 进程级默认缓存 (Streamlit 所有会话共享)
+default_cache = ChartCache(db_path=DB_PATH)
+
+
+def get_chart_data(date_obj, time_obj, lat=None, lon=None, tz=None):
+    """带缓存的 calculation.get_chart_data"""
+    return default_cache.get_chart(date_obj, time_obj, lat, lon, tz)
@@ -0,0 +1,154 @@
+# chat_history.py
+# 多轮对话的上下文管理：每一轮发给模型的提示词大小基本固定，不随对话变长而增长。
+# 发出去的消息由四部分组成：
+#   1. 系统提示词 (角色和回复规则)
+#   2. 固定的盘面事实 (结构化的几行：类型、权威、人生角色、中心、通道、太阳/地球)，模型随时能引用
+#   3. 更早对话的滚动摘要 (存在会话里，只有新的轮次被挤出窗口时才重新生成一次)
+#   4. 最近 RECENT_TURNS 轮原文 (同时受 VERBATIM_TOKEN_BUDGET 约束，至少保留最后一轮)
+# 被挤出窗口的轮次攒够 SUMMARY_BATCH_TURNS 轮才合并进摘要一次 (摘要也要调用模型，不每轮都做)；
+# 摘要失败时这些轮次继续原文发送，不会丢内容。
+
+import math
+import re
+
+import calculation
+
+# === 配置区域 ===
+# 最近几轮原文发送 (一轮 = 用户一句 + 回复)
+RECENT_TURNS = 4
+
+# 原文部分的 token 上限 (估算值)
+VERBATIM_TOKEN_BUDGET = 2000
+
+# 被挤出窗口的轮次攒够几轮再合并进摘要
+SUMMARY_BATCH_TURNS = 2
+
+# 摘要长度上限 (字)；摘要用低温度，输出稳定
+SUMMARY_MAX_CHARS = 300
+SUMMARY_TEMPERATURE = 0.3
+
+# token 估算系数 (DeepSeek 官方给的经验值：中文一个字约 0.6 token，英文一个字符约 0.3 token)
+TOKENS_PER_CJK_CHAR = 0.6
+TOKENS_PER_OTHER_CHAR = 0.3
+TOKENS_PER_MESSAGE = 4  # 每条消息的角色标记等固定开销
+
+SUMMARY_INSTRUCTION = (
+    f"把下面的对话压缩成不超过 {SUMMARY_MAX_CHARS} 字的要点摘要，供后续对话参考。"
+    "保留：用户透露的个人情况和经历、关心的问题、已经给出的主要解读和建议、双方约定的话题。"
+    "不要寒暄，不要重复盘面数据，只输出摘要本身。"
+)
+
+_CJK = re.compile(r"[一-鿿　-〿＀-￯]")
+
+
+def estimate_tokens(text):
+    """粗略估算一段文字的 token 数 (不依赖分词器)"""
+    cjk = len(_CJK.findall(text))
+    return math.ceil(cjk * TOKENS_PER_CJK_CHAR + (len(text) - cjk) * TOKENS_PER_OTHER_CHAR)
+
+
+def count_message_tokens(messages):
+    return sum(estimate_tokens(m["content"]) + TOKENS_PER_MESSAGE for m in messages)
+
+
+def _activation_text(side, body):
+    act = (side or {}).get(body)
+    return act['text'] if act else '未知'
+
+
+def chart_facts(name, city, chart_data):
+    """固定在上下文里的盘面事实 (结构化文本，每行一项)"""
+    defined = set(chart_data['defined_centers'])
+    personality, design = chart_data['personality'], chart_data['design']
+    channels = [f"{a}-{b}" for a, b in chart_data['active_channels']]
+    lines = [
+        "# 盘面事实 (固定，回答时以此为准)",
+        f"姓名：{name}",
+        f"出生城市：{city}",
+        f"类型：{chart_data['type']}",
+        f"内在权威：{chart_data.get('authority', '?')}",
+        f"定义：{chart_data.get('definition', '?')}",
+        f"人生角色：{chart_data['profile']}",
+        f"定义中心：{', '.join(c for c in calculation.CENTERS if c in defined) or '无'}",
+        f"开放中心：{', '.join(c for c in calculation.CENTERS if c not in defined) or '无'}",
+        f"接通通道：{', '.join(channels) or '无'}",
+        f"个性太阳/地球：{_activation_text(personality, 'Sun')} / {_activation_text(personality, 'Earth')}",
+        f"设计太阳/地球：{_activation_text(design, 'Sun')} / {_activation_text(design, 'Earth')}",
+    ]
+    return "\n".join(lines)
+
+
+def _turn_starts(messages):
+    """每一轮开始的下标：用户消息开启新的一轮 (开头的首次解读单独算一轮)"""
+    return [i for i, m in enumerate(messages) if i == 0 or m["role"] == "user"]
+
+
+class HistoryManager:
+    """
+    一个会话的上下文管理器 (放在 st.session_state 里，随会话存活)
+    summarize(旧摘要, 要合并的消息列表) -> 新摘要；由调用方提供 (见 make_summarizer)，可以抛异常
+    """
+
+    def __init__(self, system_prompt, facts, summarize=None, recent_turns=RECENT_TURNS,
+                 verbatim_budget=VERBATIM_TOKEN_BUDGET, batch_turns=SUMMARY_BATCH_TURNS):
+        self.system_prompt = system_prompt
+        self.facts = facts
+        self.summarize = summarize
+        self.recent_turns = recent_turns
+        self.verbatim_budget = verbatim_budget
+        self.batch_turns = batch_turns
+        self.summary = ""
+        self.summarized = 0  # messages[:summarized] 已经并进摘要
+        self.summary_calls = 0
+
+    def _window_start(self, messages):
+        """原文窗口从哪条消息开始：最多 recent_turns 轮、不超过 token 预算，至少保留最后一轮"""
+        starts = [i for i in _turn_starts(messages) if i >= self.summarized] or [self.summarized]
+        keep = starts[-1]
+        for start in reversed(starts[-self.recent_turns:-1]):
+            if count_message_tokens(messages[start:]) > self.verbatim_budget:
+                break
+            keep = start
+        return keep
+
+    def _compact(self, messages):
+        """窗口外攒够 batch_turns 轮就合并进摘要 (失败则下次再试，这些轮次先原文发送)"""
+        if self.summarize is None:
+            return
+        keep = self._window_start(messages)
+        pending = [i for i in _turn_starts(messages) if self.summarized <= i < keep]
+        if len(pending) < self.batch_turns:
+            return
+        try:
+            summary = self.summarize(self.summary, messages[self.summarized:keep])
+        except Exception:
+            return
+        self.summary_calls += 1
+        # 模型不一定守字数，硬截断保证上限
+        self.summary = summary.strip()[:SUMMARY_MAX_CHARS * 3 // 2]
+        self.summarized = keep
+
+    def build(self, messages):
+        """本轮要发给模型的消息列表 (messages 是界面上显示的完整历史，最后一条是用户刚说的话)"""
+        self._compact(messages)
+        api_messages = [{"role": "system", "content": self.system_prompt}]
+        if self.facts:
+            api_messages.append({"role": "system", "content": self.facts})
+        if self.summary:
+            api_messages.append({"role": "system", "content": f"# 之前对话的摘要\n{self.summary}"})
+        api_messages.extend(messages[self.summarized:])
+        return api_messages
+
+
+def make_summarizer(stream):
+    """
+    用模型生成滚动摘要：stream(messages, temperature=...) 逐段返回文字 (例如 llm_client.LLMService.stream)
+    """
+    def summarize(previous, messages):
+        transcript = "\n".join(f"{'用户' if m['role'] == 'user' else '活活'}：{m['content']}" for m in messages)
+        content = f"已有摘要：\n{previous or '(无)'}\n\n新增对话：\n{transcript}"
+        return "".join(stream([
+            {"role": "system", "content": SUMMARY_INSTRUCTION},
+            {"role": "user", "content": content},
+        ], temperature=SUMMARY_TEMPERATURE))
+    return summarize
@@ -0,0 +1,235 @@
+# city_index.py
+# 离线城市索引：导入时把 city_data.CHINA_CITIES 建成三张表，之后每次查询都在内存里完成 (亚毫秒)
+#   - 精确表：规范化后的名字 -> 坐标 ("北京市" / "Beijing City" / "BEIJING" 都归一成同一个键)
+#   - 有序键数组：二分查前缀 ("哈尔" -> 哈尔滨, "harb" -> harbin)
+#   - 二元组倒排表：打错字时按共同二元组挑候选，再用编辑距离确认 ("shanghia" -> shanghai)
+# 都找不到再查离线世界地名库 (gazetteer.py)，最后才交给网络地理编码 (Nominatim)。
+# 反向查询 (坐标 -> 最近的城市) 用 spatial_index 的 KD 树，第一次用到时才建。
+
+import bisect
+import re
+import unicodedata
+from collections import namedtuple
+
+import city_data
+
+# === 配置区域 ===
+# 前缀匹配至少要输入几个字符 (拉丁字母；中文一个字就算)
+MIN_PREFIX_LEN = 3
+
+# 模糊匹配：名字越长允许的错字越多；中文名太短，两个字里错一个就可能是另一座城市，不做模糊
+MAX_EDITS_SHORT = 1   # 规范化后 5~6 个字符 (更短的不做模糊)
+MAX_EDITS_LONG = 2    # 7 个字符以上
+FUZZY_CANDIDATES = 20  # 按共同二元组数量取前多少个候选去算编辑距离
+
+# 行政区划后缀：中文按这些词把 "广东省深圳市" 切成 ["广东", "深圳"]，英文直接去掉
+CN_ADMIN_SUFFIXES = ("特别行政区", "自治区", "自治州", "自治县", "地区", "省", "市", "区", "县", "盟")
+EN_ADMIN_SUFFIXES = ("city", "shi", "province", "sheng", "district", "county")
+
+# 一次查询的结果：name 为库里的原名，match 为 "exact" / "prefix" / "fuzzy" / "nearest"
+CityMatch = namedtuple("CityMatch", ["name", "lat", "lon", "match"])
+
+_CN_SEGMENT = re.compile("(.*?)(%s|$)" % "|".join(CN_ADMIN_SUFFIXES))
+# 切出来的段按后缀排先后：城市级 0，没有后缀 1，区县 2，省级 3
+_SUFFIX_RANK = {"市": 0, "特别行政区": 0, "盟": 0, "地区": 0, "自治州": 0, "": 1,
+                "区": 2, "县": 2, "自治县": 2, "省": 3, "自治区": 3}
+_CJK = re.compile(r"[一-鿿]")
+_EN_SUFFIX = re.compile(r"\s+(?:%s)$" % "|".join(EN_ADMIN_SUFFIXES))
+
+
+def _is_cjk(text):
+    return bool(_CJK.search(text))
+
+
+def _compact(text):
+    """全角转半角、小写、去掉空格和标点 ("Xi'an" -> "xian", "Hong Kong" -> "hongkong")"""
+    text = unicodedata.normalize("NFKC", text).strip().lower()
+    return re.sub(r"[\s'’\-_.,·]+", "", text)
+
+
+def normalize(name):
+    """
+    规范化的候选键列表，按最可能是城市名的先后排列
+    中文按行政区划切段：带 "市" 的段最先，其次没有后缀的，再次区/县，最后省/自治区
+    "广东省深圳市" -> ["深圳", "广东"]；"北京市朝阳区" -> ["北京", "朝阳"]；"Beijing City" -> ["beijing"]
+    """
+    text = unicodedata.normalize("NFKC", name).strip().lower()
+    if not text:
+        return []
+    if _is_cjk(text):
+        ranked = []
+        for segment, suffix in _CN_SEGMENT.findall(text):
+            key = _compact(segment)
+            if key:
+                ranked.append((_SUFFIX_RANK.get(suffix, 1), len(ranked), key))
+        keys = [key for _, _, key in sorted(ranked)]
+        # 名字本身就是一个后缀 (例如只输入了 "市")，原样保留
+        return keys or [_compact(text)]
+    stripped = _EN_SUFFIX.sub("", text)
+    keys = [_compact(stripped)]
+    if stripped != text:
+        keys.append(_compact(text))
+    return [k for k in keys if k]
+
+
+def _bigrams(key):
+    padded = f"^{key}$"
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+def _edit_distance(a, b, limit):
+    """Levenshtein 距离，超过 limit 提前返回 limit + 1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+        if min(cur) > limit:
+            return limit + 1
+        prev = cur
+    return prev[-1]
+
+
+class CityIndex:
+    """城市名索引 (只读，构建后线程安全)"""
+
+    def __init__(self, cities):
+        self._exact = {}   # 规范化键 -> (原名, 纬度, 经度)
+        for name, (lat, lon) in cities.items():
+            for key in normalize(name)[:1]:
+                # 规范化后撞键的保留第一个 (库里先写中文名，再写拼音)
+                self._exact.setdefault(key, (name, lat, lon))
+
+        self._sorted_keys = sorted(self._exact)
+        self._grams = {}   # 二元组 -> [键]
+        for key in self._sorted_keys:
+            if not _is_cjk(key):
+                for gram in _bigrams(key):
+                    self._grams.setdefault(gram, []).append(key)
+
+        # 反向查询用的地点表：中文名和拼音坐标相同，只留一个 (有中文名的用中文名)
+        places = {}
+        for name, (lat, lon) in cities.items():
+            current = places.get((lat, lon))
+            if current is None or (_is_cjk(name) and not _is_cjk(current)):
+                places[(lat, lon)] = name
+        self._places = [(name, lat, lon) for (lat, lon), name in places.items()]
+        self._spatial = None
+
+    def __len__(self):
+        return len(self._exact)
+
+    def _result(self, key, match):
+        name, lat, lon = self._exact[key]
+        return CityMatch(name, lat, lon, match)
+
+    def exact(self, key):
+        return self._result(key, "exact") if key in self._exact else None
+
+    def prefix(self, key, limit=None):
+        """所有以 key 开头的键 (按字典序)"""
+        start = bisect.bisect_left(self._sorted_keys, key)
+        matches = []
+        for candidate in self._sorted_keys[start:]:
+            if not candidate.startswith(key) or (limit and len(matches) >= limit):
+                break
+            matches.append(candidate)
+        return matches
+
+    def fuzzy(self, key):
+        """编辑距离在允许范围内的最近键；一样近的取共同二元组多的"""
+        if _is_cjk(key) or len(key) < 5:
+            return None
+        limit = MAX_EDITS_SHORT if len(key) <= 6 else MAX_EDITS_LONG
+
+        grams = _bigrams(key)
+        shared = {}
+        for gram in grams:
+            for candidate in self._grams.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        # 每处编辑最多破坏两个二元组；长度差超过允许编辑数的也不可能
+        min_shared = len(grams) - 2 * limit
+        ranked = sorted(
+            (c for c, n in shared.items() if n >= min_shared and abs(len(c) - len(key)) <= limit),
+            key=lambda c: (-shared[c], c),
+        )[:FUZZY_CANDIDATES]
+
+        best, best_dist = None, limit + 1
+        for candidate in ranked:
+            dist = _edit_distance(key, candidate, limit)
+            if dist < best_dist:
+                best, best_dist = candidate, dist
+        return best
+
+    def lookup(self, name):
+        """
+        查一个城市名，找不到返回 None
+        顺序：精确 (含去掉行政区划后缀) -> 唯一前缀 -> 模糊
+        """
+        keys = normalize(name)
+        for key in keys:
+            if key in self._exact:
+                return self._result(key, "exact")
+
+        for key in keys:
+            min_len = 1 if _is_cjk(key) else MIN_PREFIX_LEN
+            if len(key) < min_len:
+                continue
+            matches = self.prefix(key, limit=FUZZY_CANDIDATES)
+            coords = {self._exact[m][1:] for m in matches}
+            # 前缀对应多座城市 (例如 "长" -> 长沙/长春) 就不猜
+            if len(coords) == 1:
+                return self._result(min(matches, key=len), "prefix")
+
+        for key in keys:
+            found = self.fuzzy(key)
+            if found:
+                return self._result(found, "fuzzy")
+        return None
+
+    def complete(self, text, limit=10):
+        """输入提示：以 text 开头的城市原名 (去重，短的在前)"""
+        names = []
+        for key in normalize(text)[:1]:
+            for candidate in sorted(self.prefix(key), key=lambda k: (len(k), k)):
+                name = self._exact[candidate][0]
+                if name not in names:
+                    names.append(name)
+                if len(names) >= limit:
+                    break
+        return names
+
+    def nearest(self, lats, lons, max_km=None):
+        """
+        反向查询：一批坐标各自最近的城市 (标量也可以)
+        返回 (CityMatch 列表, 距离数组/公里)；距离超过 max_km 的位置是 None
+        """
+        if self._spatial is None:
+            import spatial_index
+            self._spatial = spatial_index.SpatialIndex([p[1] for p in self._places],
+                                                       [p[2] for p in self._places])
+        indices, distances = self._spatial.nearest(lats, lons)
+        matches = []
+        for i, km in zip(indices.tolist(), distances.tolist()):
+            if max_km is not None and km > max_km:
+                matches.append(None)
+            else:
+                name, lat, lon = self._places[i]
+                matches.append(CityMatch(name, lat, lon, "nearest"))
+        return matches, distances
+
+
+# 进程级索引：导入时建一次 (几百个城市，几毫秒)
+default_index = CityIndex(city_data.CHINA_CITIES)
+
+
+def lookup(name):
+    """查城市坐标，返回 CityMatch 或 None"""
+    return default_index.lookup(name)
+
+
+def nearest(lats, lons, max_km=None):
+    """坐标 -> 最近的城市，返回 (CityMatch 列表, 距离数组/公里)"""
+    return default_index.nearest(lats, lons, max_km)
@@ -0,0 +1,130 @@
+# drawer_numpy.py
+# NumPy 叠图引擎 (drawer_pil 的可选替代，用 HD_RENDER_ENGINE=numpy 或 engine="numpy" 切换)
+# 每张素材预先转成 "稀疏预乘" 形式：非透明像素在整张画布上的扁平下标 + 预乘后的 RGB + alpha。
+# 渲染时把互不重叠的图层并成一批，一批只做一次 gather -> 混合 -> scatter 的向量化运算；
+# 互相重叠的图层落在不同批次里，保证叠放顺序和逐层混合完全一致。
+
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image
+
+import drawer_pil
+
+# 稀疏预乘图层：index 为画布扁平下标 (升序)，color 为预乘 RGB (0~1)，alpha 为 0~1
+SparseLayer = namedtuple("SparseLayer", ["index", "color", "alpha", "bbox"])
+
+# 进程级缓存
+_SPARSE_CACHE = {}
+_BASE_CACHE = {}
+
+
+def _base_array(divisor=1):
+    """底图展开成整画布 uint8 数组 (每个档位只做一次，之后每张盘 copy 一份)"""
+    if divisor not in _BASE_CACHE:
+        canvas = drawer_pil.composite_layers([], divisor)
+        _BASE_CACHE[divisor] = np.asarray(canvas, dtype=np.uint8).copy()
+    return _BASE_CACHE[divisor]
+
+
+def _canvas_size(divisor=1):
+    height, width = _base_array(divisor).shape[:2]
+    return width, height
+
+
+def get_sparse_layer(name, divisor=1):
+    """把缓存的 PIL 图层转成稀疏预乘形式 (每个图层每个档位只转一次)"""
+    layer = _SPARSE_CACHE.get((name, divisor))
+    if layer is not None:
+        return layer
+
+    cached = drawer_pil.get_layer(name, divisor)
+    width, height = _canvas_size(divisor)
+    x0, y0 = cached.offset
+    pixels = np.asarray(cached.image, dtype=np.float32) / 255.0
+
+    # 超出画布的部分裁掉 (与 PIL 引擎一致)
+    pixels = pixels[:max(height - y0, 0), :max(width - x0, 0)]
+    ys, xs = np.nonzero(pixels[..., 3] > 0)
+    alpha = pixels[ys, xs, 3]
+    color = pixels[ys, xs, :3] * alpha[:, None]
+    index = ((ys + y0) * width + (xs + x0)).astype(np.int64)
+
+    h, w = pixels.shape[:2]
+    layer = SparseLayer(index, color, alpha, (x0, y0, x0 + w, y0 + h))
+    _SPARSE_CACHE[(name, divisor)] = layer
+    return layer
+
+
+def preload_layers(divisor=1):
+    """所有素材一次性转成稀疏预乘形式 (服务启动时调用)，可指定分辨率档位"""
+    drawer_pil.preload_layers(divisor)
+    for file_name in drawer_pil._source_files():
+        name = file_name[:-4]
+        if name != "base" and drawer_pil.get_layer(name, divisor) is not None:
+            get_sparse_layer(name, divisor)
+
+
+@lru_cache(maxsize=None)
+def _overlaps(name_a, name_b, divisor=1):
+    """两个图层是否有共同的非透明像素 (先比包围盒，再比像素下标)"""
+    a, b = get_sparse_layer(name_a, divisor), get_sparse_layer(name_b, divisor)
+    ax0, ay0, ax1, ay1 = a.bbox
+    bx0, by0, bx1, by1 = b.bbox
+    if ax1 <= bx0 or bx1 <= ax0 or ay1 <= by0 or by1 <= ay0:
+        return False
+    return np.intersect1d(a.index, b.index, assume_unique=True).size > 0
+
+
+def plan_batches(layer_names, divisor=1):
+    """
+    把按顺序排好的图层分成若干批：同一批内两两不重叠，可以一次混合
+    每个图层放进 "所有与它重叠的前序图层所在批次" 之后的第一批
+    """
+    batches = []
+    placed = []  # (图层名, 批次号)
+    for name in layer_names:
+        level = 0
+        for other, other_level in placed:
+            if other_level >= level and _overlaps(other, name, divisor):
+                level = other_level + 1
+        if level == len(batches):
+            batches.append([])
+        batches[level].append(name)
+        placed.append((name, level))
+    return batches
+
+
+def _blend_batch(flat, names, divisor=1):
+    """
+    一批互不重叠的图层一次性 "over" 到 flat 上
+    flat 是画布的 uint32 视图 (每个像素 4 字节一个元素)，gather/scatter 比按行取 uint8 快得多
+    """
+    layers = [get_sparse_layer(n, divisor) for n in names]
+    index = np.concatenate([l.index for l in layers])
+    src_color = np.concatenate([l.color for l in layers])
+    src_alpha = np.concatenate([l.alpha for l in layers])
+
+    dst = flat[index].view(np.uint8).reshape(-1, 4).astype(np.float32) / 255.0
+    dst_alpha = dst[:, 3]
+    keep = 1.0 - src_alpha
+
+    out_alpha = src_alpha + dst_alpha * keep
+    out_color = src_color + dst[:, :3] * (dst_alpha * keep)[:, None]
+    safe_alpha = np.where(out_alpha > 0, out_alpha, 1.0)
+
+    result = np.empty((index.size, 4), dtype=np.float32)
+    result[:, :3] = out_color / safe_alpha[:, None]
+    result[:, 3] = out_alpha
+    packed = np.clip(np.rint(result * 255.0), 0, 255).astype(np.uint8)
+    flat[index] = packed.view(np.uint32).reshape(-1)
+
+
+def composite_layers(layer_names, divisor=1):
+    """NumPy 引擎：返回与 drawer_pil.composite_layers 相同尺寸的 RGBA 图片"""
+    canvas = _base_array(divisor).copy()
+    flat = canvas.view(np.uint32).reshape(-1)
+    for batch in plan_batches(layer_names, divisor):
+        _blend_batch(flat, batch, divisor)
+    return Image.fromarray(canvas)
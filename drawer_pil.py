@@ -1,15 +1,45 @@
+import io
+import json
+import logging
 import os
+import sys
+import threading
+from collections import namedtuple
+
 import streamlit as st
 from PIL import Image
 
+import calculation
+
+logger = logging.getLogger(__name__)
+
 # === 配置区域 ===
-# 图片素材文件夹名称
-IMG_DIR = "images"
+# 图片素材文件夹 (按本文件所在目录找，和从哪个目录启动无关)
+IMG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
 
 # 默认画布大小 (当找不到 base.png 时使用这个尺寸)
 # 建议和你 PS 里的画布大小保持一致
 DEFAULT_SIZE = (1000, 1000)
 
+# 叠图引擎："pil" 逐层原地混合；"numpy" 见 drawer_numpy.py (按批向量化混合)
+RENDER_ENGINE = os.environ.get("HD_RENDER_ENGINE", "pil")
+
+# 分辨率档位：原图的整数缩小倍数 (2200 -> 1100 / 734 / 550)
+# 每档的素材只在第一次用到时从原图缩小一次，之后常驻缓存
+RESOLUTION_DIVISORS = (1, 2, 3, 4)
+
+# 网页展示宽度：窄栏 + 高清屏 2 倍，正好落在 1/3 档，不需要再缩放
+DISPLAY_WIDTH = 734
+
+# 编码参数
+WEBP_QUALITY = 80
+PNG_COMPRESS_LEVEL = 6
+
+# 图集：所有素材裁掉透明边后拼成一张大图，外加一个记录位置的索引
+# 生成: python drawer_pil.py build-atlas
+ATLAS_IMAGE = "atlas.png"
+ATLAS_INDEX = "atlas.json"
+
 # 9大中心的文件名映射
 CENTER_FILES = {
     "Head": "center_head",
@@ -23,115 +53,334 @@ CENTER_FILES = {
     "Root": "center_root"
 }
 
+# 缓存的图层：只保留非透明区域 image，offset 为它在原画布上的左上角，size 为原画布大小
+CachedLayer = namedtuple("CachedLayer", ["image", "offset", "size"])
+
+# 进程级图层缓存 {图层名: CachedLayer 或 None(文件不存在)}，所有会话共享
+_LAYER_CACHE = {}
+_cache_lock = threading.Lock()
+_atlas_checked = False
+_img_dir_exists = None
+
+def _img_dir_ok():
+    """素材文件夹是否存在，只检查一次"""
+    global _img_dir_exists
+    if _img_dir_exists is None:
+        _img_dir_exists = os.path.isdir(IMG_DIR)
+    return _img_dir_exists
+
+def _crop_layer(img):
+    """裁到非透明区域；全透明的图层保留 1x1 占位"""
+    bbox = img.getbbox() or (0, 0, 1, 1)
+    return CachedLayer(img.crop(bbox), bbox[:2], img.size)
+
+def _source_files():
+    return sorted(n for n in os.listdir(IMG_DIR)
+                  if n.endswith(".png") and n != ATLAS_IMAGE)
+
+def _load_atlas():
+    """
+    如果有图集且比所有素材都新，一次解码整张图集填满缓存
+    图集过期 (改过素材没重建) 时忽略，逐个文件加载
+    """
+    atlas_path = os.path.join(IMG_DIR, ATLAS_IMAGE)
+    index_path = os.path.join(IMG_DIR, ATLAS_INDEX)
+    if not (os.path.exists(atlas_path) and os.path.exists(index_path)):
+        return
+    atlas_mtime = os.path.getmtime(atlas_path)
+    if any(os.path.getmtime(os.path.join(IMG_DIR, n)) > atlas_mtime for n in _source_files()):
+        return
+
+    with open(index_path, "r", encoding="utf-8") as f:
+        index = json.load(f)
+    sheet = Image.open(atlas_path).convert("RGBA")
+    for name, entry in index["layers"].items():
+        x, y, w, h = entry["rect"]
+        _LAYER_CACHE[name] = CachedLayer(
+            sheet.crop((x, y, x + w, y + h)), tuple(entry["offset"]), tuple(entry["size"])
+        )
+
+def _ceil_div(a, b):
+    return -(-a // b)
+
+def _scale_layer(layer, divisor):
+    """
+    把原尺寸图层缩小 divisor 倍：先把左上角补齐到 divisor 的整数倍，
+    再按块平均 (Image.reduce，内部按预乘 alpha 计算)，这样缩小后的偏移仍是整数
+    """
+    x0, y0 = layer.offset
+    pad_x, pad_y = x0 % divisor, y0 % divisor
+    width = _ceil_div(pad_x + layer.image.width, divisor) * divisor
+    height = _ceil_div(pad_y + layer.image.height, divisor) * divisor
+    padded = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    padded.paste(layer.image, (pad_x, pad_y))
+    return CachedLayer(
+        padded.reduce(divisor),
+        ((x0 - pad_x) // divisor, (y0 - pad_y) // divisor),
+        (_ceil_div(layer.size[0], divisor), _ceil_div(layer.size[1], divisor)),
+    )
+
+def get_layer(layer_name, divisor=1):
+    """
+    取一张缓存图层 (CachedLayer)，不存在返回 None
+    divisor > 1 时返回对应分辨率档位的缩小版
+    第一次调用时尝试加载图集；之后热渲染完全不碰文件系统
+    """
+    global _atlas_checked
+    if divisor != 1:
+        key = f"{layer_name}@{divisor}"
+        layer = _LAYER_CACHE.get(key, False)
+        if layer is False:
+            native = get_layer(layer_name)
+            layer = _scale_layer(native, divisor) if native is not None else None
+            _LAYER_CACHE[key] = layer
+        return layer
+
+    layer = _LAYER_CACHE.get(layer_name, False)
+    if layer is not False:
+        return layer
+
+    with _cache_lock:
+        if not _img_dir_ok():
+            return None
+        if not _atlas_checked:
+            _atlas_checked = True
+            _load_atlas()
+        if layer_name not in _LAYER_CACHE:
+            path = os.path.join(IMG_DIR, f"{layer_name}.png")
+            if os.path.exists(path):
+                _LAYER_CACHE[layer_name] = _crop_layer(Image.open(path).convert("RGBA"))
+            else:
+                # 缺失的文件也记下来，下次不再去查磁盘
+                _LAYER_CACHE[layer_name] = None
+        return _LAYER_CACHE[layer_name]
+
+def preload_layers(divisor=1):
+    """把素材文件夹里所有图层一次性解码进缓存 (服务启动时调用)，可指定分辨率档位"""
+    if _img_dir_ok():
+        for name in _source_files():
+            get_layer(name[:-4], divisor)
+
+def missing_assets():
+    """
+    检查素材是否齐全 (服务启动时调用)，返回缺失的文件名列表
+    底图、数字层、9 个中心、64 个闸门各三种颜色；文件夹不存在时只返回文件夹
+    """
+    if not _img_dir_ok():
+        return [IMG_DIR]
+    names = ["base", "numbers", *CENTER_FILES.values()]
+    names += [f"gate_{gate}_{color}" for gate in range(1, 65) for color in ("black", "red", "mix")]
+    return [f"{name}.png" for name in names if get_layer(name) is None]
+
+def pick_divisor(width):
+    """按目标宽度选档位：缩得最小、但仍不窄于目标宽度的那一档"""
+    if not width:
+        return 1
+    base = get_layer("base")
+    native_width = base.size[0] if base is not None else DEFAULT_SIZE[0]
+    best = 1
+    for divisor in RESOLUTION_DIVISORS:
+        if _ceil_div(native_width, divisor) >= width:
+            best = max(best, divisor)
+    return best
+
+def _in_streamlit():
+    """是不是在 Streamlit 页面脚本里跑 (批处理、接口进程里调 st.* 只会刷 "missing ScriptRunContext" 警告)"""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    return get_script_run_ctx(suppress_warning=True) is not None
+
+def _report_missing_dir():
+    message = f"❌ 严重错误：找不到 '{IMG_DIR}' 文件夹！请在项目根目录新建它。"
+    if _in_streamlit():
+        st.error(message)
+    else:
+        logger.error(message)
+
 def load_layer(layer_name):
     """
     加载一张图层，如果文件不存在则返回 None
     """
     # 确保文件夹存在
-    if not os.path.exists(IMG_DIR):
-        st.error(f"❌ 严重错误：找不到 '{IMG_DIR}' 文件夹！请在项目根目录新建它。")
+    if not _img_dir_ok():
+        _report_missing_dir()
         return None
 
-    path = os.path.join(IMG_DIR, f"{layer_name}.png")
-    if os.path.exists(path):
-        return Image.open(path).convert("RGBA")
-    else:
+    layer = get_layer(layer_name)
+    if layer is None:
         # 这里不报错，只是静默返回 None，方便后续统计缺失文件
         return None
+    # 从缓存还原成整张画布大小的图层
+    full = Image.new("RGBA", layer.size, (0, 0, 0, 0))
+    full.paste(layer.image, layer.offset)
+    return full
+
+def build_atlas():
+    """
+    把 images 里的所有素材裁边后按行 (shelf) 打包成一张图集
+    索引记录每个图层在图集中的位置、原画布偏移和原画布大小
+    """
+    layers = {}
+    for name in _source_files():
+        layers[name[:-4]] = _crop_layer(Image.open(os.path.join(IMG_DIR, name)).convert("RGBA"))
+
+    # 从高到低排好，逐行摆放
+    order = sorted(layers, key=lambda n: layers[n].image.height, reverse=True)
+    sheet_width = max(max(l.image.width for l in layers.values()), 2048)
+    rects = {}
+    x = y = row_height = 0
+    for name in order:
+        w, h = layers[name].image.size
+        if x + w > sheet_width:
+            x, y, row_height = 0, y + row_height, 0
+        rects[name] = (x, y, w, h)
+        x += w
+        row_height = max(row_height, h)
+
+    sheet = Image.new("RGBA", (sheet_width, y + row_height), (0, 0, 0, 0))
+    index = {"layers": {}}
+    for name, (x, y, w, h) in rects.items():
+        layer = layers[name]
+        sheet.paste(layer.image, (x, y))
+        index["layers"][name] = {"rect": [x, y, w, h], "offset": list(layer.offset), "size": list(layer.size)}
+
+    sheet.save(os.path.join(IMG_DIR, ATLAS_IMAGE), optimize=True)
+    with open(os.path.join(IMG_DIR, ATLAS_INDEX), "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    return len(rects)
+
+def get_gate_colors(chart_data):
+    """整张盘的闸门颜色表 {闸门: "red"/"black"/"mix"} (见 calculation.chart_gate_colors)"""
+    return calculation.chart_gate_colors(chart_data)
 
 def get_gate_color(gate_num, chart_data):
     """
-    判断一个闸门应该是 红、黑 还是 斑马纹
-    """
-    red_gates = set()
-    black_gates = set()
-    
-    activations = chart_data.get('activations', {})
-    
-    for planet_name, data in activations.items():
-        g = data['gate']
-        if "设计红" in planet_name:
-            red_gates.add(g)
-        elif "个性黑" in planet_name:
-            black_gates.add(g)
-            
-    is_red = gate_num in red_gates
-    is_black = gate_num in black_gates
-    
-    if is_red and is_black:
-        return "mix"
-    elif is_red:
-        return "red"
-    elif is_black:
-        return "black"
-    else:
-        return None
+    判断一个闸门应该是 红、黑 还是 斑马纹 (没有激活返回 None)
+    """
+    return get_gate_colors(chart_data).get(gate_num)
 
-def create_chart_image(chart_data):
+def _composite_layer(canvas, layer):
     """
-    宽容版叠图函数：缺图不报错，只显示有的
+    只在图层的非透明区域内原地混合 (canvas.alpha_composite)，
+    不再每层分配一张整画布；超出画布的部分裁掉
     """
+    x, y = layer.offset
+    img = layer.image
+    if x + img.width > canvas.width or y + img.height > canvas.height:
+        w, h = canvas.width - x, canvas.height - y
+        if w <= 0 or h <= 0:
+            return
+        img = img.crop((0, 0, min(w, img.width), min(h, img.height)))
+    canvas.alpha_composite(img, dest=(x, y))
+
+def select_layers(chart_data):
+    """
+    按叠放顺序列出这张盘要叠的图层名 (底图除外)，以及缺失的素材
+    返回 (图层名列表, 缺失素材列表)
+    """
+    layer_names = []
     missing_assets = [] # 用于记录缺了什么图
-    
-    # ===============================
-    # 第 1 层：BASE (底图)
-    # ===============================
-    base_img = load_layer("base")
-    
-    if base_img is None:
-        # 【关键修改】如果没有底图，创建一个空的透明画布
+
+    if get_layer("base") is None:
         missing_assets.append("base.png (底图)")
-        canvas = Image.new("RGBA", DEFAULT_SIZE, (255, 255, 255, 0))
-    else:
-        canvas = base_img.copy()
 
-    # ===============================
     # 第 2 层：CENTERS (中心)
-    # ===============================
-    defined_centers = chart_data.get('defined_centers', [])
-    for center_name in defined_centers:
+    for center_name in chart_data.get('defined_centers', []):
         file_name = CENTER_FILES.get(center_name)
         if file_name:
-            center_layer = load_layer(file_name)
-            if center_layer:
-                canvas = Image.alpha_composite(canvas, center_layer)
+            if get_layer(file_name):
+                layer_names.append(file_name)
             else:
                 missing_assets.append(f"{file_name}.png")
 
-    # ===============================
-    # 第 3 层：GATES (闸门)
-    # ===============================
-    all_active_gates = chart_data.get('gate_list', [])
-    all_active_gates = set(all_active_gates)
-    
-    for gate in all_active_gates:
-        color = get_gate_color(gate, chart_data)
+    # 第 3 层：GATES (闸门)，颜色整张盘只算一次
+    gate_colors = get_gate_colors(chart_data)
+    for gate in set(chart_data.get('gate_list', [])):
+        color = gate_colors.get(gate)
         if color:
             file_name = f"gate_{gate}_{color}"
-            gate_layer = load_layer(file_name)
-            
-            if gate_layer:
-                canvas = Image.alpha_composite(canvas, gate_layer)
+            if get_layer(file_name):
+                layer_names.append(file_name)
             else:
                 # 记录缺失的闸门图
                 missing_assets.append(f"{file_name}.png")
 
-    # ===============================
     # 第 4 层：NUMBERS (数字)
-    # ===============================
-    numbers_layer = load_layer("numbers")
-    if numbers_layer:
-        canvas = Image.alpha_composite(canvas, numbers_layer)
+    if get_layer("numbers"):
+        layer_names.append("numbers")
     else:
         missing_assets.append("numbers.png (数字层)")
 
+    return layer_names, missing_assets
+
+def composite_layers(layer_names, divisor=1):
+    """PIL 引擎：底图打底，其余图层按包围盒原地混合 (divisor 为分辨率档位)"""
+    base_layer = get_layer("base", divisor)
+
+    if base_layer is None:
+        # 【关键修改】如果没有底图，创建一个空的透明画布
+        size = (_ceil_div(DEFAULT_SIZE[0], divisor), _ceil_div(DEFAULT_SIZE[1], divisor))
+        canvas = Image.new("RGBA", size, (255, 255, 255, 0))
+    else:
+        # 整张盘唯一一次整画布分配，后面所有图层都原地画在它上面
+        canvas = Image.new("RGBA", base_layer.size, (0, 0, 0, 0))
+        canvas.paste(base_layer.image, base_layer.offset)
+
+    for name in layer_names:
+        _composite_layer(canvas, get_layer(name, divisor))
+    return canvas
+
+def create_chart_image(chart_data, engine=None, width=None):
+    """
+    宽容版叠图函数：缺图不报错，只显示有的
+    engine: "pil" 或 "numpy"，缺省用 RENDER_ENGINE
+    width: 输出宽度 (缺省为原尺寸)；先在不窄于它的最小档位上叠图，必要时再缩一次
+    """
+    # 确保文件夹存在 (只检查一次，结果缓存)
+    if not _img_dir_ok():
+        _report_missing_dir()
+
+    layer_names, missing_assets = select_layers(chart_data)
+    divisor = pick_divisor(width)
+
+    if (engine or RENDER_ENGINE) == "numpy":
+        import drawer_numpy
+        canvas = drawer_numpy.composite_layers(layer_names, divisor)
+    else:
+        canvas = composite_layers(layer_names, divisor)
+
+    if width and canvas.width != width:
+        height = max(round(canvas.height * width / canvas.width), 1)
+        canvas = canvas.resize((width, height), Image.LANCZOS)
+
     # ===============================
     # 反馈：告诉用户缺了什么 (仅在测试时显示)
     # ===============================
-    if missing_assets:
+    if missing_assets and _in_streamlit():
         with st.expander("⚠️ 缺少部分素材 (但不影响预览)", expanded=False):
             st.write("以下图片未找到，因此未显示在图中：")
             st.write(missing_assets)
             st.caption("提示：请检查 images 文件夹，确保文件名完全一致。")
-        
+
     return canvas
+
+def encode_chart_image(image, fmt="PNG", quality=None):
+    """
+    编码成字节：WEBP 按 quality (缺省 WEBP_QUALITY) 有损压缩，
+    PNG 无损，quality 当作 zlib 压缩级别 (0-9，缺省 PNG_COMPRESS_LEVEL)
+    """
+    fmt = fmt.upper()
+    buffer = io.BytesIO()
+    if fmt == "WEBP":
+        image.save(buffer, format="WEBP", quality=WEBP_QUALITY if quality is None else quality, method=4)
+    elif fmt == "PNG":
+        level = PNG_COMPRESS_LEVEL if quality is None else quality
+        image.save(buffer, format="PNG", compress_level=level)
+    else:
+        image.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "build-atlas":
+        print(f"已打包 {build_atlas()} 个图层 -> {os.path.join(IMG_DIR, ATLAS_IMAGE)}")
+    else:
+        print("用法: python drawer_pil.py build-atlas")
@@ -0,0 +1,363 @@
+# drawer_svg.py
+# 矢量渲染后端：按几何定义文件 (images/geometry.json) 直接画出
+# 人体轮廓、通道、中心、闸门线段 (红/黑/斑马纹) 和闸门数字，输出几 KB 的 SVG 文本。
+# 不需要解码、叠加任何 PNG，任意分辨率都清晰；位图叠图 (drawer_pil) 只在导出图片时才需要。
+#
+# 几何文件由原图素材提取，素材改了重新生成一次即可:
+#   python drawer_svg.py build-geometry
+
+import json
+import os
+import sys
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+import calculation
+
+# === 配置区域 ===
+# 几何定义文件 (放在素材文件夹里，和 PNG 素材一起提交；IMG_DIR 与 drawer_pil 相同)
+IMG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
+GEOMETRY_FILE = "geometry.json"
+
+# 颜色 (和 PNG 素材保持一致)
+COLORS = {
+    "black": "#000000",
+    "red": "#f61010",
+    "dot": "#cc18e7",
+    "channel": "#ffffff",
+    "center": "#ffffff",
+    "outline": "#000000",
+    "number": "#000000",
+}
+
+# 斑马纹条纹宽度 (原画布像素)
+STRIPE_WIDTH = 12
+
+# 数字字体
+FONT_FAMILY = "Arial, Helvetica, sans-serif"
+
+# 提取几何时每隔多少行取一个轮廓点 (越小越精细，文件越大)
+SPAN_STEP = 6
+
+# 进程级缓存：几何定义只读一次
+_geometry = None
+
+
+def load_geometry():
+    """读取几何定义 (每个进程只读一次)；文件不存在返回 None"""
+    global _geometry
+    if _geometry is None:
+        path = os.path.join(IMG_DIR, GEOMETRY_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            _geometry = json.load(f)
+    return _geometry
+
+
+def _points(coords):
+    return " ".join(f"{x:g},{y:g}" for x, y in coords)
+
+
+def _polygon(coords, **attrs):
+    extra = "".join(f' {k.replace("_", "-")}="{v}"' for k, v in attrs.items())
+    return f'<polygon points="{_points(coords)}"{extra}/>'
+
+
+def create_chart_svg(chart_data, width=None):
+    """
+    画一张盘，返回 SVG 文本
+    叠放顺序与 drawer_pil.select_layers 相同：底图 -> 定义中心 -> 闸门 -> 数字
+    width: 输出宽度 (缺省为原画布尺寸)；viewBox 不变，只是声明的显示尺寸
+    """
+    geometry = load_geometry()
+    if geometry is None:
+        raise FileNotFoundError(
+            f"找不到 {os.path.join(IMG_DIR, GEOMETRY_FILE)}，请先运行: python drawer_svg.py build-geometry"
+        )
+
+    canvas_w, canvas_h = geometry["size"]
+    width = width or canvas_w
+    height = max(round(canvas_h * width / canvas_w), 1)
+
+    defined = set(chart_data.get("defined_centers", []))
+    # 和 drawer_pil / render_cache.visual_signature 同一份颜色表 (老格式现算、JSON 还原的键转回整数)
+    gate_colors = calculation.chart_gate_colors(chart_data)
+    active = {}
+    for gate in set(chart_data.get("gate_list", [])):
+        color = gate_colors.get(gate)
+        if color and str(gate) in geometry["gates"]:
+            active[gate] = color
+
+    out = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {canvas_w} {canvas_h}">',
+        '<defs><pattern id="mix" patternUnits="userSpaceOnUse" '
+        f'width="{STRIPE_WIDTH * 2}" height="{STRIPE_WIDTH * 2}" patternTransform="rotate(45)">'
+        f'<rect width="{STRIPE_WIDTH * 2}" height="{STRIPE_WIDTH * 2}" fill="{COLORS["black"]}"/>'
+        f'<rect width="{STRIPE_WIDTH}" height="{STRIPE_WIDTH * 2}" fill="{COLORS["red"]}"/>'
+        "</pattern></defs>",
+    ]
+
+    # 第 1 层：底图 (人体轮廓 + 白色通道)
+    silhouette = geometry.get("silhouette")
+    if silhouette:
+        out.append(_polygon(silhouette["points"], fill=silhouette["color"]))
+    out.append(f'<g fill="{COLORS["channel"]}">')
+    out.extend(_polygon(g["stroke"]) for g in geometry["gates"].values())
+    out.append("</g>")
+
+    # 第 2 层：中心 (定义的上色，未定义的白色)
+    out.append(f'<g stroke="{COLORS["outline"]}" stroke-linejoin="round">')
+    for name, center in geometry["centers"].items():
+        fill = center["color"] if name in defined else COLORS["center"]
+        out.append(_polygon(center["points"], fill=fill, stroke_width=center["outline"]))
+    out.append("</g>")
+
+    # 第 3 层：闸门线段 + 激活圆点
+    for gate in sorted(active):
+        color = active[gate]
+        shape = geometry["gates"][str(gate)]
+        fill = "url(#mix)" if color == "mix" else COLORS[color]
+        out.append(_polygon(shape["stroke"], fill=fill))
+    out.append(f'<g fill="{COLORS["dot"]}">')
+    for gate in sorted(active):
+        x, y, r = geometry["gates"][str(gate)]["dot"]
+        out.append(f'<circle cx="{x:g}" cy="{y:g}" r="{r:g}"/>')
+    out.append("</g>")
+
+    # 第 4 层：数字 (全部 64 个)
+    out.append(f'<g fill="{COLORS["number"]}" font-family="{escape(FONT_FAMILY)}" '
+               f'font-size="{geometry["font_size"]:g}" text-anchor="middle">')
+    for gate, shape in geometry["gates"].items():
+        x, y = shape["label"]
+        out.append(f'<text x="{x:g}" y="{y:g}">{gate}</text>')
+    out.append("</g></svg>")
+    return "".join(out)
+
+
+# ===============================
+# 从 PNG 素材提取几何定义
+# ===============================
+
+def _row_span_outline(mask, offset, step=SPAN_STEP):
+    """
+    按行扫描不透明区域的最左/最右端点，拼成一个闭合多边形
+    (人体轮廓和九个中心每一行都只有一段，这样提取足够准确)
+    """
+    rows = np.nonzero(mask.any(axis=1))[0]
+    if rows.size == 0:
+        return []
+    ys = list(range(int(rows[0]), int(rows[-1]) + 1, step))
+    if ys[-1] != rows[-1]:
+        ys.append(int(rows[-1]))
+
+    left, right = [], []
+    x0, y0 = offset
+    for y in ys:
+        xs = np.nonzero(mask[y])[0]
+        if xs.size == 0:
+            continue
+        left.append((int(xs[0]) + x0, y + y0))
+        right.append((int(xs[-1]) + 1 + x0, y + y0))
+    return _simplify_closed(left + right[::-1], tolerance=1.0)
+
+
+def _convex_hull(points):
+    """单调链凸包 (逆时针)"""
+    points = sorted(set(points))
+    if len(points) <= 2:
+        return points
+
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    lower, upper = [], []
+    for p in points:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+    for p in reversed(points):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+    return lower[:-1] + upper[:-1]
+
+
+def _simplify_closed(points, tolerance=1.5):
+    """闭合多边形去掉几乎共线的顶点 (像素锯齿、逐行采样产生的大量小折点)"""
+    changed = True
+    while changed and len(points) > 3:
+        changed = False
+        i = 0
+        while i < len(points) and len(points) > 3:
+            a, b, c = points[i - 1], points[i], points[(i + 1) % len(points)]
+            length = ((c[0] - a[0]) ** 2 + (c[1] - a[1]) ** 2) ** 0.5 or 1.0
+            dist = abs((c[0] - a[0]) * (a[1] - b[1]) - (a[0] - b[0]) * (c[1] - a[1])) / length
+            if dist < tolerance:
+                del points[i]
+                changed = True
+            else:
+                i += 1
+    return points
+
+
+def _stroke_shape(mask, offset):
+    """
+    闸门线段的外形：先沿主轴拟合一次，丢掉离主轴太远的杂点 (个别素材边上有抗锯齿残渣)，
+    剩下的像素取凸包再化简，得到四到六个顶点的多边形
+    """
+    ys, xs = np.nonzero(mask)
+    pts = np.c_[xs, ys].astype(float)
+    center = pts.mean(axis=0)
+    _, _, axes = np.linalg.svd(pts - center, full_matrices=False)
+    along = (pts - center) @ axes[0]
+    across = (pts - center) @ axes[1]
+    width = len(pts) / max(along.max() - along.min(), 1.0)
+    keep = np.abs(across - np.median(across)) <= width
+    xs, ys = xs[keep], ys[keep]
+
+    # 用像素的四个角做凸包，线段两端不会少半个像素
+    x0, y0 = offset
+    corners = []
+    for x, y in zip(xs.tolist(), ys.tolist()):
+        corners.extend(((x, y), (x + 1, y), (x, y + 1), (x + 1, y + 1)))
+    hull = _simplify_closed(_convex_hull(corners))
+    return [(x + x0, y + y0) for x, y in hull]
+
+
+def _label_boxes(mask, offset):
+    """
+    数字层里每个闸门号的包围盒 [x_min, y_min, x_max, y_max] (画布坐标)
+    先找 8 连通的单个数字，再把同一行里挨得很近的数字并成一个号码
+    """
+    seen = np.zeros_like(mask)
+    glyphs = []
+    height, width = mask.shape
+    for y, x in zip(*np.nonzero(mask)):
+        if seen[y, x]:
+            continue
+        seen[y, x] = True
+        stack, box = [(y, x)], [x, y, x + 1, y + 1]
+        while stack:
+            cy, cx = stack.pop()
+            box = [min(box[0], cx), min(box[1], cy), max(box[2], cx + 1), max(box[3], cy + 1)]
+            for ny in range(max(cy - 1, 0), min(cy + 2, height)):
+                for nx in range(max(cx - 1, 0), min(cx + 2, width)):
+                    if mask[ny, nx] and not seen[ny, nx]:
+                        seen[ny, nx] = True
+                        stack.append((ny, nx))
+        glyphs.append(box)
+
+    glyphs.sort()
+    labels = []
+    for box in glyphs:
+        for label in labels:
+            glyph_h = label[3] - label[1]
+            same_row = min(label[3], box[3]) - max(label[1], box[1]) > glyph_h / 2
+            if same_row and 0 <= box[0] - label[2] < glyph_h / 3:
+                label[:] = [label[0], min(label[1], box[1]), box[2], max(label[3], box[3])]
+                break
+        else:
+            labels.append(list(box))
+
+    x0, y0 = offset
+    return [[int(a) + x0, int(b) + y0, int(c) + x0, int(d) + y0] for a, b, c, d in labels]
+
+
+def _dominant_color(pixels, exclude_dark=True):
+    if exclude_dark:
+        pixels = pixels[pixels.sum(axis=1) > 60]
+    colors, counts = np.unique(pixels, axis=0, return_counts=True)
+    r, g, b = colors[counts.argmax()].tolist()
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+def build_geometry():
+    """从 PNG 素材提取几何定义，写入 images/geometry.json，返回闸门数"""
+    # 只有提取几何时才需要解码 PNG，画 SVG 不导入 PIL / Streamlit
+    import drawer_pil
+
+    def opaque(name):
+        layer = drawer_pil.get_layer(name)
+        if layer is None:
+            return None, None, None
+        pixels = np.asarray(layer.image)
+        return layer, pixels, pixels[..., 3] > 128
+
+    geometry = {"size": list(drawer_pil.DEFAULT_SIZE), "silhouette": None, "centers": {}, "gates": {}}
+
+    base, pixels, mask = opaque("base")
+    if base is not None:
+        geometry["size"] = list(base.size)
+        # 底图里还有白色的通道和中心，轮廓颜色只看非白色像素
+        gray = pixels[mask][:, :3]
+        gray = gray[gray.min(axis=1) < 230]
+        geometry["silhouette"] = {
+            "points": _row_span_outline(mask, base.offset),
+            "color": _dominant_color(gray),
+        }
+
+    for name, file_name in drawer_pil.CENTER_FILES.items():
+        layer, pixels, mask = opaque(file_name)
+        if layer is None:
+            continue
+        outline = _row_span_outline(mask, layer.offset)
+        dark = (pixels[..., :3].sum(axis=2) <= 60) & mask
+        perimeter = sum(
+            ((outline[i][0] - outline[i - 1][0]) ** 2 + (outline[i][1] - outline[i - 1][1]) ** 2) ** 0.5
+            for i in range(len(outline))
+        )
+        geometry["centers"][name] = {
+            "points": outline,
+            "color": _dominant_color(pixels[mask][:, :3]),
+            "outline": round(float(dark.sum()) / max(perimeter, 1.0), 1),
+        }
+
+    numbers, _, number_mask = opaque("numbers")
+    labels = _label_boxes(number_mask, numbers.offset) if numbers is not None else []
+    dot_rgb = np.array([0xcc, 0x18, 0xe7])
+
+    for gate in range(1, 65):
+        layer, pixels, mask = opaque(f"gate_{gate}_black")
+        if layer is None:
+            continue
+        dot = mask & (np.abs(pixels[..., :3].astype(int) - dot_rgb).max(axis=2) < 40)
+        ys, xs = np.nonzero(dot)
+        x0, y0 = layer.offset
+        cx, cy = float(xs.mean()) + 0.5 + x0, float(ys.mean()) + 0.5 + y0
+        radius = (dot.sum() / np.pi) ** 0.5
+
+        # 数字：离圆点最近的那组数字，水平居中，底边作基线
+        label = [round(cx, 1), round(cy, 1)]
+        if labels:
+            x_min, y_min, x_max, y_max = min(
+                labels, key=lambda b: ((b[0] + b[2]) / 2 - cx) ** 2 + ((b[1] + b[3]) / 2 - cy) ** 2
+            )
+            label = [round((x_min + x_max) / 2, 1), float(y_max)]
+
+        geometry["gates"][str(gate)] = {
+            "stroke": _stroke_shape(mask & ~dot, layer.offset),
+            "dot": [round(cx, 1), round(cy, 1), round(float(radius), 1)],
+            "label": label,
+        }
+
+    # Arial 数字高度约为字号的 0.716
+    heights = sorted(b[3] - b[1] for b in labels)
+    glyph = heights[len(heights) // 2] if heights else 20
+    geometry["font_size"] = round(glyph / 0.716, 1)
+
+    with open(os.path.join(IMG_DIR, GEOMETRY_FILE), "w", encoding="utf-8") as f:
+        json.dump(geometry, f, separators=(",", ":"))
+
+    global _geometry
+    _geometry = None
+    return len(geometry["gates"])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "build-geometry":
+        print(f"已提取 {build_geometry()} 个闸门 -> {os.path.join(IMG_DIR, GEOMETRY_FILE)}")
+    else:
+        print("用法: python drawer_svg.py build-geometry")
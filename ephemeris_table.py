@@ -0,0 +1,240 @@
+# ephemeris_table.py
+# 预计算星历表：把 1900 年至今各行星的黄道经度按固定步长采样成一个二进制文件，
+# 运行时用内存映射加载，查表 + 线性插值代替 PyEphem 的实时计算。
+# 表外的日期 (或者根本没有生成表文件) 时返回 None，由 calculation.py 回退到 PyEphem。
+#
+# 生成:   python ephemeris_table.py build [输出路径]
+# 校验:   python ephemeris_table.py check [抽样次数]
+
+import json
+import math
+import os
+import random
+import struct
+import sys
+from datetime import date, datetime
+
+import ephem
+import numpy as np
+
+# === 配置区域 ===
+# 默认表文件位置，可用环境变量覆盖
+TABLE_PATH = os.environ.get(
+    "HD_EPHEMERIS_TABLE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "ephemeris.bin"),
+)
+
+# 文件头魔数 (带版本号)
+MAGIC = b"HDEPH001"
+
+# 需要采样的星体 (地球 = 太阳 + 180 度，不单独存)
+TABLE_BODIES = ["Sun", "Moon", "Mercury", "Venus", "Mars",
+                "Jupiter", "Saturn", "Uranus", "Neptune", "Pluto"]
+
+# 采样步长 (小时)：月亮一天走 13 度左右，要更密
+STEP_HOURS = {body: 1.0 for body in TABLE_BODIES}
+STEP_HOURS["Moon"] = 0.5
+
+# 默认覆盖范围：1900 年出生者的设计时间在 1899 年秋天，所以往前多留一段
+DEFAULT_START = datetime(1899, 9, 1)
+
+# 经度存成 uint32 定点数：一整圈 = 2^32，差值取模后天然处理 360 度回绕
+_FULL_TURN = 2 ** 32
+_DEG_PER_UNIT = 360.0 / _FULL_TURN
+
+
+def _default_end():
+    """覆盖到明年年底，足够排当天的盘和近期的流日"""
+    return datetime(date.today().year + 2, 1, 1)
+
+
+def _to_fixed(degrees):
+    return int(round((degrees % 360.0) / _DEG_PER_UNIT)) % _FULL_TURN
+
+
+def _pyephem_longitude(planet, date_utc):
+    planet.compute(date_utc)
+    return math.degrees(ephem.Ecliptic(planet).lon)
+
+
+# ================= 生成 =================
+
+def build_table(path=TABLE_PATH, start=DEFAULT_START, end=None, progress=None):
+    """
+    采样所有星体写成二进制表文件
+    文件结构: MAGIC | uint32 头长度 | JSON 头 | 8 字节对齐的 uint32 数据列
+    """
+    end = end or _default_end()
+    start_day = float(ephem.Date(start))
+    end_day = float(ephem.Date(end))
+
+    index = {}
+    columns = []
+    offset = 0
+    for body_name in TABLE_BODIES:
+        step_days = STEP_HOURS[body_name] / 24.0
+        count = int(math.ceil((end_day - start_day) / step_days)) + 1
+        index[body_name] = {"step_days": step_days, "count": count, "offset": offset}
+        columns.append((body_name, step_days, count))
+        offset += count * 4
+
+    header = json.dumps({
+        "start_day": start_day,
+        "end_day": end_day,
+        "bodies": index,
+    }).encode("utf-8")
+    prefix_len = len(MAGIC) + 4 + len(header)
+    padding = (-prefix_len) % 8
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header) + padding))
+        f.write(header + b" " * padding)
+        for body_name, step_days, count in columns:
+            planet = getattr(ephem, body_name)()
+            column = np.empty(count, dtype="<u4")
+            for i in range(count):
+                deg = _pyephem_longitude(planet, ephem.Date(start_day + i * step_days))
+                column[i] = _to_fixed(deg)
+            f.write(column.tobytes())
+            if progress:
+                progress(body_name)
+    os.replace(tmp_path, path)
+    return path
+
+
+# ================= 加载与查询 =================
+
+class EphemerisTable:
+    """内存映射的星历表，只读"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"不是有效的星历表文件: {path}")
+            (header_len,) = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(header_len).decode("utf-8"))
+        data_start = len(MAGIC) + 4 + header_len
+
+        self.path = path
+        self.start_day = header["start_day"]
+        self.end_day = header["end_day"]
+        self.columns = {}
+        for body_name, meta in header["bodies"].items():
+            data = np.memmap(path, dtype="<u4", mode="r",
+                             offset=data_start + meta["offset"], shape=(meta["count"],))
+            self.columns[body_name] = (meta["step_days"], data)
+
+    def covers(self, day):
+        return self.start_day <= day < self.end_day
+
+    def longitude(self, body_name, date_utc):
+        """单点查询，表外或未知星体返回 None"""
+        earth = body_name == "Earth"
+        column = self.columns.get("Sun" if earth else body_name)
+        if column is None:
+            return None
+        day = float(ephem.Date(date_utc))
+        if not self.covers(day):
+            return None
+
+        step_days, data = column
+        pos = (day - self.start_day) / step_days
+        i = int(pos)
+        if i + 1 >= len(data):
+            return None
+        frac = pos - i
+        a = int(data[i])
+        # 取模后转成有符号差值：既处理 359->0 回绕，也处理逆行
+        delta = (int(data[i + 1]) - a) % _FULL_TURN
+        if delta >= _FULL_TURN // 2:
+            delta -= _FULL_TURN
+        deg = ((a + frac * delta) * _DEG_PER_UNIT) % 360.0
+        if earth:
+            deg = (deg + 180) % 360
+        return deg
+
+    def longitudes(self, body_name, days):
+        """
+        向量化查询：days 为 ephem 日数 (float) 数组
+        返回 float64 数组，表外位置为 NaN
+        """
+        earth = body_name == "Earth"
+        step_days, data = self.columns["Sun" if earth else body_name]
+        days = np.asarray(days, dtype=np.float64)
+        pos = (days - self.start_day) / step_days
+        inside = (pos >= 0) & (pos < len(data) - 1)
+
+        idx = np.where(inside, np.floor(pos), 0).astype(np.int64)
+        frac = pos - idx
+        a = data[idx].astype(np.int64)
+        b = data[idx + 1].astype(np.int64)
+        delta = (b - a) % _FULL_TURN
+        delta = np.where(delta >= _FULL_TURN // 2, delta - _FULL_TURN, delta)
+        deg = np.mod((a + frac * delta) * _DEG_PER_UNIT, 360.0)
+        if earth:
+            deg = np.mod(deg + 180.0, 360.0)
+        return np.where(inside, deg, np.nan)
+
+
+_table = None
+_table_loaded = False
+
+
+def get_table():
+    """进程内只加载一次；没有表文件时返回 None (全部走 PyEphem)"""
+    global _table, _table_loaded
+    if not _table_loaded:
+        _table_loaded = True
+        if os.path.exists(TABLE_PATH):
+            try:
+                _table = EphemerisTable(TABLE_PATH)
+            except (OSError, ValueError):
+                _table = None
+    return _table
+
+
+def lookup(body_name, date_utc):
+    """查表取黄道经度；没有表或超出范围时返回 None"""
+    table = get_table()
+    if table is None:
+        return None
+    return table.longitude(body_name, date_utc)
+
+
+# ================= 精度校验 =================
+
+def check_accuracy(samples=2000, seed=0, table=None):
+    """随机抽样对比 PyEphem，返回 {星体: 最大误差(度)}"""
+    table = table or get_table()
+    if table is None:
+        raise FileNotFoundError(f"找不到星历表文件: {TABLE_PATH}")
+    rng = random.Random(seed)
+    worst = {}
+    for body_name in TABLE_BODIES:
+        planet = getattr(ephem, body_name)()
+        max_err = 0.0
+        for _ in range(samples):
+            day = rng.uniform(table.start_day, table.end_day - 1)
+            expected = _pyephem_longitude(planet, ephem.Date(day))
+            got = table.longitude(body_name, ephem.Date(day))
+            err = abs((got - expected + 180) % 360 - 180)
+            max_err = max(max_err, err)
+        worst[body_name] = max_err
+    return worst
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    if command == "build":
+        out = sys.argv[2] if len(sys.argv) > 2 else TABLE_PATH
+        build_table(out, progress=lambda name: print(f"  ✔ {name}"))
+        print(f"已生成: {out} ({os.path.getsize(out) / 1e6:.1f} MB)")
+    elif command == "check":
+        n = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+        for body_name, err in check_accuracy(n).items():
+            # 一个 base 的宽度约 0.0052 度
+            print(f"{body_name:8s} 最大误差 {err * 3600:8.3f} 角秒")
+    else:
+        print("用法: python ephemeris_table.py [build [输出路径] | check [抽样次数]]")
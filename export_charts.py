@@ -0,0 +1,372 @@
+# export_charts.py
+# 批量导出盘面 (会员名单之类的大表)，不用一张张在 Streamlit 界面里点。
+# 输入: 带表头的 CSV，或 Parquet，每行一个人：
+#   date (YYYY-MM-DD 或 YYYY/MM/DD)、time (HH:MM[:SS]，缺省 12:00)
+#   lat + lon，或 city (只查离线库：city_data 城市索引，有 gazetteer.bin 时再查世界地名库；不联网)
+#   tz (可选：相对 UTC 的小时数或 IANA 时区名，缺省按坐标查历史时区)
+#   其它列 (name、会员号等) 原样带到输出
+# 输出: 每个输入行对应一行，顺序不变，扁平的列：
+#   status (ok / bad_date / bad_location / city_not_found / bad_tz)、lat、lon、
+#   type、authority、definition、profile、22 个激活位 (personality_sun = "41.3" ...)、
+#   defined_centers、channels (逗号分隔)、image (出图时的文件名)
+#   输出路径以 .csv 结尾写一个 CSV 文件，否则当作目录写 Parquet 分片 (part-00000.parquet ...)
+# 流式处理：按 CHUNK_ROWS 行一块读入、排盘 (calculation 批量接口 / 进程池)、写出，内存只和块大小有关，
+#   与输入行数、坏行多少都无关。
+# 断点续跑：每写完一块就落盘并记下进度 (CSV 旁边的 .progress 文件，Parquet 以分片为准)，
+#   中断后用同样的命令重跑，从上次写完的那一行接着做，半截写入会被丢掉重写。
+# 用法: python export_charts.py <输入.csv|.parquet> <输出.csv|输出目录> [图片目录] [进程数]
+
+import csv
+import functools
+import itertools
+import json
+import logging
+import math
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, time as dtime
+from zoneinfo import ZoneInfo
+
+import calculation
+import city_index
+import gazetteer
+
+# === 配置区域 ===
+# 每块多少行 (读入、写出、记进度都按块)
+CHUNK_ROWS = int(os.environ.get("HD_EXPORT_CHUNK_ROWS", "1000"))
+
+# 出图的格式和宽度 (像素)
+IMAGE_FORMAT = "PNG"
+IMAGE_WIDTH = 800
+
+ACTIVATION_COLUMNS = [f"{side}_{body.lower()}" for side in ("personality", "design")
+                      for body in calculation.PLANETS]
+CHART_COLUMNS = (["status", "lat", "lon", "type", "authority", "definition", "profile"] +
+                 ACTIVATION_COLUMNS + ["defined_centers", "channels", "image"])
+# Parquet 里按浮点存的列，其余都是字符串
+FLOAT_COLUMNS = ("lat", "lon")
+
+# CSV 里比表头多出字段的行：多出的丢掉，只提示前几行
+RAGGED_WARNINGS = 10
+
+logger = logging.getLogger(__name__)
+
+
+def read_rows(path):
+    """返回 (列名, 行迭代器)；行是 {列名: 字符串或 None}，逐块读入"""
+    if path.lower().endswith(".parquet"):
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(path)
+
+        def parquet_rows():
+            for batch in parquet.iter_batches(batch_size=CHUNK_ROWS):
+                for row in batch.to_pylist():
+                    yield {k: None if v is None else str(v) for k, v in row.items()}
+        return parquet.schema_arrow.names, parquet_rows()
+
+    f = open(path, newline="", encoding="utf-8-sig")
+    # 比表头多出的字段放在 restkey 下 (缺省是 None 键，写出时 DictWriter 会报错)，读出来就丢掉
+    extra_key = object()
+    reader = csv.DictReader(f, restkey=extra_key)
+    columns = reader.fieldnames or []
+
+    def csv_rows():
+        ragged = 0
+        with f:
+            for row in reader:
+                extra = row.pop(extra_key, None)
+                if extra is not None:
+                    ragged += 1
+                    if ragged <= RAGGED_WARNINGS:
+                        logger.warning("%s 第 %d 行比表头多 %d 个字段，多出的已忽略", path, reader.line_num, len(extra))
+                yield row
+        if ragged > RAGGED_WARNINGS:
+            logger.warning("%s 共 %d 行比表头多出字段，多出的已忽略", path, ragged)
+    return columns, csv_rows()
+
+
+@functools.lru_cache(maxsize=4096)
+def _city_coords(name):
+    """城市名 -> (纬度, 经度) 或 None (geocoding.resolve 的离线部分，大批量时不能挨个联网)"""
+    match = city_index.lookup(name) or gazetteer.lookup(name)
+    return (match.lat, match.lon) if match else None
+
+
+def _field(row, key):
+    value = row.get(key)
+    return value.strip() if isinstance(value, str) and value.strip() else None
+
+
+def parse_row(row):
+    """一行输入 -> (排盘记录 (date, time, lat, lon, tz) 或 None, 状态)"""
+    try:
+        birth_date = date.fromisoformat(_field(row, "date").replace("/", "-"))
+        birth_time = dtime.fromisoformat(_field(row, "time") or "12:00")
+    except (AttributeError, ValueError):
+        return None, "bad_date"
+
+    lat, lon = _field(row, "lat"), _field(row, "lon")
+    if lat is not None and lon is not None:
+        try:
+            lat, lon = float(lat), float(lon)
+        except ValueError:
+            return None, "bad_location"
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return None, "bad_location"
+    elif _field(row, "city"):
+        coords = _city_coords(_field(row, "city"))
+        if coords is None:
+            return None, "city_not_found"
+        lat, lon = coords
+    else:
+        return None, "bad_location"
+
+    tz = _field(row, "tz")
+    if tz is not None:
+        try:
+            tz = float(tz)
+            if not math.isfinite(tz) or not -14 <= tz <= 14:
+                return None, "bad_tz"
+        except ValueError:
+            try:
+                ZoneInfo(tz)
+            except (ValueError, KeyError, OSError):
+                return None, "bad_tz"
+    return (birth_date, birth_time, lat, lon, tz), "ok"
+
+
+def _parse_chunk(rows):
+    """一块输入行 -> ([(输入行, 排盘记录, 状态)], 其中能排盘的记录)"""
+    parsed = [(row, *parse_row(row)) for row in rows]
+    return parsed, [record for _, record, _ in parsed if record is not None]
+
+
+def _merge(parsed, charts):
+    """把这一块的盘面按顺序填回输入行；解析失败的行盘面为 None"""
+    charts = iter(charts)
+    for row, record, status in parsed:
+        yield row, status, record, next(charts) if record is not None else None
+
+
+def chart_rows(rows, workers=1, chunk_rows=CHUNK_ROWS):
+    """
+    输入行 -> (输入行, 状态, 排盘记录, 盘面)，顺序与输入一致
+    按 chunk_rows 行一块读入、解析，只把这一块里能排盘的记录交给批量接口 / 进程池，再按原顺序合并：
+    提前读入的是输入行数 (最多两块)，坏行再多也不会堆在内存里等下一张好盘
+    workers > 1 用进程池 (PyEphem 持有 GIL)，整个导出共用一个池，排当前块时下一块已经提交
+    """
+    chunks = iter(lambda: list(itertools.islice(rows, chunk_rows)), [])
+    if workers <= 1:
+        for chunk in chunks:
+            parsed, records = _parse_chunk(chunk)
+            yield from _merge(parsed, calculation.get_chart_data_batch(records) if records else [])
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        def submit(chunk):
+            parsed, records = _parse_chunk(chunk)
+            size = max(1, min(calculation.POOL_CHUNK_SIZE, math.ceil(len(records) / workers)))
+            return parsed, [pool.submit(calculation.get_chart_data_batch, records[i:i + size])
+                            for i in range(0, len(records), size)]
+
+        def collect(parsed, futures):
+            return _merge(parsed, itertools.chain.from_iterable(f.result() for f in futures))
+
+        pending = deque()
+        for chunk in chunks:
+            pending.append(submit(chunk))
+            if len(pending) > 1:
+                yield from collect(*pending.popleft())
+        while pending:
+            yield from collect(*pending.popleft())
+
+
+def flat_row(row, status, record, chart, image=None):
+    """一张盘展开成输出的扁平列 (输入列在前)"""
+    out = dict(row)
+    for key in CHART_COLUMNS:
+        # 和输入同名的列 (lat / lon) 排盘失败时保留原值
+        out.setdefault(key, None)
+    out["status"] = status
+    if chart is None:
+        return out
+    out["lat"], out["lon"] = record[2], record[3]
+    for key in ("type", "authority", "definition", "profile"):
+        out[key] = chart[key]
+    for side in ("personality", "design"):
+        acts = chart[side] or {}
+        for body in calculation.PLANETS:
+            act = acts.get(body)
+            out[f"{side}_{body.lower()}"] = act["text"] if act else None
+    defined = set(chart["defined_centers"])
+    out["defined_centers"] = ",".join(c for c in calculation.CENTERS if c in defined)
+    out["channels"] = ",".join(f"{a}-{b}" for a, b in chart["active_channels"])
+    out["image"] = image
+    return out
+
+
+def _replace_json(path, payload):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(payload, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class CsvOutput:
+    """
+    CSV 输出：每块写完 fsync，再把 (行数, 文件字节数) 记进 <输出>.progress
+    续跑时把文件截回记录的字节数 (丢掉没记进度的半块)，从记录的行数接着写
+    """
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+        self.progress_path = path + ".progress"
+        if os.path.exists(self.progress_path):
+            with open(self.progress_path, encoding="utf-8") as f:
+                progress = json.load(f)
+            if progress["columns"] != columns:
+                raise ValueError(f"输入的列和上次不一样，不能续跑 (删除 {path} 和 {self.progress_path} 重新开始)")
+            self.rows = progress["rows"]
+            self._file = open(path, "r+", newline="", encoding="utf-8")
+            self._file.truncate(progress["bytes"])
+            self._file.seek(progress["bytes"])
+            self._writer = csv.DictWriter(self._file, columns)
+        else:
+            if os.path.exists(path):
+                raise ValueError(f"{path} 已存在但没有进度记录，不覆盖")
+            self.rows = 0
+            self._file = open(path, "w", newline="", encoding="utf-8")
+            self._writer = csv.DictWriter(self._file, columns)
+            self._writer.writeheader()
+            self._commit()
+
+    def _commit(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        _replace_json(self.progress_path, {"rows": self.rows, "bytes": self._file.tell(),
+                                           "columns": self.columns})
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+        self.rows += len(rows)
+        self._commit()
+
+    def close(self):
+        self._file.close()
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ParquetOutput:
+    """
+    Parquet 输出：目录里每块一个分片，先写临时文件再改名，分片要么完整要么不存在
+    续跑时已有分片的总行数就是进度
+    """
+
+    def __init__(self, path, columns):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa, self._pq = pa, pq
+        self.path = path
+        self.schema = pa.schema([(c, pa.float64() if c in FLOAT_COLUMNS else pa.string()) for c in columns])
+        os.makedirs(path, exist_ok=True)
+        parts = sorted(p for p in os.listdir(path) if p.startswith("part-") and p.endswith(".parquet"))
+        for part in parts:
+            if not pq.read_schema(os.path.join(path, part)).equals(self.schema):
+                raise ValueError(f"{path} 里的分片和这次的列不一样，不能续跑 (换个目录或清空重来)")
+        self.parts = len(parts)
+        self.rows = sum(pq.ParquetFile(os.path.join(path, p)).metadata.num_rows for p in parts)
+
+    def write(self, rows):
+        columns = {}
+        for field in self.schema:
+            values = [row[field.name] for row in rows]
+            if field.type == self._pa.string():
+                values = [None if v is None else str(v) for v in values]
+            else:
+                values = [_to_float(v) for v in values]
+            columns[field.name] = self._pa.array(values, field.type)
+        target = os.path.join(self.path, f"part-{self.parts:05d}.parquet")
+        self._pq.write_table(self._pa.table(columns, schema=self.schema), target + ".tmp")
+        os.replace(target + ".tmp", target)
+        self.parts += 1
+        self.rows += len(rows)
+
+    def close(self):
+        pass
+
+
+def _save_image(chart, image_dir, index):
+    import render_cache
+    name = f"{index:07d}.{IMAGE_FORMAT.lower()}"
+    data = render_cache.get_chart_image_bytes(chart, IMAGE_FORMAT, IMAGE_WIDTH)
+    with open(os.path.join(image_dir, name), "wb") as f:
+        f.write(data if isinstance(data, bytes) else data.encode("utf-8"))
+    return name
+
+
+def export(input_path, output_path, image_dir=None, workers=1, chunk_rows=CHUNK_ROWS, progress=None):
+    """
+    把 input_path 的每一行排盘写到 output_path (见文件头)，中断后重跑会接着做
+    image_dir: 给了就把每张成功的盘画成图存进去 (文件名是输入行号)
+    progress(已写行数, 本次新写行数) 每写完一块回调一次
+    返回 (输出总行数, 本次成功排盘数, 本次失败行数)
+    """
+    columns, rows = read_rows(input_path)
+    out_columns = list(columns) + [c for c in CHART_COLUMNS if c not in columns]
+    output = (CsvOutput if output_path.lower().endswith(".csv") else ParquetOutput)(output_path, out_columns)
+    if image_dir:
+        os.makedirs(image_dir, exist_ok=True)
+
+    start_rows = output.rows
+    index, ok, failed = start_rows, 0, 0
+    results = chart_rows(itertools.islice(rows, start_rows, None), workers, chunk_rows)
+    try:
+        while True:
+            chunk = []
+            for row, status, record, chart in itertools.islice(results, chunk_rows):
+                image = _save_image(chart, image_dir, index) if image_dir and chart is not None else None
+                chunk.append(flat_row(row, status, record, chart, image))
+                ok += chart is not None
+                failed += chart is None
+                index += 1
+            if not chunk:
+                break
+            output.write(chunk)
+            if progress:
+                progress(output.rows, output.rows - start_rows)
+    finally:
+        output.close()
+    return output.rows, ok, failed
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(levelname)s %(message)s")
+    if len(sys.argv) < 3 or (len(sys.argv) > 4 and not sys.argv[4].isdigit()):
+        print("用法: python export_charts.py <输入.csv|.parquet> <输出.csv|输出目录> [图片目录] [进程数]")
+        sys.exit(1)
+    started = time.perf_counter()
+
+    def report(total, new):
+        elapsed = time.perf_counter() - started
+        print(f"  已写出 {total} 行 (本次 {new} 行，{new / elapsed:.0f} 行/秒)")
+
+    image_dir = sys.argv[3] if len(sys.argv) > 3 and sys.argv[3] else None
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else os.cpu_count() or 1
+    try:
+        total, ok, failed = export(sys.argv[1], sys.argv[2], image_dir, workers, progress=report)
+    except ValueError as exc:
+        print(exc)
+        sys.exit(1)
+    print(f"完成: {sys.argv[2]} 共 {total} 行 (本次排盘 {ok} 张，{failed} 行无法排盘，看 status 列)")
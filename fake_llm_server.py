@@ -0,0 +1,153 @@
+# fake_llm_server.py
+# 本地假 LLM 服务 (OpenAI 兼容的 /v1/chat/completions，支持 stream=True 的 SSE)，
+# 调试和压测解读缓存、流式客户端用，不花 token、不联网。
+#   - 回复内容由最后一条用户消息决定 (同样的请求回同样的字)，长度 REPLY_CHARS 个字
+#   - 请求里要求 原样写“占位符” 时，回复开头照写 (像听话的模型)；keep_slots=False 模拟模型没照做
+#   - 可模拟首字延迟、逐字速度、以及每隔几个请求失败一次 (HTTP 500 / 429)
+#   - GET /stats 返回收到的请求数、吐出的 token 数
+# 启动:   python fake_llm_server.py [端口]
+# 代码里: server = FakeLLMServer(first_token_delay=0.3); server.start(); OpenAI(base_url=server.url + "/v1")
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import socket
+import sys
+import threading
+import time
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+# === 配置区域 ===
+# 默认回复长度 (字)、每个 token 几个字
+REPLY_CHARS = 600
+CHARS_PER_TOKEN = 2
+
+# 首字延迟、相邻 token 的间隔 (秒)
+FIRST_TOKEN_DELAY = 0.3
+TOKEN_DELAY = 0.01
+
+_FILLER = "能量在流动，你的设计正在等待被看见。每一次回应都是一次选择，每一次等待都是一次积累。"
+
+
+def reply_text(messages, chars=REPLY_CHARS, keep_slots=True):
+    """确定性的假回复：按最后一条用户消息取一段固定的文字 (keep_slots 时先写出要求原样写的占位符)"""
+    last = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    seed = int(hashlib.sha1(json.dumps(messages, ensure_ascii=False).encode("utf-8")).hexdigest()[:6], 16)
+    slots = "".join(f"{slot}，" for slot in re.findall(r"原样写“([^”]+)”", last)) if keep_slots else ""
+    head = f"【回复 {seed % 1000:03d}】{slots}{last[:20]}："
+    body = (_FILLER * (chars // len(_FILLER) + 1))
+    return (head + body)[:chars]
+
+
+class FakeLLMServer:
+    """
+    假 LLM 服务 (可在后台线程里启动，也可以单独跑)
+    fail_every: 每 N 个请求失败一次 (0 = 不失败)；fail_status: 失败时的状态码
+    stall_after: 吐出这么多 token 后卡住不动 (模拟流中断，None = 不卡)
+    keep_slots: 是否照写请求里要求原样写的占位符
+    """
+
+    def __init__(self, first_token_delay=FIRST_TOKEN_DELAY, token_delay=TOKEN_DELAY,
+                 reply_chars=REPLY_CHARS, fail_every=0, fail_status=500, stall_after=None,
+                 keep_slots=True):
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.reply_chars = reply_chars
+        self.fail_every = fail_every
+        self.fail_status = fail_status
+        self.stall_after = stall_after
+        self.keep_slots = keep_slots
+        self.requests = 0
+        self.tokens = 0
+        self.url = None
+        self._server = None
+        self._thread = None
+        self.app = Starlette(routes=[
+            Route("/v1/chat/completions", self._completions, methods=["POST"]),
+            Route("/stats", self._stats, methods=["GET"]),
+        ])
+
+    async def _stats(self, request: Request):
+        return JSONResponse({"requests": self.requests, "tokens": self.tokens})
+
+    async def _completions(self, request: Request):
+        body = await request.json()
+        self.requests += 1
+        if self.fail_every and self.requests % self.fail_every == 0:
+            return JSONResponse({"error": {"message": "fake failure", "type": "server_error"}},
+                                status_code=self.fail_status)
+
+        text = reply_text(body.get("messages", []), self.reply_chars, self.keep_slots)
+        pieces = [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+        created = int(time.time())
+        model = body.get("model", "fake")
+
+        def chunk(delta, finish=None):
+            payload = {"id": f"chatcmpl-fake-{self.requests}", "object": "chat.completion.chunk",
+                       "created": created, "model": model,
+                       "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        if not body.get("stream"):
+            await asyncio.sleep(self.first_token_delay + self.token_delay * len(pieces))
+            self.tokens += len(pieces)
+            return JSONResponse({
+                "id": f"chatcmpl-fake-{self.requests}", "object": "chat.completion", "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(pieces), "total_tokens": len(pieces)},
+            })
+
+        async def events():
+            await asyncio.sleep(self.first_token_delay)
+            yield chunk({"role": "assistant", "content": ""})
+            for i, piece in enumerate(pieces):
+                if self.stall_after is not None and i >= self.stall_after:
+                    await asyncio.sleep(3600)
+                if i:
+                    await asyncio.sleep(self.token_delay)
+                self.tokens += 1
+                yield chunk({"content": piece})
+            yield chunk({}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    def start(self, host="127.0.0.1", port=0):
+        """在后台线程里启动，返回服务地址 (port=0 随机挑一个空闲端口)"""
+        import uvicorn
+        if not port:
+            with socket.socket() as s:
+                s.bind((host, 0))
+                port = s.getsockname()[1]
+        self._server = uvicorn.Server(uvicorn.Config(self.app, host=host, port=port, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=5)
+            self._server = None
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    if len(sys.argv) > 1 and not sys.argv[1].isdigit():
+        print("用法: python fake_llm_server.py [端口]")
+        sys.exit(1)
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else int(os.environ.get("HD_FAKE_LLM_PORT", "8001"))
+    print(f"假 LLM 服务: http://127.0.0.1:{port}/v1  (OPENAI base_url)")
+    uvicorn.run(FakeLLMServer().app, host="127.0.0.1", port=port, log_level="warning")
@@ -0,0 +1,309 @@
+# gazetteer.py
+# 离线世界地名库：把 GeoNames 格式的地名表 (cities500.txt / allCountries.txt 等，几十万条)
+# 转成紧凑的二进制列式文件，运行时用内存映射加载：启动只读一个 JSON 头，
+# 常驻内存不随库的大小增长，只有查询碰到的页才会被系统读进来。
+#   - 数据列：纬度/经度 (float32)、人口 (uint32)、国家/时区 (uint16 编号)、显示名 (偏移 + UTF-8 字节)
+#   - 名字索引：所有名字和别名规范化后排好序，二分查找；同名地点按人口从大到小排在一起，
+#     取第一个就是最可能的那个 (同名消歧)
+# 没有库文件时 get_gazetteer() 返回 None，调用方继续走联网地理编码。
+# 反向查询 (坐标 -> 最近的地点) 在第一次用到时从经纬度列建一棵 KD 树 (spatial_index)。
+#
+# 生成:   python gazetteer.py build <GeoNames 文本文件> [输出路径]
+# 查询:   python gazetteer.py lookup <地名>
+# 反查:   python gazetteer.py nearest <纬度> <经度>
+
+import json
+import os
+import struct
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+import city_index
+import spatial_index
+
+# === 配置区域 ===
+# 默认库文件位置，可用环境变量覆盖
+GAZETTEER_PATH = os.environ.get(
+    "HD_GAZETTEER",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer.bin"),
+)
+
+# 文件头魔数 (带版本号)
+MAGIC = b"HDGAZ001"
+
+# 只收人口聚居地 (GeoNames 要素类 P)；行政区 (A) 的中心坐标往往不在城区
+FEATURE_CLASSES = ("P",)
+
+# 是否把 alternatenames 里的别名 (各语种译名，含中文) 也编进索引
+INCLUDE_ALTERNATE_NAMES = True
+
+# GeoNames 制表符分隔的列号
+_COL_NAME, _COL_ASCII, _COL_ALT, _COL_LAT, _COL_LON = 1, 2, 3, 4, 5
+_COL_CLASS, _COL_COUNTRY, _COL_POPULATION, _COL_TIMEZONE = 6, 8, 14, 17
+
+# 一个地名：timezone 为 IANA 时区名 (例如 "Asia/Shanghai")，country 为两位国家代码
+Place = namedtuple("Place", ["name", "lat", "lon", "country", "population", "timezone"])
+
+def index_keys(name):
+    """一个名字编进索引的键：原样压缩 + 去掉行政区划后缀 ("北京市" -> "北京市", "北京")"""
+    keys = {city_index._compact(name)}
+    keys.update(city_index.normalize(name)[:1])
+    keys.discard("")
+    return keys
+
+
+# ================= 生成 =================
+
+def _iter_geonames(source_path):
+    with open(source_path, encoding="utf-8") as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) <= _COL_TIMEZONE or fields[_COL_CLASS] not in FEATURE_CLASSES:
+                continue
+            yield fields
+
+
+def build_gazetteer(source_path, path=GAZETTEER_PATH, progress=None):
+    """
+    读 GeoNames 文本文件写成二进制库文件，返回地点数
+    文件结构: MAGIC | uint32 头长度 | JSON 头 | 8 字节对齐的各列
+    """
+    lats, lons, populations, countries, timezones = [], [], [], [], []
+    names = bytearray()
+    name_offsets = []
+    country_ids, timezone_ids = {}, {}
+    entries = []  # (键字节, -人口, 行号)
+
+    for row, fields in enumerate(_iter_geonames(source_path)):
+        population = int(fields[_COL_POPULATION] or 0)
+        lats.append(float(fields[_COL_LAT]))
+        lons.append(float(fields[_COL_LON]))
+        populations.append(min(population, 2 ** 32 - 1))
+        countries.append(country_ids.setdefault(fields[_COL_COUNTRY], len(country_ids)))
+        timezones.append(timezone_ids.setdefault(fields[_COL_TIMEZONE], len(timezone_ids)))
+        name_offsets.append(len(names))
+        names += fields[_COL_NAME].encode("utf-8")
+
+        all_names = [fields[_COL_NAME], fields[_COL_ASCII]]
+        if INCLUDE_ALTERNATE_NAMES and fields[_COL_ALT]:
+            all_names += fields[_COL_ALT].split(",")
+        keys = set()
+        for name in all_names:
+            keys |= index_keys(name)
+        for key in keys:
+            entries.append((key.encode("utf-8"), -population, row))
+        if progress and (row + 1) % 100000 == 0:
+            progress(row + 1)
+    name_offsets.append(len(names))
+
+    # 同一个键下人口大的排前面，查询时第一个就是默认答案
+    entries.sort()
+    key_blob = bytearray()
+    key_offsets = [0]
+    key_rows = []
+    for key, _, row in entries:
+        key_blob += key
+        key_offsets.append(len(key_blob))
+        key_rows.append(row)
+
+    arrays = {
+        "lat": np.array(lats, dtype="<f4"),
+        "lon": np.array(lons, dtype="<f4"),
+        "population": np.array(populations, dtype="<u4"),
+        "country": np.array(countries, dtype="<u2"),
+        "timezone": np.array(timezones, dtype="<u2"),
+        "name_offset": np.array(name_offsets, dtype="<u4"),
+        "names": np.frombuffer(bytes(names), dtype="u1"),
+        "key_offset": np.array(key_offsets, dtype="<u4"),
+        "key_row": np.array(key_rows, dtype="<u4"),
+        "keys": np.frombuffer(bytes(key_blob), dtype="u1"),
+    }
+
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = {"dtype": array.dtype.str, "count": len(array), "offset": offset}
+        offset += array.nbytes + (-array.nbytes) % 8
+
+    header = json.dumps({
+        "places": len(lats),
+        "keys": len(key_rows),
+        "countries": sorted(country_ids, key=country_ids.get),
+        "timezones": sorted(timezone_ids, key=timezone_ids.get),
+        "columns": layout,
+    }).encode("utf-8")
+    prefix_len = len(MAGIC) + 4 + len(header)
+    padding = (-prefix_len) % 8
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header) + padding))
+        f.write(header + b" " * padding)
+        for array in arrays.values():
+            f.write(array.tobytes())
+            f.write(b"\0" * ((-array.nbytes) % 8))
+    os.replace(tmp_path, path)
+    return len(lats)
+
+
+# ================= 加载与查询 =================
+
+class Gazetteer:
+    """内存映射的地名库，只读 (线程安全)"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"不是有效的地名库文件: {path}")
+            (header_len,) = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(header_len).decode("utf-8"))
+        data_start = len(MAGIC) + 4 + header_len
+
+        self.path = path
+        self.countries = header["countries"]
+        self.timezones = header["timezones"]
+        self._columns = {}
+        for name, meta in header["columns"].items():
+            if meta["count"] == 0:
+                self._columns[name] = np.zeros(0, dtype=meta["dtype"])
+                continue
+            self._columns[name] = np.memmap(path, dtype=meta["dtype"], mode="r",
+                                            offset=data_start + meta["offset"], shape=(meta["count"],))
+        self._key_count = header["keys"]
+        self._spatial = None
+
+    def __len__(self):
+        return len(self._columns["lat"])
+
+    def _key(self, i):
+        offsets = self._columns["key_offset"]
+        return bytes(self._columns["keys"][offsets[i]:offsets[i + 1]])
+
+    def _lower_bound(self, key):
+        lo, hi = 0, self._key_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def place(self, row):
+        c = self._columns
+        start, end = c["name_offset"][row], c["name_offset"][row + 1]
+        return Place(
+            bytes(c["names"][start:end]).decode("utf-8"),
+            round(float(c["lat"][row]), 5),
+            round(float(c["lon"][row]), 5),
+            self.countries[c["country"][row]],
+            int(c["population"][row]),
+            self.timezones[c["timezone"][row]],
+        )
+
+    def candidates(self, key, limit=20):
+        """规范化键完全相同的地点行号，按人口从大到小"""
+        key = key.encode("utf-8")
+        rows = []
+        i = self._lower_bound(key)
+        while i < self._key_count and (limit is None or len(rows) < limit) and self._key(i) == key:
+            rows.append(int(self._columns["key_row"][i]))
+            i += 1
+        return rows
+
+    def prefix(self, text, limit=10):
+        """以 text 开头的地点 (按键的字典序，每个键取人口最多的一个)，做输入提示用"""
+        prefix = city_index._compact(text).encode("utf-8")
+        if not prefix:
+            return []
+        places, seen = [], set()
+        i = self._lower_bound(prefix)
+        while i < self._key_count and len(places) < limit:
+            key = self._key(i)
+            if not key.startswith(prefix):
+                break
+            row = int(self._columns["key_row"][i])
+            if row not in seen:
+                seen.add(row)
+                places.append(self.place(row))
+            i += 1
+        return places
+
+    def lookup(self, name, country=None):
+        """
+        查一个地名，找不到返回 None
+        "Springfield, US" / country="US" 限定国家；同名的按人口取最大的
+        """
+        if country is None and "," in name:
+            head, _, tail = name.rpartition(",")
+            if len(tail.strip()) == 2:
+                name, country = head, tail.strip()
+        country = country.upper() if country else None
+
+        for key in city_index.normalize(name):
+            for row in self.candidates(key, limit=None if country else 1):
+                place = self.place(row)
+                if country is None or place.country == country:
+                    return place
+        return None
+
+    def nearest(self, lats, lons):
+        """
+        批量反向查询：每个坐标最近的地点
+        返回 (行号数组, 距离数组/公里)，用 place(row) 取详情
+        """
+        if self._spatial is None:
+            # 几十万个点建树要一两秒，只在第一次反查时建
+            self._spatial = spatial_index.SpatialIndex(self._columns["lat"], self._columns["lon"])
+        return self._spatial.nearest(lats, lons)
+
+
+_gazetteer = None
+_gazetteer_loaded = False
+
+
+def get_gazetteer():
+    """进程内只加载一次；没有库文件时返回 None"""
+    global _gazetteer, _gazetteer_loaded
+    if not _gazetteer_loaded:
+        _gazetteer_loaded = True
+        if os.path.exists(GAZETTEER_PATH):
+            try:
+                _gazetteer = Gazetteer(GAZETTEER_PATH)
+            except (OSError, ValueError):
+                _gazetteer = None
+    return _gazetteer
+
+
+def lookup(name, country=None):
+    """查地名，返回 Place；没有库文件或找不到时返回 None"""
+    gazetteer = get_gazetteer()
+    if gazetteer is None:
+        return None
+    return gazetteer.lookup(name, country)
+
+
+def nearest(lat, lon):
+    """坐标 -> 最近的地点 (Place)；没有库文件时返回 None"""
+    gazetteer = get_gazetteer()
+    if gazetteer is None:
+        return None
+    rows, _ = gazetteer.nearest(lat, lon)
+    return gazetteer.place(int(rows[0]))
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "build" and len(sys.argv) > 2:
+        out = sys.argv[3] if len(sys.argv) > 3 else GAZETTEER_PATH
+        count = build_gazetteer(sys.argv[2], out, progress=lambda n: print(f"  已读取 {n} 条"))
+        print(f"已生成: {out} ({count} 个地点, {os.path.getsize(out) / 1e6:.1f} MB)")
+    elif command == "lookup" and len(sys.argv) > 2:
+        print(lookup(" ".join(sys.argv[2:])))
+    elif command == "nearest" and len(sys.argv) > 3:
+        print(nearest(float(sys.argv[2]), float(sys.argv[3])))
+    else:
+        print("用法: python gazetteer.py [build <GeoNames 文本文件> [输出路径] | lookup <地名> | nearest <纬度> <经度>]")
@@ -0,0 +1,232 @@
+# geocoding.py
+# 联网地理编码层 (离线城市索引和地名库都查不到时才用)：
+#   - 结果缓存：命中永久保存 (设置 HD_GEOCODE_CACHE_DB 时落到 SQLite)，"查无此地" 也缓存一段时间 (NEGATIVE_TTL)，
+#     网络出错只在内存里记几分钟，Streamlit 每次重跑不会再把同一个失败请求重发一遍
+#   - 全进程共用一个地理编码客户端，按 MIN_INTERVAL 限速 (Nominatim 要求每秒最多一次)
+#   - 同一个地名同时被多个会话查询时只发一次请求，其余的等同一个结果
+#   - 后台模式：lookup(..., timeout=秒) 最多等这么久，超时先返回 None，请求在后台继续，
+#     结果写进缓存，下次重跑直接命中
+# 本地调试 / 压测用 StubGeocoder 代替真实网络。
+# resolve() 是完整的查询链：离线城市索引 -> 离线地名库 -> 联网，界面和 HTTP 接口都用它。
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import city_index
+import gazetteer
+from tiered_cache import TieredCache
+
+# === 配置区域 ===
+# 缓存数据库路径 (命中和 "查无此地" 都存这里，重启后仍然有效)；不设置就只用内存
+DB_PATH = os.environ.get("HD_GEOCODE_CACHE_DB")
+
+# "查无此地" 缓存多久 (秒)；网络出错缓存多久 (秒，只在内存里)
+NEGATIVE_TTL = 24 * 3600
+ERROR_TTL = 300
+
+# 两次请求之间至少间隔多少秒
+MIN_INTERVAL = 1.0
+
+# 单次请求超时 (秒)
+REQUEST_TIMEOUT = 5
+
+# 内存层条数
+DEFAULT_MAXSIZE = 2048
+
+USER_AGENT = "my_hd_app_v16_pil"
+
+
+class GeocodeError(Exception):
+    """地理编码服务暂时不可用 (超时、限流、网络错误)，不同于 "查无此地" """
+
+
+class NominatimGeocoder:
+    """geopy Nominatim 的薄封装：客户端只建一次；找不到返回 None，出错抛 GeocodeError"""
+
+    def __init__(self, user_agent=USER_AGENT, timeout=REQUEST_TIMEOUT):
+        from geopy.geocoders import Nominatim
+        self._client = Nominatim(user_agent=user_agent, timeout=timeout)
+
+    def __call__(self, query):
+        from geopy.exc import GeopyError
+        try:
+            location = self._client.geocode(query)
+        except GeopyError as exc:
+            raise GeocodeError(str(exc)) from exc
+        if location is None:
+            return None
+        return location.latitude, location.longitude
+
+
+class StubGeocoder:
+    """
+    本地假地理编码器：查字典，可模拟网络延迟和故障，并记录被调用了多少次
+    places: {地名: (纬度, 经度)}；failing: 这些地名总是抛 GeocodeError
+    """
+
+    def __init__(self, places=None, delay=0.0, failing=()):
+        self.places = dict(places or {})
+        self.delay = delay
+        self.failing = set(failing)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, query):
+        with self._lock:
+            self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if query in self.failing:
+            raise GeocodeError(f"stub failure: {query}")
+        return self.places.get(query)
+
+
+class RateLimiter:
+    """全局最小间隔：每次 wait() 返回时保证距离上一次至少 interval 秒"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def cache_key(query):
+    """规范化的缓存键：全角转半角、小写、去空格标点 ("Beijing " / "ＢＥＩＪＩＮＧ" 同键)"""
+    return city_index._compact(query)
+
+
+class GeocodingService:
+    """带缓存、限速、请求合并和后台模式的地理编码 (线程安全)"""
+
+    def __init__(self, backend=None, db_path=None, maxsize=DEFAULT_MAXSIZE,
+                 negative_ttl=NEGATIVE_TTL, error_ttl=ERROR_TTL, min_interval=MIN_INTERVAL):
+        self._backend = backend
+        self._hits = TieredCache(maxsize, db_path, table="geocode_hits")
+        self._misses = TieredCache(maxsize, db_path, table="geocode_misses", ttl=negative_ttl)
+        self._errors = TieredCache(maxsize, ttl=error_ttl)
+        self._limiter = RateLimiter(min_interval)
+        self._inflight = {}  # 缓存键 -> Future
+        self._lock = threading.Lock()
+        # 限速之下并发没有意义，一个后台线程排队发请求即可
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="geocode")
+        self.requests = 0
+
+    def _get_backend(self):
+        if self._backend is None:
+            self._backend = NominatimGeocoder()
+        return self._backend
+
+    def peek(self, query):
+        """
+        只查缓存，不发请求
+        返回 (是否有缓存, 坐标或 None)
+        """
+        key = cache_key(query)
+        hit = self._hits.get(key)
+        if hit is not None:
+            return True, tuple(json.loads(hit))
+        if self._misses.get(key) is not None or self._errors.get(key) is not None:
+            return True, None
+        return False, None
+
+    def _resolve(self, query, key):
+        try:
+            self._limiter.wait()
+            self.requests += 1
+            result = self._get_backend()(query)
+        except Exception:
+            # GeocodeError 以及客户端自己抛出的任何异常都按 "暂时查不到" 处理，短时间内不再重试
+            self._errors.set(key, "")
+            result = None
+        else:
+            if result is None:
+                self._misses.set(key, "")
+            else:
+                result = (float(result[0]), float(result[1]))
+                self._hits.set(key, json.dumps(result))
+        finally:
+            with self._lock:
+                future = self._inflight.pop(key)
+        future.set_result(result)
+        return result
+
+    def submit(self, query):
+        """
+        后台解析：返回 concurrent.futures.Future，结果为坐标或 None
+        已有缓存的立即完成；同一个键已经在查的，返回同一个 Future
+        """
+        cached, result = self.peek(query)
+        if cached:
+            future = Future()
+            future.set_result(result)
+            return future
+        key = cache_key(query)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = Future()
+                # 上面 peek 之后可能刚好有请求完成并写进了缓存，加锁后再看一眼
+                cached, result = self.peek(query)
+                if cached:
+                    future.set_result(result)
+                    return future
+                self._inflight[key] = future
+                self._executor.submit(self._resolve, query, key)
+        return future
+
+    def lookup(self, query, timeout=None):
+        """
+        查坐标，找不到 (或暂时查不到) 返回 None
+        timeout: 最多等几秒；超时返回 None，请求在后台继续，结果进缓存 (None = 一直等)
+        """
+        if not query or not query.strip():
+            return None
+        try:
+            return self.submit(query.strip()).result(timeout=timeout)
+        except FutureTimeout:
+            return None
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "hits": self._hits.stats(),
+            "misses": self._misses.stats(),
+            "errors": self._errors.stats(),
+            "inflight": len(self._inflight),
+        }
+
+
+# 进程级默认服务 (Streamlit 所有会话共享一个客户端、一个限速器)
+default_service = GeocodingService(db_path=DB_PATH)
+
+
+def lookup(query, timeout=None):
+    """带缓存的联网地理编码，返回 (纬度, 经度) 或 None"""
+    return default_service.lookup(query, timeout)
+
+
+def resolve(city_name, timeout=None):
+    """
+    城市名 -> (纬度, 经度)，都找不到返回 None
+    先查离线索引 (精确 / 去掉市省区后缀 / 前缀 / 错字)，再查离线世界地名库 (有库文件时，
+    同名的取人口最多的)，最后联网；timeout 同 lookup (超时请求在后台继续，下次直接命中缓存)
+    """
+    match = city_index.lookup(city_name)
+    if match:
+        return match.lat, match.lon
+    place = gazetteer.lookup(city_name)
+    if place:
+        return place.lat, place.lon
+    return lookup(city_name, timeout)
@@ -0,0 +1,212 @@
+# interpretation.py
+# 首次解读 ("生成盘面并深度解读" 那份 600 字报告) 的缓存层。
+# 系统提示词完全由几项盘面特征决定 (名字、城市、类型、人生角色、意识/潜意识太阳、定义中心)，
+# 这里先把特征抽出来，提示词只从特征渲染，再对盘面特征 (+ 提示词版本、模型、温度) 求规范化指纹：
+#   - 城市进指纹 (模型要围绕出生城市写能量致意)；名字不进：生成首次解读时提示词里只放占位符 NAME_SLOT，
+#     缓存的是带占位符的模板，输出 (生成和回放都一样) 时再换成这位用户的名字
+#   - 模型没有原样写出占位符 (漏了、改了括号) 的回复照常给这位用户，但不进缓存，免得把 "姓名" 回放给别人
+#   - 同一个指纹最多生成 VARIANTS 份解读 (温度很高，留几份让重复查询也有变化)，
+#     凑够之后随机挑一份回放，不再调用模型 (0 token，几乎没有延迟)
+#   - 回放也是流式的 (按 REPLAY_CHUNK 个字一段吐出)，界面代码不用区分是不是命中
+#   - 内存 LRU + 可选 SQLite 磁盘层 (TieredCache)，只缓存完整生成的回复，中途出错的不存
+# 本地调试用 fake_llm_server.py 代替真实模型。
+
+import hashlib
+import json
+import os
+import random
+import threading
+
+import calculation
+import llm_client
+from tiered_cache import TieredCache
+
+# === 配置区域 ===
+# 提示词模板改了就加一，旧缓存自动作废
+PROMPT_VERSION = 3
+
+# 模型和温度 (也参与指纹)，和真正调用模型的客户端保持一致
+MODEL = llm_client.MODEL
+TEMPERATURE = llm_client.TEMPERATURE
+
+# 每个指纹最多缓存几份解读 (0 = 不缓存，每次都调用模型)
+VARIANTS = int(os.environ.get("HD_INTERPRETATION_VARIANTS", "3"))
+
+# 内存层条数；磁盘层路径 (不设置就只用内存)
+DEFAULT_MAXSIZE = 512
+DB_PATH = os.environ.get("HD_INTERPRETATION_CACHE_DB")
+
+# 回放时每段多少个字
+REPLAY_CHUNK = 24
+
+FIRST_READING_REQUEST = "请基于我的数据，给我一份完整、深度的整体解读报告。"
+
+# 首次解读里名字的占位符 (模型原样写出，输出时替换)
+NAME_SLOT = "【姓名】"
+SLOT_INSTRUCTION = f"称呼我时原样写“{NAME_SLOT}”，不要换成别的称呼。"
+# 占位符之外还出现这个词，说明模型改写了占位符，这份回复不能缓存
+SLOT_WORD = "姓名"
+
+# 参与指纹的特征 (城市 + 盘面；名字走占位符)
+FINGERPRINT_FIELDS = ("city", "type", "profile", "personality_sun", "design_sun", "defined_centers")
+
+
+def prompt_features(name, city, chart_data):
+    """系统提示词里用到的全部盘面特征 (只有这些会影响解读)"""
+    p_sun = chart_data['personality']['Sun']
+    d_sun = (chart_data['design'] or {}).get('Sun')
+    centers = set(chart_data['defined_centers'])
+    return {
+        "name": name.strip(),
+        "city": city.strip(),
+        "type": chart_data['type'],
+        "profile": chart_data['profile'],
+        "personality_sun": p_sun['text'] if p_sun else '未知',
+        "design_sun": d_sun['text'] if d_sun else '未知',
+        # 按固定的中心顺序排，和计算时的顺序无关
+        "defined_centers": [c for c in calculation.CENTERS if c in centers],
+    }
+
+
+def build_system_prompt(features):
+    """从特征渲染系统提示词 (不能用到特征以外的任何东西，否则指纹会漏)"""
+    f = features
+    return f"""
+# 角色
+你叫“活活”，资深人类图分析师。
+# 核心指令
+**必须掌握对话主动权**。每次回复最后必须抛出一个引导性反问句。
+# 回复逻辑
+## 第一阶段：深度首秀
+直接输出 600字 综合解读：
+1. 能量致意（连接 {f['city']}）。
+2. 核心画像（{f['type']} + {f['profile']} 的比喻）。
+3. 光之天赋（意识太阳 {f['personality_sun']}）。
+4. 暗之动力（潜意识太阳 {f['design_sun']}）。
+5. 灵魂拷问。
+## 第二阶段：后续互动
+短小精悍，结合生活场景追问。
+---
+# 用户数据
+姓名：{f['name']}
+城市：{f['city']}
+类型：{f['type']}
+人生角色：{f['profile']}
+定义中心：{', '.join(f['defined_centers'])}
+"""
+
+
+def first_reading_messages(features):
+    """首次解读的请求：名字换成占位符，同城市同一张盘的请求对谁都一样"""
+    template = dict(features, name=NAME_SLOT)
+    return [
+        {"role": "system", "content": build_system_prompt(template)},
+        {"role": "user", "content": FIRST_READING_REQUEST + SLOT_INSTRUCTION},
+    ]
+
+
+def fingerprint(features, model=MODEL, temperature=TEMPERATURE):
+    """城市和盘面特征 + 提示词版本 + 模型参数的规范化哈希 (名字和其它字段不影响)"""
+    chart = {key: features[key] for key in FINGERPRINT_FIELDS}
+    payload = {"v": PROMPT_VERSION, "model": model, "temperature": temperature, "features": chart}
+    text = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _partial_slot(text):
+    """text 结尾有多少个字可能是半个占位符 (要等下一段才知道)"""
+    for size in range(min(len(text), len(NAME_SLOT) - 1), 0, -1):
+        if NAME_SLOT.startswith(text[-size:]):
+            return size
+    return 0
+
+
+def is_template(reply):
+    """回复里原样写了占位符，且占位符之外没有残留的 "姓名" (模型没把占位符改写成别的样子)"""
+    return NAME_SLOT in reply and SLOT_WORD not in reply.replace(NAME_SLOT, "")
+
+
+def personalize(pieces, features):
+    """逐段把占位符换成名字；占位符被切在两段之间时先扣住结尾，等下一段拼上再换"""
+    pending = ""
+    for piece in pieces:
+        pending = (pending + piece).replace(NAME_SLOT, features["name"])
+        keep = _partial_slot(pending)
+        if len(pending) > keep:
+            yield pending[:len(pending) - keep]
+            pending = pending[len(pending) - keep:]
+    if pending:
+        yield pending
+
+
+def replay(text, chunk=REPLAY_CHUNK):
+    """把缓存的整段回复切成小段流式吐出"""
+    for i in range(0, len(text), chunk):
+        yield text[i:i + chunk]
+
+
+class InterpretationCache:
+    """
+    首次解读缓存 (线程安全)
+    generate(messages) 由调用方提供：调用模型，逐段返回文字 (出错可以抛异常，也可以提前结束)
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, db_path=None, variants=VARIANTS):
+        self.variants = variants
+        self._cache = TieredCache(maxsize, db_path, table="interpretation_cache")
+        self._lock = threading.Lock()
+        self.generated = 0
+        self.replayed = 0
+
+    def get_variants(self, key):
+        text = self._cache.get(key)
+        return json.loads(text) if text is not None else []
+
+    def add_variant(self, key, reply):
+        """
+        存一份新解读 (读-改-写要加锁；已经凑够的不再加)
+        和已有的一字不差也照样算一份 (温度为 0 的模型永远只会给同一份，不能因此一直重新生成)
+        """
+        with self._lock:
+            stored = self.get_variants(key)
+            if len(stored) < self.variants:
+                stored.append(reply)
+                self._cache.set(key, json.dumps(stored, ensure_ascii=False))
+
+    def stream(self, features, generate, model=MODEL, temperature=TEMPERATURE):
+        """
+        流式返回一份首次解读 (已换成这位用户的名字)：
+        变体已凑够就随机回放一份，否则调用 generate 生成并在结束后存下 (存的是带占位符的模板)
+        """
+        return personalize(self._stream_template(features, generate, model, temperature), features)
+
+    def _stream_template(self, features, generate, model, temperature):
+        key = fingerprint(features, model, temperature)
+        stored = self.get_variants(key)
+        if stored and len(stored) >= self.variants:
+            self.replayed += 1
+            yield from replay(random.choice(stored))
+            return
+
+        self.generated += 1
+        parts = []
+        for piece in generate(first_reading_messages(features)):
+            parts.append(piece)
+            yield piece
+        reply = "".join(parts)
+        # 调用方提前停止迭代 (GeneratorExit) 或 generate 抛异常时走不到这里，半截回复不会进缓存；
+        # 占位符没写对的回复这位用户照样看到了，但不存 (回放给别人会带出 "姓名" 或别人的称呼)
+        if is_template(reply):
+            self.add_variant(key, reply)
+
+    def stats(self):
+        return {"generated": self.generated, "replayed": self.replayed, "cache": self._cache.stats()}
+
+
+# 进程级默认缓存 (Streamlit 所有会话共享)
+default_cache = InterpretationCache(db_path=DB_PATH)
+
+
+def stream_first_reading(features, generate, model=MODEL, temperature=TEMPERATURE):
+    """带缓存的首次解读，逐段返回文字"""
+    return default_cache.stream(features, generate, model, temperature)
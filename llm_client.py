@@ -0,0 +1,271 @@
+# llm_client.py
+# 异步流式 LLM 客户端 (OpenAI 兼容接口，DeepSeek / 本地 fake_llm_server)：
+#   - 整个进程共用一个 AsyncOpenAI 客户端 (连接池复用，不用每次重新握手)，跑在一个后台事件循环线程里，
+#     Streamlit 各会话线程通过 LLMService.stream() 同步地逐段取文字
+#   - 分阶段超时：建连 CONNECT_TIMEOUT、首字 FIRST_TOKEN_TIMEOUT、整体 TOTAL_TIMEOUT (含重试)
+#   - 还没吐出任何文字前的失败 (连不上、超时、429、5xx) 按指数退避 + 随机抖动重试；
+#     已经吐出文字后再断就不重试 (重来会让界面上的字重复)，直接报错
+#   - 每次请求记录首字延迟 (TTFT)、token 数和 tokens/sec，stats() 给出汇总
+# 界面刷新用 coalesce()：把逐 token 的小段合并成最多每 FLUSH_INTERVAL 秒一次的刷新，
+# 避免每来一个 token 就把整段 markdown 重新渲染一遍 (回复越长越慢，总量是平方级)。
+
+import asyncio
+import os
+import queue
+import random
+import statistics
+import threading
+import time
+from collections import deque, namedtuple
+
+import openai
+
+# === 配置区域 ===
+BASE_URL = os.environ.get("HD_LLM_BASE_URL", "https://api.deepseek.com")
+MODEL = "deepseek-chat"
+TEMPERATURE = 1.3
+
+# 分阶段超时 (秒)
+CONNECT_TIMEOUT = 5
+FIRST_TOKEN_TIMEOUT = 20
+TOTAL_TIMEOUT = 120
+
+# 重试：最多重试几次；退避基数和上限 (秒)，实际等待在 [0, min(上限, 基数 * 2^n)] 里随机取
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8
+
+# 界面最多每隔多少秒刷新一次
+FLUSH_INTERVAL = 0.05
+
+# 汇总指标保留最近多少次请求
+METRICS_WINDOW = 500
+
+# 一次请求的指标：ttft / duration 单位秒 (ttft 从第一次尝试开始算，含重试)；error 为 None 表示成功
+StreamMetrics = namedtuple("StreamMetrics", ["ttft", "duration", "tokens", "tokens_per_sec", "attempts", "error"])
+
+
+class LLMError(Exception):
+    """重试用尽、超时、或回复中途断开"""
+
+
+class FirstTokenTimeout(Exception):
+    """等首字超时 (可以重试)"""
+
+
+_RETRYABLE = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError, FirstTokenTimeout)
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    """第 attempt 次重试前等多久 (full jitter)"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class AsyncLLMClient:
+    """异步流式客户端；同一个实例只能在一个事件循环里用"""
+
+    def __init__(self, api_key, base_url=BASE_URL, model=MODEL, temperature=TEMPERATURE,
+                 connect_timeout=CONNECT_TIMEOUT, first_token_timeout=FIRST_TOKEN_TIMEOUT,
+                 total_timeout=TOTAL_TIMEOUT, max_retries=MAX_RETRIES):
+        self.model = model
+        self.temperature = temperature
+        self.first_token_timeout = first_token_timeout
+        self.total_timeout = total_timeout
+        self.max_retries = max_retries
+        # 重试自己做 (要区分首字前后)，SDK 自带的关掉；读超时由下面的分阶段超时管
+        self._client = openai.AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0,
+                                          timeout=openai.Timeout(total_timeout, connect=connect_timeout))
+        self.history = deque(maxlen=METRICS_WINDOW)
+        self.retries = 0
+
+    async def _open(self, messages, temperature):
+        """发请求并等到第一段文字，返回 (响应流, 它的迭代器, 第一段文字或 None)"""
+        stream = await self._client.chat.completions.create(
+            model=self.model, messages=messages, temperature=temperature, stream=True,
+            stream_options={"include_usage": True},
+        )
+        iterator = stream.__aiter__()
+        try:
+            async for chunk in iterator:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    return stream, iterator, chunk.choices[0].delta.content
+            return stream, iterator, None
+        except BaseException:
+            await stream.close()
+            raise
+
+    async def stream(self, messages, temperature=None):
+        """
+        逐段返回回复文字；失败抛 LLMError。结束后指标追加到 self.history
+        temperature: 缺省用客户端的设置 (摘要之类要稳定输出的调用可以单独调低)
+        """
+        temperature = self.temperature if temperature is None else temperature
+        start = time.monotonic()
+        deadline = start + self.total_timeout
+        attempts, tokens, ttft, usage_tokens = 0, 0, None, None
+        error = None
+        try:
+            # 1. 建连 + 等首字，失败可以重试
+            while True:
+                attempts += 1
+                budget = min(self.first_token_timeout, deadline - time.monotonic())
+                try:
+                    stream, iterator, first = await asyncio.wait_for(self._open(messages, temperature), budget)
+                    break
+                except asyncio.TimeoutError:
+                    exc = FirstTokenTimeout(f"{budget:.1f} 秒内没有收到首字")
+                except _RETRYABLE as caught:
+                    exc = caught
+                except openai.APIError as caught:
+                    raise LLMError(f"模型服务拒绝了请求: {caught}") from caught
+                if attempts > self.max_retries:
+                    raise LLMError(f"重试 {self.max_retries} 次后仍失败: {exc}") from exc
+                delay = backoff_delay(attempts - 1)
+                if time.monotonic() + delay >= deadline:
+                    raise LLMError(f"超过整体超时 {self.total_timeout} 秒: {exc}") from exc
+                self.retries += 1
+                await asyncio.sleep(delay)
+
+            # 2. 首字之后逐段转发，只受整体超时约束
+            try:
+                if first is not None:
+                    ttft = time.monotonic() - start
+                    tokens += 1
+                    yield first
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise LLMError(f"回复超过整体超时 {self.total_timeout} 秒")
+                    try:
+                        chunk = await asyncio.wait_for(iterator.__anext__(), remaining)
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        raise LLMError(f"回复超过整体超时 {self.total_timeout} 秒") from None
+                    except openai.APIError as caught:
+                        raise LLMError(f"回复中途断开: {caught}") from caught
+                    if chunk.usage is not None:
+                        usage_tokens = chunk.usage.completion_tokens
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        tokens += 1
+                        yield chunk.choices[0].delta.content
+            finally:
+                await stream.close()
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            duration = time.monotonic() - start
+            count = usage_tokens or tokens
+            generating = duration - (ttft or 0)
+            rate = count / generating if ttft is not None and generating > 0 else 0.0
+            self.history.append(StreamMetrics(ttft, duration, count, rate, attempts,
+                                              None if error is None else repr(error)))
+
+    def stats(self):
+        """最近 METRICS_WINDOW 次请求的汇总：成功率、TTFT p50/p95、tokens/sec 中位数、累计重试"""
+        done = list(self.history)
+        ok = [m for m in done if m.error is None and m.ttft is not None]
+        ttfts = sorted(m.ttft for m in ok)
+        return {
+            "requests": len(done),
+            "errors": len(done) - len(ok),
+            "retries": self.retries,
+            "ttft_p50": statistics.median(ttfts) if ttfts else None,
+            "ttft_p95": ttfts[min(len(ttfts) - 1, int(len(ttfts) * 0.95))] if ttfts else None,
+            "tokens_per_sec_p50": statistics.median(m.tokens_per_sec for m in ok) if ok else None,
+        }
+
+    async def aclose(self):
+        await self._client.close()
+
+
+class LLMService:
+    """同步包装：后台线程跑一个事件循环和一个 AsyncLLMClient，供 Streamlit 的同步代码使用 (线程安全)"""
+
+    def __init__(self, client_factory):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True, name="llm-loop")
+        self._thread.start()
+        # 客户端在事件循环线程里创建，连接池只属于这个循环
+        self.client = asyncio.run_coroutine_threadsafe(self._create(client_factory), self._loop).result()
+
+    @staticmethod
+    async def _create(client_factory):
+        return client_factory()
+
+    def stream(self, messages, temperature=None):
+        """逐段返回回复文字 (阻塞迭代)；失败抛 LLMError。调用方提前停止迭代会取消请求"""
+        pieces = queue.Queue()
+
+        async def pump():
+            try:
+                async for piece in self.client.stream(messages, temperature):
+                    pieces.put(("data", piece))
+                pieces.put(("end", None))
+            except BaseException as exc:
+                pieces.put(("error", exc))
+                if isinstance(exc, asyncio.CancelledError):
+                    raise
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self._loop)
+        try:
+            while True:
+                kind, value = pieces.get()
+                if kind == "data":
+                    yield value
+                elif kind == "end":
+                    return
+                elif isinstance(value, asyncio.CancelledError):
+                    raise LLMError("请求被取消")
+                else:
+                    raise value
+        finally:
+            future.cancel()
+
+    def stats(self):
+        return self.client.stats()
+
+    async def _shutdown(self):
+        # 还在收尾的请求 (调用方提前停止迭代后正在取消的) 先等它们结束，再关连接池
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.client.aclose()
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def coalesce(pieces, interval=FLUSH_INTERVAL):
+    """
+    把小段合并成有间隔的刷新：距离上次输出不到 interval 秒就先攒着，最后一段一定输出
+    每次产出的是新增的文字 (不是全文)
+    """
+    buffer = []
+    last_flush = 0.0
+    for piece in pieces:
+        buffer.append(piece)
+        now = time.monotonic()
+        if now - last_flush >= interval:
+            yield "".join(buffer)
+            buffer.clear()
+            last_flush = now
+    if buffer:
+        yield "".join(buffer)
+
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def get_service(api_key, base_url=BASE_URL):
+    """进程级共享的 LLMService (同一个密钥和地址只建一个，Streamlit 重跑也复用连接池)"""
+    with _services_lock:
+        service = _services.get((api_key, base_url))
+        if service is None:
+            service = LLMService(lambda: AsyncLLMClient(api_key, base_url))
+            _services[(api_key, base_url)] = service
+        return service
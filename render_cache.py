@@ -0,0 +1,96 @@
+# render_cache.py
+# 盘面图片缓存：定义中心相同、闸门颜色集合相同的两张盘，画出来的图完全一样。
+# 以 "视觉签名" (定义中心 + {闸门: 颜色} + 输出尺寸/格式 + 素材版本) 的哈希为键，
+# 缓存编码好的 PNG/WebP 字节或 SVG 文本，重复查看和 Streamlit 重跑直接返回字节，不再叠图和编码。
+
+import hashlib
+import json
+import os
+
+import calculation
+import drawer_pil
+import drawer_svg
+from tiered_cache import TieredCache
+
+# === 配置区域 ===
+# 内存层最多保留多少张图 (原尺寸 PNG 一张约 1.6 MB，展示尺寸只有几百 KB)
+DEFAULT_MAXSIZE = 64
+
+# 磁盘层路径 (不设置就只用内存)
+DB_PATH = os.environ.get("HD_RENDER_CACHE_DB")
+
+# 网页展示用的格式："SVG" 矢量 (几 KB，不用叠图)；"PNG" 位图叠图 (导出、或没有几何文件时)
+DISPLAY_FORMAT = os.environ.get("HD_DISPLAY_FORMAT", "SVG")
+
+_assets_version = None
+
+
+def assets_version():
+    """素材版本：images 里文件数 + 最新修改时间 (含几何文件)，改了素材旧缓存自动作废 (每个进程只算一次)"""
+    global _assets_version
+    if _assets_version is None:
+        if os.path.isdir(drawer_pil.IMG_DIR):
+            names = [n for n in os.listdir(drawer_pil.IMG_DIR)
+                     if n.endswith(".png") or n == drawer_svg.GEOMETRY_FILE]
+            newest = max((os.path.getmtime(os.path.join(drawer_pil.IMG_DIR, n)) for n in names), default=0)
+            _assets_version = f"{len(names)}:{int(newest)}"
+        else:
+            _assets_version = "none"
+    return _assets_version
+
+
+def visual_signature(chart_data, width=None, fmt="PNG", quality=None):
+    """
+    规范化的视觉签名哈希：只包含真正影响画面的东西
+    (与 drawer_pil.select_layers 用到的输入一致：定义中心、出现在 gate_list 里的闸门及其颜色)
+    """
+    gate_colors = calculation.chart_gate_colors(chart_data)
+    gates = sorted(set(chart_data.get('gate_list', [])))
+    payload = {
+        "centers": sorted(chart_data.get('defined_centers', [])),
+        "gates": [[g, gate_colors.get(g)] for g in gates],
+        "width": width,
+        "format": fmt.upper(),
+        "quality": quality,
+        "assets": assets_version(),
+    }
+    text = json.dumps(payload, separators=(",", ":"), sort_keys=True)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    """编码后图片字节的两级缓存"""
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, db_path=None):
+        self._cache = TieredCache(maxsize, db_path, table="render_cache")
+
+    def get_image_bytes(self, chart_data, fmt="PNG", width=None, quality=None, engine=None):
+        """
+        取一张盘的编码图片，未命中时按目标宽度叠图、编码并写入缓存
+        fmt="SVG" 时走矢量渲染，返回 UTF-8 编码的 SVG 文本
+        """
+        key = visual_signature(chart_data, width, fmt, quality)
+        data = self._cache.get(key)
+        if data is None:
+            if fmt.upper() == "SVG":
+                data = drawer_svg.create_chart_svg(chart_data, width=width).encode("utf-8")
+            else:
+                image = drawer_pil.create_chart_image(chart_data, engine=engine, width=width)
+                data = drawer_pil.encode_chart_image(image, fmt, quality)
+            self._cache.set(key, data)
+        return data
+
+    def stats(self):
+        return self._cache.stats()
+
+    def clear(self):
+        self._cache.clear()
+
+
+# 进程级默认缓存 (Streamlit 所有会话共享)
+default_cache = RenderCache(db_path=DB_PATH)
+
+
+def get_chart_image_bytes(chart_data, fmt="PNG", width=None, quality=None, engine=None):
+    """带缓存的 drawer_pil.create_chart_image，直接返回编码好的字节"""
+    return default_cache.get_image_bytes(chart_data, fmt, width, quality, engine)
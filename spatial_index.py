@@ -0,0 +1,174 @@
+# spatial_index.py
+# 最近点空间索引 (反向地理编码用：给一批经纬度找最近的城市 / 地名)
+#   - 经纬度先换成单位球面上的三维坐标，球面上最近 = 三维直线距离最近，
+#     不用处理 180° 经线和两极附近的变形
+#   - 静态 KD 树：按最宽的轴对半切，树用数组存 (堆式编号，节点 i 的孩子是 2i+1 / 2i+2)，
+#     每个叶子最多 LEAF_SIZE 个点
+#   - 批量查询全部向量化：所有查询点一起下到各自的叶子得到初始最近距离，
+#     再一层一层只展开 "包围盒比当前最近点还近" 的节点，最后在剩下的叶子里比一遍
+# 结果是精确最近点 (和逐个线性扫描一致)，不是近似。
+# 点很少时 (city_data 只有几百个地点) 树的逐层开销比直接矩阵乘还大，直接线性扫描。
+
+import numpy as np
+
+# === 配置区域 ===
+# 每个叶子最多几个点；越小剪枝越细，但层数和候选对越多
+LEAF_SIZE = 16
+
+# 一次处理多少个查询点 (控制中间数组的内存)
+QUERY_CHUNK = 8192
+
+# 点数不超过这个就不建树，查询时直接线性扫描
+BRUTE_FORCE_MAX = 1024
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_xyz(lats, lons):
+    """经纬度 (度) -> 单位球面三维坐标，形状 (n, 3)"""
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lon = np.radians(np.asarray(lons, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def chord_to_km(d2):
+    """单位球上弦长的平方 -> 大圆距离 (公里)"""
+    chord = np.sqrt(np.asarray(d2, dtype=np.float64))
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chord / 2, 1.0))
+
+
+class SpatialIndex:
+    """经纬度点集的最近点索引 (只读，构建后线程安全)"""
+
+    def __init__(self, lats, lons, leaf_size=LEAF_SIZE):
+        points = to_xyz(lats, lons).reshape(-1, 3)
+        n = len(points)
+        if n == 0:
+            raise ValueError("空点集无法建立空间索引")
+        self._points = points
+        if n <= BRUTE_FORCE_MAX:
+            self.depth = None
+            return
+        self.depth = int(np.ceil(np.log2(n / leaf_size))) if n > leaf_size else 0
+        internal = 2 ** self.depth - 1
+        leaves = 2 ** self.depth
+
+        order = np.arange(n)
+        self._split_axis = np.zeros(internal, dtype=np.int8)
+        self._split_value = np.zeros(internal, dtype=np.float64)
+        ranges = [(0, n)]
+        for node in range(internal):
+            # 堆式编号正好是按层从左到右，ranges 里的顺序和节点编号一致
+            start, end = ranges[node]
+            block = points[order[start:end]]
+            axis = int(np.argmax(block.max(axis=0) - block.min(axis=0)))
+            mid = (start + end) // 2
+            part = np.argpartition(block[:, axis], mid - start)
+            order[start:end] = order[start:end][part]
+            self._split_axis[node] = axis
+            self._split_value[node] = points[order[mid], axis]
+            ranges.append((start, mid))
+            ranges.append((mid, end))
+        leaf_ranges = ranges[internal:]
+
+        # 叶子的点号补齐成定长矩阵，空位填 n (指向一个无穷远的哨兵点)
+        width = max(end - start for start, end in leaf_ranges)
+        self._leaf_points = np.full((leaves, width), n, dtype=np.int64)
+        for leaf, (start, end) in enumerate(leaf_ranges):
+            self._leaf_points[leaf, :end - start] = order[start:end]
+        self._padded = np.vstack([points, np.full((1, 3), np.inf)])
+
+        # 每个节点的包围盒：叶子直接算，内部节点由两个孩子合并
+        self._box_min = np.empty((internal + leaves, 3))
+        self._box_max = np.empty((internal + leaves, 3))
+        for leaf, (start, end) in enumerate(leaf_ranges):
+            block = points[order[start:end]]
+            self._box_min[internal + leaf] = block.min(axis=0)
+            self._box_max[internal + leaf] = block.max(axis=0)
+        for node in range(internal - 1, -1, -1):
+            self._box_min[node] = np.minimum(self._box_min[2 * node + 1], self._box_min[2 * node + 2])
+            self._box_max[node] = np.maximum(self._box_max[2 * node + 1], self._box_max[2 * node + 2])
+
+    def __len__(self):
+        return len(self._points)
+
+    def _scan(self, queries, query_ids, leaves):
+        """在 (查询点, 叶子) 对里找最近点，返回每对的 (点号, 距离平方)"""
+        members = self._leaf_points[leaves]
+        diff = self._padded[members] - queries[query_ids][:, None, :]
+        d2 = np.einsum("ijk,ijk->ij", diff, diff)
+        best = np.argmin(d2, axis=1)
+        rows = np.arange(len(leaves))
+        return members[rows, best], d2[rows, best]
+
+    def _query_chunk(self, queries):
+        count = len(queries)
+        internal = 2 ** self.depth - 1
+        everyone = np.arange(count)
+
+        # 1. 下到查询点所在的叶子，得到一个初始最近点
+        node = np.zeros(count, dtype=np.int64)
+        for _ in range(self.depth):
+            axis = self._split_axis[node]
+            right = queries[everyone, axis] >= self._split_value[node]
+            node = 2 * node + 1 + right
+        home = node
+        best_idx, best_d2 = self._scan(queries, everyone, home - internal)
+
+        # 2. 从根开始只展开包围盒到查询点的距离小于当前最近距离的节点
+        query_ids = everyone
+        nodes = np.zeros(count, dtype=np.int64)
+        for _ in range(self.depth):
+            query_ids = np.repeat(query_ids, 2)
+            nodes = (2 * np.repeat(nodes, 2) + 1) + np.tile([0, 1], len(nodes))
+            q = queries[query_ids]
+            gap = np.maximum(self._box_min[nodes] - q, 0) + np.maximum(q - self._box_max[nodes], 0)
+            keep = np.einsum("ij,ij->i", gap, gap) < best_d2[query_ids]
+            keep &= nodes != home[query_ids]
+            query_ids, nodes = query_ids[keep], nodes[keep]
+
+        # 3. 剩下的叶子逐个比一遍，每个查询点取最小
+        if len(query_ids):
+            idx, d2 = self._scan(queries, query_ids, nodes - internal)
+            order = np.lexsort((d2, query_ids))
+            query_ids, idx, d2 = query_ids[order], idx[order], d2[order]
+            first = np.ones(len(query_ids), dtype=bool)
+            first[1:] = query_ids[1:] != query_ids[:-1]
+            query_ids, idx, d2 = query_ids[first], idx[first], d2[first]
+            better = d2 < best_d2[query_ids]
+            best_idx[query_ids[better]] = idx[better]
+            best_d2[query_ids[better]] = d2[better]
+        return best_idx, best_d2
+
+    def nearest(self, lats, lons):
+        """
+        批量最近点查询
+        返回 (点号数组, 距离数组/公里)，点号是建索引时传入的点的下标
+        """
+        queries = to_xyz(np.atleast_1d(lats), np.atleast_1d(lons)).reshape(-1, 3)
+        if self.depth is None:
+            return _linear_scan(queries, self._points)
+        indices = np.empty(len(queries), dtype=np.int64)
+        d2 = np.empty(len(queries), dtype=np.float64)
+        for start in range(0, len(queries), QUERY_CHUNK):
+            chunk = slice(start, start + QUERY_CHUNK)
+            indices[chunk], d2[chunk] = self._query_chunk(queries[chunk])
+        return indices, chord_to_km(d2)
+
+
+def _linear_scan(queries, points, max_cells=4_000_000):
+    indices = np.empty(len(queries), dtype=np.int64)
+    chunk = max(1, max_cells // len(points))
+    for start in range(0, len(queries), chunk):
+        # 单位向量：距离平方 = 2 - 2 * 点积，点积最大的就是最近的
+        indices[start:start + chunk] = np.argmax(queries[start:start + chunk] @ points.T, axis=1)
+    diff = points[indices] - queries
+    return indices, chord_to_km(np.einsum("ij,ij->i", diff, diff))
+
+
+def brute_force_nearest(lats, lons, point_lats, point_lons):
+    """线性扫描的最近点 (对照用)，返回值同 SpatialIndex.nearest"""
+    points = to_xyz(point_lats, point_lons).reshape(-1, 3)
+    queries = to_xyz(np.atleast_1d(lats), np.atleast_1d(lons)).reshape(-1, 3)
+    return _linear_scan(queries, points)
@@ -0,0 +1,99 @@
+"""
+联网地理编码层 (geocoding) 的测试，网络用本地假地理编码器 StubGeocoder
+运行: python -m pytest tests
+"""
+import threading
+import time
+
+import pytest
+
+import geocoding
+
+PLACES = {"Reykjavik": (64.1466, -21.9426), "Ushuaia": (-54.8019, -68.3030)}
+
+
+@pytest.fixture
+def stub():
+    return geocoding.StubGeocoder(PLACES, delay=0.2, failing={"Offline"})
+
+
+@pytest.fixture
+def service(stub):
+    return geocoding.GeocodingService(stub, min_interval=0.0)
+
+
+# ================= 请求合并 =================
+
+def test_concurrent_lookups_send_one_request(stub, service):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(service.lookup("Reykjavik")))
+               for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [PLACES["Reykjavik"]] * 10
+    assert stub.calls == 1
+
+
+def test_normalized_queries_share_cache(stub, service):
+    assert service.lookup("Reykjavik") == PLACES["Reykjavik"]
+    assert service.lookup(" reykjavik ") == PLACES["Reykjavik"]
+    assert stub.calls == 1
+
+
+# ================= 负缓存 =================
+
+def test_unknown_place_is_cached(stub, service):
+    assert service.lookup("Atlantis") is None
+    assert service.lookup("Atlantis") is None
+    assert stub.calls == 1
+    assert service.peek("Atlantis") == (True, None)
+
+
+def test_error_is_cached_briefly(stub):
+    service = geocoding.GeocodingService(stub, min_interval=0.0, error_ttl=0.3)
+    assert service.lookup("Offline") is None
+    assert service.lookup("Offline") is None
+    assert stub.calls == 1
+    time.sleep(0.4)
+    assert service.lookup("Offline") is None
+    assert stub.calls == 2
+
+
+# ================= SQLite 持久化 =================
+
+def test_sqlite_survives_restart(stub, tmp_path):
+    db_path = str(tmp_path / "geocode.db")
+    first = geocoding.GeocodingService(stub, db_path=db_path, min_interval=0.0)
+    assert first.lookup("Reykjavik") == PLACES["Reykjavik"]
+    assert first.lookup("Atlantis") is None
+
+    restarted = geocoding.GeocodingService(stub, db_path=db_path, min_interval=0.0)
+    assert restarted.lookup("Reykjavik") == PLACES["Reykjavik"]
+    assert restarted.lookup("Atlantis") is None
+    assert stub.calls == 2
+    assert restarted.requests == 0
+
+
+def test_errors_are_not_persisted(stub, tmp_path):
+    db_path = str(tmp_path / "geocode.db")
+    geocoding.GeocodingService(stub, db_path=db_path, min_interval=0.0).lookup("Offline")
+    restarted = geocoding.GeocodingService(stub, db_path=db_path, min_interval=0.0)
+    assert restarted.peek("Offline") == (False, None)
+
+
+# ================= 后台模式 =================
+
+def test_timeout_keeps_request_running(stub, service):
+    assert service.lookup("Ushuaia", timeout=0.01) is None
+    service.submit("Ushuaia").result(timeout=2)
+    assert service.lookup("Ushuaia", timeout=0.01) == PLACES["Ushuaia"]
+    assert stub.calls == 1
+
+
+def test_rerun_during_background_request_joins_it(stub, service):
+    assert service.lookup("Ushuaia", timeout=0.01) is None
+    assert service.lookup("Ushuaia") == PLACES["Ushuaia"]
+    assert stub.calls == 1
+
@@ -0,0 +1,174 @@
+"""
+首次解读缓存 (interpretation) 的测试，模型用本地假 LLM 服务 fake_llm_server
+运行: python -m pytest tests
+"""
+from datetime import date, time
+
+import pytest
+
+import calculation
+import interpretation
+import llm_client
+from fake_llm_server import FakeLLMServer
+
+
+@pytest.fixture(scope="module")
+def chart():
+    return calculation.get_chart_data(date(1990, 3, 1), time(8, 30), 39.9042, 116.4074)
+
+
+@pytest.fixture(scope="module")
+def server():
+    server = FakeLLMServer(first_token_delay=0.0, token_delay=0.0, reply_chars=120)
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(scope="module")
+def service(server):
+    service = llm_client.LLMService(lambda: llm_client.AsyncLLMClient("fake", server.url + "/v1"))
+    yield service
+    service.close()
+
+
+@pytest.fixture
+def cache():
+    return interpretation.InterpretationCache(variants=2)
+
+
+def counting(generate):
+    """包一层 generate，记下被调用了几次"""
+    def wrapped(messages):
+        wrapped.calls += 1
+        return generate(messages)
+    wrapped.calls = 0
+    return wrapped
+
+
+# ================= 指纹 =================
+
+def test_fingerprint_is_stable(chart):
+    a = interpretation.prompt_features("活活", "北京", chart)
+    b = interpretation.prompt_features("活活", "北京", dict(chart, defined_centers=chart['defined_centers'][::-1]))
+    assert interpretation.fingerprint(a) == interpretation.fingerprint(b)
+    assert interpretation.fingerprint(a) == interpretation.fingerprint(dict(reversed(list(a.items()))))
+
+
+def test_fingerprint_ignores_name_and_other_fields(chart):
+    a = interpretation.prompt_features("活活", "北京", chart)
+    b = interpretation.prompt_features("Wanye", "北京", dict(chart, authority="?", active_channels=[]))
+    assert interpretation.fingerprint(a) == interpretation.fingerprint(b)
+    assert interpretation.fingerprint(a) == interpretation.fingerprint(dict(a, extra="不相关"))
+
+
+def test_fingerprint_changes_with_city_chart_and_model(chart):
+    a = interpretation.prompt_features("活活", "北京", chart)
+    assert interpretation.fingerprint(a) != interpretation.fingerprint(dict(a, city="London"))
+    assert interpretation.fingerprint(a) != interpretation.fingerprint(dict(a, profile="6 / 2"))
+    assert interpretation.fingerprint(a) != interpretation.fingerprint(a, model="other-model")
+    assert interpretation.fingerprint(a) != interpretation.fingerprint(a, temperature=0.0)
+
+
+def test_request_has_city_but_not_name(chart):
+    features = interpretation.prompt_features("独一无二的名字", "乌鲁木齐", chart)
+    text = "".join(m["content"] for m in interpretation.first_reading_messages(features))
+    assert "独一无二的名字" not in text and interpretation.NAME_SLOT in text
+    assert "连接 乌鲁木齐" in text
+
+
+# ================= 变体与回放 =================
+
+def test_variant_cap(chart, service, cache):
+    features = interpretation.prompt_features("活活", "北京", chart)
+    generate = counting(service.stream)
+    for _ in range(5):
+        assert "".join(cache.stream(features, generate))
+    assert generate.calls == 2
+    assert len(cache.get_variants(interpretation.fingerprint(features))) == 2
+    assert (cache.generated, cache.replayed) == (2, 3)
+
+
+def test_replay_sends_no_model_request(chart, server, service, cache):
+    features = interpretation.prompt_features("活活", "北京", chart)
+    generated = {"".join(cache.stream(features, service.stream)) for _ in range(cache.variants)}
+    before = server.requests
+    for _ in range(3):
+        assert "".join(cache.stream(features, service.stream)) in generated
+    assert server.requests == before
+
+
+def test_replay_is_personalized_per_user(chart, cache):
+    template = f"{interpretation.NAME_SLOT}，你好！{interpretation.NAME_SLOT}，来自北京的能量。"
+
+    def generate(messages):
+        # 占位符故意切在两段之间
+        yield from (template[i:i + 3] for i in range(0, len(template), 3))
+
+    first = interpretation.prompt_features("活活", "北京", chart)
+    second = interpretation.prompt_features("Wanye", "北京", chart)
+    for _ in range(cache.variants):
+        assert "".join(cache.stream(first, generate)) == "活活，你好！活活，来自北京的能量。"
+    assert "".join(cache.stream(second, generate)) == "Wanye，你好！Wanye，来自北京的能量。"
+    assert cache.replayed == 1
+    assert cache.get_variants(interpretation.fingerprint(first)) == [template] * cache.variants
+
+
+# ================= 失败不进缓存 =================
+
+def test_failed_stream_is_not_cached(chart, cache):
+    features = interpretation.prompt_features("活活", "北京", chart)
+
+    def generate(messages):
+        yield "半截回复"
+        raise llm_client.LLMError("回复中途断开")
+
+    with pytest.raises(llm_client.LLMError):
+        "".join(cache.stream(features, generate))
+    assert cache.get_variants(interpretation.fingerprint(features)) == []
+
+
+def test_server_error_is_not_cached(chart):
+    server = FakeLLMServer(first_token_delay=0.0, token_delay=0.0, fail_every=1, fail_status=400)
+    server.start()
+    service = llm_client.LLMService(lambda: llm_client.AsyncLLMClient("fake", server.url + "/v1"))
+    try:
+        cache = interpretation.InterpretationCache(variants=2)
+        features = interpretation.prompt_features("活活", "北京", chart)
+        with pytest.raises(llm_client.LLMError):
+            "".join(cache.stream(features, service.stream))
+        assert cache.get_variants(interpretation.fingerprint(features)) == []
+    finally:
+        service.close()
+        server.stop()
+
+
+def test_reply_without_slot_is_not_cached(chart):
+    server = FakeLLMServer(first_token_delay=0.0, token_delay=0.0, reply_chars=120, keep_slots=False)
+    server.start()
+    service = llm_client.LLMService(lambda: llm_client.AsyncLLMClient("fake", server.url + "/v1"))
+    try:
+        cache = interpretation.InterpretationCache(variants=1)
+        features = interpretation.prompt_features("活活", "北京", chart)
+        for _ in range(2):
+            assert "".join(cache.stream(features, service.stream))
+        assert server.requests == 2
+        assert cache.get_variants(interpretation.fingerprint(features)) == []
+    finally:
+        service.close()
+        server.stop()
+
+
+@pytest.mark.parametrize("reply", ["[姓名]，你好！", "姓名，你好！", "【姓名】，你好！姓名：活活"])
+def test_rewritten_slot_is_not_cached(chart, cache, reply):
+    features = interpretation.prompt_features("活活", "北京", chart)
+    assert "".join(cache.stream(features, lambda messages: iter([reply])))
+    assert cache.get_variants(interpretation.fingerprint(features)) == []
+
+
+def test_abandoned_stream_is_not_cached(chart, service, cache):
+    features = interpretation.prompt_features("活活", "北京", chart)
+    stream = cache.stream(features, service.stream)
+    assert next(stream)
+    stream.close()
+    assert cache.get_variants(interpretation.fingerprint(features)) == []
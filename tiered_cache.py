@@ -0,0 +1,96 @@
+# tiered_cache.py
+# 通用两级缓存：内存 LRU (条数有上限) + 可选 SQLite 磁盘层 (进程重启后依然有效)。
+# 值只能是 str 或 bytes，调用方自己负责序列化；每次取出的都是不可变对象，不会被调用方改坏。
+# 盘面缓存、图片缓存等都建在它上面。
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class TieredCache:
+    """
+    线程安全 (Streamlit 每个会话跑在不同线程)
+    ttl (秒) 为 None 时永不过期；过期的条目在读取时当作未命中
+    """
+
+    def __init__(self, maxsize, db_path=None, table="cache", ttl=None):
+        self.maxsize = maxsize
+        self.db_path = db_path
+        self.table = table
+        self.ttl = ttl
+        self._memory = OrderedDict()  # key -> (value, 写入时间)
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, stored_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def _expired(self, stored_at):
+        return self.ttl is not None and time.time() - stored_at > self.ttl
+
+    def _remember(self, key, value, stored_at):
+        self._memory[key] = (value, stored_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """先查内存再查磁盘，未命中 (或已过期) 返回 None"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and not self._expired(entry[1]):
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    f"SELECT value, stored_at FROM {self.table} WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and not self._expired(row[1]):
+                    self._remember(key, row[0], row[1])
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        stored_at = time.time()
+        with self._lock:
+            self._remember(key, value, stored_at)
+            if self._db is not None:
+                self._db.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, stored_at) VALUES (?, ?, ?)",
+                    (key, value, stored_at),
+                )
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "size": len(self._memory),
+                "maxsize": self.maxsize,
+            }
+
+    def clear(self):
+        """清空两级缓存和计数"""
+        with self._lock:
+            self._memory.clear()
+            self.hits = self.disk_hits = self.misses = 0
+            if self._db is not None:
+                self._db.execute(f"DELETE FROM {self.table}")
+                self._db.commit()
@@ -0,0 +1,375 @@
+# timezone_index.py
+# 离线时区解析：出生地坐标 -> IANA 时区名 -> 按历史规则换算 UTC (含中国 1986-1991 夏令时、欧美夏令时)。
+# 时区边界来自 timezone-boundary-builder 的 GeoJSON，预处理成一个二进制索引文件，运行时内存映射：
+#   - 1 度见方的网格：整格都落在同一个时区里的直接存时区号，不用做任何几何运算；
+#     边界经过的格子只存可能的候选多边形 (外加盖住整格的那个时区)
+#   - 按 1 度纬度条带分桶的多边形边：射线法判断点在不在多边形里时，只需要看和这条纬线相交的那一条带里的边
+# 同一个坐标的查询结果会缓存。没有索引文件时退而求其次 (会打一条警告)：
+#   离线世界地名库 (gazetteer.bin) 里最近地点的时区 -> 离线城市库 (city_data) 里最近城市的时区
+#   -> 按经度取 Etc/GMT±N。只有连坐标都没有时才直接用 DEFAULT_TIMEZONE。
+#
+# 生成:   python timezone_index.py build <combined.json> [输出路径]
+# 查询:   python timezone_index.py lookup <纬度> <经度>
+
+import json
+import logging
+import math
+import os
+import struct
+import sys
+from datetime import timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+# === 配置区域 ===
+# 默认索引文件位置，可用环境变量覆盖
+INDEX_PATH = os.environ.get(
+    "HD_TIMEZONE_INDEX",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "timezones.bin"),
+)
+
+# 文件头魔数 (带版本号)
+MAGIC = b"HDTZI001"
+
+# 网格边长 (度)
+CELL_DEG = 1.0
+
+# 没有坐标时使用的时区 (没有索引文件时，离线城市库附近的坐标也用它)
+DEFAULT_TIMEZONE = "Asia/Shanghai"
+
+# 没有索引文件时的退路：最近的地名库地点 / 离线城市在多少公里以内才采用
+NEAREST_PLACE_MAX_KM = 300
+NEAREST_CITY_MAX_KM = 100
+
+# 离线城市库里不在 DEFAULT_TIMEZONE 的城市 (港澳和国际兜底城市)：(时区, 半径/公里)，其余都是内地城市
+# 港澳半径取得小：离市中心稍远就是深圳 / 珠海 (内地有 1986-1991 夏令时，香港没有)
+CITY_TIMEZONES = {
+    "香港": ("Asia/Hong_Kong", 18), "澳门": ("Asia/Macau", 8),
+    "纽约": ("America/New_York", NEAREST_CITY_MAX_KM), "伦敦": ("Europe/London", NEAREST_CITY_MAX_KM),
+    "东京": ("Asia/Tokyo", NEAREST_CITY_MAX_KM), "巴黎": ("Europe/Paris", NEAREST_CITY_MAX_KM),
+    "新加坡": ("Asia/Singapore", NEAREST_CITY_MAX_KM),
+}
+
+# 坐标缓存精度：小数点后 4 位 (约 11 米)
+CACHE_DECIMALS = 4
+
+logger = logging.getLogger(__name__)
+
+_ROWS = int(round(180 / CELL_DEG))
+_COLS = int(round(360 / CELL_DEG))
+
+
+def _row(lat):
+    return min(max(int(math.floor((lat + 90.0) / CELL_DEG)), 0), _ROWS - 1)
+
+
+def _col(lon):
+    return int(math.floor((lon + 180.0) / CELL_DEG)) % _COLS
+
+
+def _crossings(x1, y1, x2, y2, x, y):
+    """射线法：从 (x, y) 向东的射线穿过多少条边"""
+    spans = (y1 > y) != (y2 > y)
+    if not spans.any():
+        return 0
+    x1, y1, x2, y2 = x1[spans], y1[spans], x2[spans], y2[spans]
+    x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    return int(np.count_nonzero(x < x_cross))
+
+
+def ocean_timezone(lon):
+    """海上没有行政时区，按经度取 Etc/GMT±N (注意 Etc 时区的符号与常识相反)"""
+    hours = int(round(lon / 15.0))
+    if hours == 0:
+        return "Etc/GMT"
+    return f"Etc/GMT{-hours:+d}"
+
+
+# ================= 生成 =================
+
+def _polygons(geojson_path):
+    """逐个产出 (时区名, [外环, 内环...])，环为 [(经度, 纬度), ...]"""
+    with open(geojson_path, encoding="utf-8") as f:
+        data = json.load(f)
+    for feature in data["features"]:
+        tzid = feature["properties"]["tzid"]
+        geometry = feature["geometry"]
+        if geometry["type"] == "Polygon":
+            yield tzid, geometry["coordinates"]
+        elif geometry["type"] == "MultiPolygon":
+            for polygon in geometry["coordinates"]:
+                yield tzid, polygon
+
+
+def build_index(geojson_path, path=INDEX_PATH, progress=None):
+    """
+    把时区边界 GeoJSON 写成二进制索引文件，返回多边形数
+    文件结构: MAGIC | uint32 头长度 | JSON 头 | 8 字节对齐的各列
+    """
+    zones = {}
+    poly_zone = []
+    edges = []  # 每个多边形一组 (x1, y1, x2, y2) 数组，外环内环的边放在一起
+    for tzid, rings in _polygons(geojson_path):
+        parts = []
+        for ring in rings:
+            ring = np.asarray(ring, dtype=np.float64)[:, :2]
+            if len(ring) > 1 and (ring[0] == ring[-1]).all():
+                ring = ring[:-1]
+            if len(ring) < 3:
+                continue
+            nxt = np.roll(ring, -1, axis=0)
+            parts.append(np.column_stack([ring, nxt]))
+        if parts:
+            poly_zone.append(zones.setdefault(tzid, len(zones)))
+            edges.append(np.concatenate(parts))
+        if progress and len(poly_zone) % 1000 == 0:
+            progress(len(poly_zone))
+
+    # 1. 边按 (纬度条带, 多边形) 分桶；跨多条带的边在每条带里都放一份
+    strip_rows, strip_polys, strip_edges = [], [], []
+    cell_pairs = set()  # (格子号, 多边形) —— 有边经过的格子
+    for poly, e in enumerate(edges):
+        ymin = np.minimum(e[:, 1], e[:, 3])
+        ymax = np.maximum(e[:, 1], e[:, 3])
+        r0 = np.clip(np.floor((ymin + 90.0) / CELL_DEG).astype(np.int64), 0, _ROWS - 1)
+        r1 = np.clip(np.floor((ymax + 90.0) / CELL_DEG).astype(np.int64), 0, _ROWS - 1)
+        xmin = np.minimum(e[:, 0], e[:, 2])
+        xmax = np.maximum(e[:, 0], e[:, 2])
+        c0 = np.clip(np.floor((xmin + 180.0) / CELL_DEG).astype(np.int64), 0, _COLS - 1)
+        c1 = np.clip(np.floor((xmax + 180.0) / CELL_DEG).astype(np.int64), 0, _COLS - 1)
+
+        for row in range(int(r0.min()), int(r1.max()) + 1):
+            mask = (r0 <= row) & (r1 >= row)
+            if mask.any():
+                strip_rows.append(row)
+                strip_polys.append(poly)
+                strip_edges.append(e[mask])
+        # 边的包围盒覆盖到的格子都算 "有边经过" (长斜边会多标几个，只影响速度不影响结果)
+        for a, b, c, d in set(zip(r0.tolist(), r1.tolist(), c0.tolist(), c1.tolist())):
+            for row in range(a, b + 1):
+                for col in range(c, d + 1):
+                    cell_pairs.add((row * _COLS + col, poly))
+
+    order = sorted(range(len(strip_rows)), key=lambda i: (strip_rows[i], strip_polys[i]))
+    row_offset = np.zeros(_ROWS + 1, dtype="<u4")
+    strip_poly = np.empty(len(order), dtype="<u4")
+    strip_offset = np.zeros(len(order) + 1, dtype="<u4")
+    edge_blocks = []
+    for k, i in enumerate(order):
+        row_offset[strip_rows[i] + 1] += 1
+        strip_poly[k] = strip_polys[i]
+        strip_offset[k + 1] = strip_offset[k] + len(strip_edges[i])
+        edge_blocks.append(strip_edges[i])
+    row_offset = np.cumsum(row_offset, dtype=np.uint64).astype("<u4")
+    edge_array = (np.concatenate(edge_blocks) if edge_blocks else np.zeros((0, 4))).astype("<f4")
+
+    index = _StripIndex(row_offset, strip_poly, strip_offset, edge_array)
+
+    # 2. 网格：有边经过的格子存候选多边形；没有边经过的多边形要么盖住整格、要么完全不沾，
+    #    用格子中心判一次，盖住整格的存成负数 (放在最后，前面的候选都不中才用它)
+    by_cell = {}
+    for cell, poly in cell_pairs:
+        by_cell.setdefault(cell, []).append(poly)
+    bboxes = np.array([[e[:, [0, 2]].min(), e[:, [1, 3]].min(), e[:, [0, 2]].max(), e[:, [1, 3]].max()]
+                       for e in edges]) if edges else np.zeros((0, 4))
+
+    cell_offset = np.zeros(_ROWS * _COLS + 1, dtype="<u4")
+    cell_items = []
+    for cell in range(_ROWS * _COLS):
+        row, col = divmod(cell, _COLS)
+        items = sorted(by_cell.get(cell, []))
+        lat = -90.0 + (row + 0.5) * CELL_DEG
+        lon = -180.0 + (col + 0.5) * CELL_DEG
+        hits = np.nonzero((bboxes[:, 0] <= lon) & (lon <= bboxes[:, 2]) &
+                          (bboxes[:, 1] <= lat) & (lat <= bboxes[:, 3]))[0].tolist()
+        for poly in hits:
+            if poly not in items and index.contains(poly, lat, lon):
+                items.append(-(poly_zone[poly] + 1))
+                break
+        cell_items.extend(items)
+        cell_offset[cell + 1] = len(cell_items)
+
+    arrays = {
+        "poly_zone": np.array(poly_zone, dtype="<u2"),
+        "row_offset": row_offset,
+        "strip_poly": strip_poly,
+        "strip_offset": strip_offset,
+        "edges": edge_array.reshape(-1),
+        "cell_offset": cell_offset,
+        "cell_items": np.array(cell_items, dtype="<i4"),
+    }
+
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = {"dtype": array.dtype.str, "count": len(array), "offset": offset}
+        offset += array.nbytes + (-array.nbytes) % 8
+
+    header = json.dumps({
+        "cell_deg": CELL_DEG,
+        "zones": sorted(zones, key=zones.get),
+        "columns": layout,
+    }).encode("utf-8")
+    prefix_len = len(MAGIC) + 4 + len(header)
+    padding = (-prefix_len) % 8
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header) + padding))
+        f.write(header + b" " * padding)
+        for array in arrays.values():
+            f.write(array.tobytes())
+            f.write(b"\0" * ((-array.nbytes) % 8))
+    os.replace(tmp_path, path)
+    return len(poly_zone)
+
+
+# ================= 加载与查询 =================
+
+class _StripIndex:
+    """按纬度条带分桶的多边形边 (生成和查询共用)"""
+
+    def __init__(self, row_offset, strip_poly, strip_offset, edges):
+        self.row_offset = row_offset
+        self.strip_poly = strip_poly
+        self.strip_offset = strip_offset
+        self.edges = edges.reshape(-1, 4)
+
+    def contains(self, poly, lat, lon):
+        """点是否在多边形 poly 内 (外环内环一起做射线奇偶判断)"""
+        row = _row(lat)
+        lo, hi = int(self.row_offset[row]), int(self.row_offset[row + 1])
+        k = lo + int(np.searchsorted(self.strip_poly[lo:hi], poly))
+        if k >= hi or self.strip_poly[k] != poly:
+            return False
+        e = self.edges[int(self.strip_offset[k]):int(self.strip_offset[k + 1])].astype(np.float64)
+        return _crossings(e[:, 0], e[:, 1], e[:, 2], e[:, 3], lon, lat) % 2 == 1
+
+
+class TimezoneIndex:
+    """内存映射的时区索引，只读 (线程安全)"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"不是有效的时区索引文件: {path}")
+            (header_len,) = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(header_len).decode("utf-8"))
+        if header["cell_deg"] != CELL_DEG:
+            raise ValueError(f"索引的网格边长 {header['cell_deg']} 与配置 {CELL_DEG} 不一致，请重新生成")
+        data_start = len(MAGIC) + 4 + header_len
+
+        self.path = path
+        self.zones = header["zones"]
+        c = {}
+        for name, meta in header["columns"].items():
+            if meta["count"] == 0:
+                c[name] = np.zeros(0, dtype=meta["dtype"])
+                continue
+            c[name] = np.memmap(path, dtype=meta["dtype"], mode="r",
+                                offset=data_start + meta["offset"], shape=(meta["count"],))
+        self._poly_zone = c["poly_zone"]
+        self._cell_offset = c["cell_offset"]
+        self._cell_items = c["cell_items"]
+        self._strips = _StripIndex(c["row_offset"], c["strip_poly"], c["strip_offset"], c["edges"])
+
+    def zone_at(self, lat, lon):
+        """坐标所在的 IANA 时区名；不在任何多边形里 (海上) 返回 None"""
+        cell = _row(lat) * _COLS + _col(lon)
+        items = self._cell_items[int(self._cell_offset[cell]):int(self._cell_offset[cell + 1])]
+        for item in items.tolist():
+            if item < 0:
+                return self.zones[-item - 1]
+            if self._strips.contains(item, lat, lon):
+                return self.zones[int(self._poly_zone[item])]
+        return None
+
+
+_index = None
+_index_loaded = False
+
+
+def get_index():
+    """进程内只加载一次；没有索引文件时返回 None"""
+    global _index, _index_loaded
+    if not _index_loaded:
+        _index_loaded = True
+        if os.path.exists(INDEX_PATH):
+            try:
+                _index = TimezoneIndex(INDEX_PATH)
+            except (OSError, ValueError):
+                _index = None
+    return _index
+
+
+_fallback_warned = False
+
+
+def _fallback_zone(lat, lon):
+    """没有索引文件时的近似：最近地名库地点的时区 -> 最近离线城市的时区 -> 按经度"""
+    global _fallback_warned
+    if not _fallback_warned:
+        _fallback_warned = True
+        logger.warning("没有时区索引文件 %s，按最近的地点或经度近似时区 (生成方法见 timezone_index.py)",
+                       INDEX_PATH)
+    import city_index
+    import gazetteer
+
+    places = gazetteer.get_gazetteer()
+    if places is not None:
+        rows, km = places.nearest(lat, lon)
+        place = places.place(int(rows[0]))
+        if place.timezone and float(km[0]) <= NEAREST_PLACE_MAX_KM:
+            return place.timezone
+    matches, km = city_index.nearest(lat, lon, max_km=NEAREST_CITY_MAX_KM)
+    if matches[0] is not None:
+        zone, radius = CITY_TIMEZONES.get(matches[0].name, (DEFAULT_TIMEZONE, NEAREST_CITY_MAX_KM))
+        return zone if float(km[0]) <= radius else DEFAULT_TIMEZONE
+    return ocean_timezone(lon)
+
+
+@lru_cache(maxsize=4096)
+def _cached_zone(lat, lon):
+    index = get_index()
+    if index is None:
+        return _fallback_zone(lat, lon)
+    return index.zone_at(lat, lon) or ocean_timezone(lon)
+
+
+def timezone_at(lat, lon):
+    """
+    坐标 -> IANA 时区名 (结果按约 11 米精度缓存)
+    没有坐标时返回 DEFAULT_TIMEZONE；海上按经度返回 Etc/GMT±N；没有索引文件时见 _fallback_zone
+    """
+    if lat is None or lon is None:
+        return DEFAULT_TIMEZONE
+    return _cached_zone(round(lat, CACHE_DECIMALS), round(lon, CACHE_DECIMALS))
+
+
+def local_to_utc(local_dt, zone):
+    """
+    当地墙上时间 (naive) -> UTC (naive)，按该时区当时的历史规则
+    夏令时切换时重复的那一小时取第一次 (夏令时)，跳过的那一小时按切换前的偏移换算
+    """
+    aware = local_dt.replace(tzinfo=ZoneInfo(zone))
+    return aware.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def utc_offset_hours(local_dt, zone):
+    """当地墙上时间在该时区的 UTC 偏移 (小时)，例如北京 1988 年夏天为 9.0"""
+    return ZoneInfo(zone).utcoffset(local_dt).total_seconds() / 3600.0
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "build" and len(sys.argv) > 2:
+        out = sys.argv[3] if len(sys.argv) > 3 else INDEX_PATH
+        count = build_index(sys.argv[2], out, progress=lambda n: print(f"  已读取 {n} 个多边形"))
+        print(f"已生成: {out} ({count} 个多边形, {os.path.getsize(out) / 1e6:.1f} MB)")
+    elif command == "lookup" and len(sys.argv) > 3:
+        print(timezone_at(float(sys.argv[2]), float(sys.argv[3])))
+    else:
+        print("用法: python timezone_index.py [build <combined.json> [输出路径] | lookup <纬度> <经度>]")
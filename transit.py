@@ -0,0 +1,151 @@
+# transit.py
+# 流日时间线：在一段日期范围内，按时间顺序流式产出各星体进入新闸门 / 新爻的时刻。
+# 做法：每个星体按自己的粗步长采样 -> 发现跨界就二分到精确时刻 (默认 1 秒)。
+# 按 30 天一个窗口推进，窗口内排好序就吐出去，上百年的范围也不会全部堆在内存里。
+
+import math
+from collections import namedtuple
+from datetime import timedelta
+
+import ephem
+
+import calculation
+import ephemeris_table
+
+# 粗步长 (小时)：保证一步之内走不满一个爻 (0.9375 度)
+# 月亮每小时约 0.55 度；水星最快每天 2.2 度左右；外行星一天都走不了多少
+COARSE_STEP_HOURS = {
+    "Moon": 1, "Mercury": 6, "Venus": 6, "Sun": 12, "Earth": 12, "Mars": 12,
+    "Jupiter": 24, "Saturn": 24, "Uranus": 24, "Neptune": 24, "Pluto": 24,
+}
+
+# 每次推进的窗口长度 (天)，窗口内的事件排序后再产出
+WINDOW_DAYS = 30
+
+# 二分到多精确 (秒)
+DEFAULT_PRECISION_SECONDS = 1.0
+
+# 一个流日事件：星体进入 gate.line 的精确 UTC 时刻；retrograde 表示是逆行退进来的
+TransitEvent = namedtuple("TransitEvent", ["body", "gate", "line", "utc", "retrograde"])
+
+_LINE_SLOTS = len(calculation.GATE_BY_LINE_SLOT)
+
+
+def _slot(degree, level):
+    """经度 -> 爻位编号 (0..383)；按闸门粒度时换算成闸门位 (0..63)"""
+    slot = min(int((degree % 360.0) * _LINE_SLOTS / 360.0), _LINE_SLOTS - 1)
+    if level == "gate":
+        return slot // calculation.LINES_PER_GATE
+    return slot
+
+
+def _event(body, degree, day, retrograde):
+    """
+    跨界后的经度 -> 事件；闸门和爻都从这个经度算，不从闸门位推
+    (逆行退进一个闸门时是从 6 爻进来的，不是 1 爻)
+    """
+    slot = _slot(degree, "line")
+    gate = int(calculation.GATE_BY_LINE_SLOT[slot])
+    line = slot % calculation.LINES_PER_GATE + 1
+    return TransitEvent(body, gate, line, ephem.Date(day).datetime(), retrograde)
+
+
+def _longitudes(body, days):
+    """一组 ephem 日数 -> 经度列表；有星历表时整列查表，表外的点再逐个交给 PyEphem"""
+    table = ephemeris_table.get_table()
+    if table is not None:
+        degrees = table.longitudes(body, days).tolist()
+    else:
+        degrees = [math.nan] * len(days)
+    for i, deg in enumerate(degrees):
+        if math.isnan(deg):
+            degrees[i] = calculation.get_planet_position(body, ephem.Date(days[i]))
+    return degrees
+
+
+def _position(body, day):
+    return calculation.get_planet_position(body, ephem.Date(day))
+
+
+def _bisect_change(body, level, t_a, slot_a, t_b, precision_days):
+    """在 (t_a, t_b] 内二分出第一次离开 slot_a 的时刻，返回 (时刻, 新位置经度)"""
+    deg_b = None
+    while t_b - t_a > precision_days:
+        mid = (t_a + t_b) / 2.0
+        deg = _position(body, mid)
+        if deg is None:
+            break
+        if _slot(deg, level) == slot_a:
+            t_a = mid
+        else:
+            t_b, deg_b = mid, deg
+    if deg_b is None:
+        deg_b = _position(body, t_b)
+    return t_b, deg_b
+
+
+def _body_events(body, level, days, precision_days):
+    """单个星体在采样网格 days 上的全部跨界事件"""
+    degrees = _longitudes(body, days)
+    events = []
+    for i in range(len(days) - 1):
+        deg_a, deg_b = degrees[i], degrees[i + 1]
+        if deg_a is None or deg_b is None:
+            continue
+        slot_a, slot_end = _slot(deg_a, level), _slot(deg_b, level)
+        t_a, t_b = days[i], days[i + 1]
+        # 一步里可能跨不止一次 (逆行留转点附近来回)，逐个二分出来
+        while slot_a != slot_end and t_b - t_a > precision_days:
+            t_cross, deg_cross = _bisect_change(body, level, t_a, slot_a, t_b, precision_days)
+            if deg_cross is None:
+                break
+            retrograde = calculation._angle_diff(deg_cross, deg_a) < 0
+            slot_a = _slot(deg_cross, level)
+            events.append((t_cross, body, deg_cross, retrograde))
+            t_a, deg_a = t_cross, deg_cross
+    return events
+
+
+def iter_ingresses(start_utc, end_utc, bodies=None, level="line",
+                   precision_seconds=DEFAULT_PRECISION_SECONDS):
+    """
+    流式产出 [start_utc, end_utc) 之间的 TransitEvent，按时间先后排序
+    bodies: 星体名列表 (默认全部 PLANETS)；level: "line" 每次换爻都报，"gate" 只报换闸门
+    逆行退回上一个闸门/爻也会产出事件 (retrograde=True)
+    """
+    bodies = list(bodies or calculation.PLANETS)
+    if level not in ("line", "gate"):
+        raise ValueError(f"level 只能是 'line' 或 'gate'，收到: {level}")
+
+    start_day = float(ephem.Date(start_utc))
+    end_day = float(ephem.Date(end_utc))
+    precision_days = precision_seconds / 86400.0
+
+    window_start = start_day
+    while window_start < end_day:
+        window_end = min(window_start + WINDOW_DAYS, end_day)
+        events = []
+        for body in bodies:
+            step = COARSE_STEP_HOURS.get(body, 6) / 24.0
+            count = max(int(math.ceil((window_end - window_start) / step)), 1)
+            days = [window_start + k * step for k in range(count)] + [window_end]
+            events.extend(_body_events(body, level, days, precision_days))
+
+        events.sort()
+        for t_cross, body, degree, retrograde in events:
+            if t_cross < end_day:
+                yield _event(body, degree, t_cross, retrograde)
+        window_start = window_end
+
+
+def find_ingress(body, gate, start_utc, max_days=366 * 250, line=None):
+    """
+    从 start_utc 起，body 下一次进入 gate (可选: 指定 line) 的事件；范围内找不到返回 None
+    例: find_ingress("Mars", 34, datetime.utcnow())
+    """
+    level = "gate" if line is None else "line"
+    end_utc = start_utc + timedelta(days=max_days)
+    for event in iter_ingresses(start_utc, end_utc, bodies=[body], level=level):
+        if event.gate == gate and (line is None or event.line == line):
+            return event
+    return None